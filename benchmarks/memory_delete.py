@@ -0,0 +1,75 @@
+"""
+Benchmark for bulk deletes in the memory repository.
+
+Populates a memory repository with a number of entities, removes all of
+them in a single session and reports the time spent in the commit.
+
+Usage::
+
+    python benchmarks/memory_delete.py [--size N]
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from argparse import ArgumentParser
+from everest.configuration import Configurator
+from everest.repositories.interfaces import IRepositoryManager
+from everest.tests.complete_app.entities import MyEntity
+from pyramid.registry import Registry
+import time
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['main',
+           ]
+
+
+def make_repository():
+    conf = Configurator(registry=Registry('benchmark'),
+                        package='everest.tests.complete_app')
+    conf.setup_registry()
+    conf.begin()
+    conf.load_zcml('configure_no_rdb.zcml')
+    repo_mgr = conf.get_registered_utility(IRepositoryManager)
+    repo_mgr.initialize_all()
+    repo = repo_mgr.get_default()
+    repo.join_transaction = False
+    return conf, repo
+
+
+def populate(repo, size):
+    session = repo.session_factory()
+    for idx in range(size):
+        session.add(MyEntity, MyEntity(id=idx, text=str(idx)))
+    session.commit()
+
+
+def run(repo):
+    session = repo.session_factory()
+    for ent in session.query(MyEntity).all():
+        session.remove(MyEntity, ent)
+    start = time.time()
+    session.commit()
+    return time.time() - start
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=50000,
+                        help='Number of entities to delete.')
+    args = parser.parse_args()
+    conf, repo = make_repository()
+    try:
+        populate(repo, args.size)
+        duration = run(repo)
+        assert repo.count(MyEntity) == 0
+    finally:
+        conf.get_registered_utility(IRepositoryManager).reset_all()
+        conf.end()
+    print('deleted %d entities in %.2f s (%.1f deletes/s)'
+          % (args.size, duration, args.size / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Multi-threaded benchmark for the memory repository locking.
+
+Runs a number of writer threads (each committing changes to entities of its
+own entity class) and reader threads (running filtered queries) against a
+memory repository for a fixed amount of time and reports the throughput.
+The benchmark is run once with the per-repository lock striped per entity
+class and once with a single global lock that serializes all flushes,
+commits and rollbacks (the former locking scheme). Reads are not locked.
+
+Usage::
+
+    python benchmarks/memory_locking.py [--writers N] [--readers N]
+                                        [--duration SECONDS]
+                                        [--io-delay SECONDS]
+
+The `--io-delay` option simulates a backend that performs I/O while holding
+the write lock (e.g., a file system repository writing its files) by
+sleeping while each changed entity is persisted.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from argparse import ArgumentParser
+from everest.configuration import Configurator
+from everest.querying.specifications import eq
+from everest.repositories.interfaces import IRepositoryManager
+from everest.repositories.memory.querying import EvalFilterExpression
+from everest.repositories.memory.repository import MemoryRepository
+from everest.tests.complete_app.entities import MyEntity
+from everest.tests.complete_app.entities import MyEntityChild
+from everest.tests.complete_app.entities import MyEntityGrandchild
+from everest.tests.complete_app.entities import MyEntityParent
+from pyramid.registry import Registry
+from threading import RLock
+from threading import Thread
+import time
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['main',
+           ]
+
+
+ENTITY_CLASSES = [MyEntity, MyEntityParent, MyEntityChild,
+                  MyEntityGrandchild]
+
+
+class GlobalLock(object):
+    """
+    Emulates the former locking scheme: A single re-entrant lock shared by
+    all repositories serializes all writes.
+    """
+    __lock = RLock()
+
+    def locking(self, keys): # pylint: disable=W0613
+        return self.__lock
+
+
+def make_repository():
+    conf = Configurator(registry=Registry('benchmark'),
+                        package='everest.tests.complete_app')
+    conf.setup_registry()
+    conf.begin()
+    conf.load_zcml('configure_no_rdb.zcml')
+    repo_mgr = conf.get_registered_utility(IRepositoryManager)
+    repo_mgr.initialize_all()
+    repo = repo_mgr.get_default()
+    repo.join_transaction = False
+    return conf, repo
+
+
+def populate(repo, size):
+    session = repo.session_factory()
+    for ent_cls in ENTITY_CLASSES:
+        for idx in range(size):
+            session.add(ent_cls, ent_cls(id=idx, text=str(idx % 10)))
+    session.commit()
+
+
+def run(conf, repo, num_writers, num_readers, duration):
+    counts = [0] * (num_writers + num_readers)
+    stop_time = time.time() + duration
+
+    def write(pos):
+        conf.begin()
+        ent_cls = ENTITY_CLASSES[pos % len(ENTITY_CLASSES)]
+        session = repo.session_factory()
+        while time.time() < stop_time:
+            ent = session.query(ent_cls).filter_by(id=pos).one()
+            ent.text = str(counts[pos])
+            session.commit()
+            counts[pos] += 1
+        conf.end()
+
+    def read(pos):
+        conf.begin()
+        ent_cls = ENTITY_CLASSES[pos % len(ENTITY_CLASSES)]
+        expr = EvalFilterExpression(eq(text='1'))
+        while time.time() < stop_time:
+            list(repo.retrieve(ent_cls, filter_expression=expr,
+                               memoize=False))
+            counts[pos] += 1
+        conf.end()
+
+    threads = [Thread(target=write, args=(pos,))
+               for pos in range(num_writers)] \
+              + [Thread(target=read, args=(pos,))
+                 for pos in range(num_writers, num_writers + num_readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts[:num_writers]) / duration, \
+           sum(counts[num_writers:]) / duration
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1000,
+                        help='Number of entities per entity class.')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--io-delay', type=float, default=0.0)
+    args = parser.parse_args()
+    if args.io_delay > 0:
+        persist = getattr(MemoryRepository, '_MemoryRepository__persist')
+        def delayed_persist(self, *args_):
+            time.sleep(args.io_delay)
+            persist(self, *args_)
+        setattr(MemoryRepository, '_MemoryRepository__persist',
+                delayed_persist)
+    for label, lock in (('global lock', GlobalLock()),
+                        ('striped lock', None)):
+        conf, repo = make_repository()
+        try:
+            if not lock is None:
+                setattr(repo, '_MemoryRepository__lock', lock)
+            populate(repo, args.size)
+            commit_rate, query_rate = run(conf, repo, args.writers,
+                                          args.readers, args.duration)
+        finally:
+            conf.get_registered_utility(IRepositoryManager).reset_all()
+            conf.end()
+        print('%-28s %10.1f commits/s %10.1f queries/s'
+              % (label, commit_rate, query_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Memory benchmark for serializing and loading a large collection.
+
+Populates a memory repository with a number of entities and reports the
+growth of the peak resident set size of the process while the collection
+is serialized to a JSON representation ("serialize" phase) or while a
+collection is loaded from such a representation and its members are
+registered with a session ("load" phase). Each phase is run in a separate
+process since the peak resident set size can not be reset.
+
+Usage::
+
+    python benchmarks/representer_memory.py [--size N]
+                                            [--phase {serialize,load}]
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from argparse import ArgumentParser
+from everest.configuration import Configurator
+from everest.mime import JsonMime
+from everest.repositories.interfaces import IRepositoryManager
+from everest.representers.utils import as_representer
+from everest.resources.utils import get_root_collection
+from everest.tests.complete_app.entities import MyEntityParent
+from everest.tests.complete_app.interfaces import IMyEntityParent
+from pyramid.registry import Registry
+import resource
+import subprocess
+import sys
+import time
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['main',
+           ]
+
+
+PHASES = ('serialize', 'load')
+
+
+def make_repository():
+    conf = Configurator(registry=Registry('benchmark'),
+                        package='everest.tests.complete_app')
+    conf.setup_registry()
+    conf.begin()
+    conf.load_zcml('configure_no_rdb.zcml')
+    repo_mgr = conf.get_registered_utility(IRepositoryManager)
+    repo_mgr.initialize_all()
+    repo = repo_mgr.get_default()
+    repo.join_transaction = False
+    return conf, repo
+
+
+def populate(repo, size):
+    session = repo.session_factory()
+    for idx in range(size):
+        session.add(MyEntityParent, MyEntityParent(id=idx, text=str(idx)))
+    session.commit()
+
+
+def get_peak_rss():
+    # Peak resident set size in kB (Linux reports kB, OS X bytes).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def run(repo, size, phase):
+    coll = get_root_collection(IMyEntityParent)
+    rpr = as_representer(coll, JsonMime)
+    if phase == 'load':
+        text = rpr.to_string(coll)
+        # Start from an empty repository so that the loaded members can
+        # be added without ID conflicts.
+        session = repo.session_factory()
+        for ent in session.query(MyEntityParent).all():
+            session.remove(MyEntityParent, ent)
+        session.commit()
+        coll = get_root_collection(IMyEntityParent)
+    start_rss = get_peak_rss()
+    start = time.time()
+    if phase == 'serialize':
+        result = rpr.to_string(coll)
+        assert len(result) > 0
+    else:
+        loaded_coll = rpr.from_string(text)
+        for mb in loaded_coll:
+            coll.add(mb)
+        assert len(coll) == size
+    return time.time() - start, get_peak_rss() - start_rss
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=100000,
+                        help='Number of collection members.')
+    parser.add_argument('--phase', choices=PHASES,
+                        help='Phase to run (runs all phases in separate '
+                             'processes if not given).')
+    args = parser.parse_args()
+    if args.phase is None:
+        for phase in PHASES:
+            subprocess.check_call([sys.executable, __file__,
+                                   '--size', str(args.size),
+                                   '--phase', phase])
+        return
+    conf, repo = make_repository()
+    try:
+        populate(repo, args.size)
+        duration, rss_growth = run(repo, args.size, args.phase)
+    finally:
+        conf.get_registered_utility(IRepositoryManager).reset_all()
+        conf.end()
+    print('%-9s %d members in %.2f s, peak RSS growth %.1f MB'
+          % (args.phase, args.size, duration, rss_growth / 1024.))
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,9 @@ class Entity(object):
     """
     #: The (unique) entity ID (integer or string).
     id = None
+    #: Flag indicating that instances report attribute changes to their
+    #: state (see :class:`everest.repositories.state.EntityState`).
+    __everest_tracking__ = True
 
     def __init__(self, id=None): # redefining id pylint: disable=W0622
         if self.__class__ is Entity:
@@ -58,6 +61,12 @@ class Entity(object):
         """
         return cls(**data)
 
+    def __setattr__(self, name, value):
+        state = self.__dict__.get('__everest__')
+        if not state is None:
+            state.attribute_changing(self, name)
+        object.__setattr__(self, name, value)
+
     def __eq__(self, other):
         return id(self) == id(other) \
                or isinstance(other, self.__class__) \
@@ -99,6 +108,10 @@ class Aggregate(object):
         self._slice_key = None
         #: Query loaded by a call to :method:`load`.
         self.__loaded_query = None
+        #: Entities loaded by a call to :method:`load` with look-ahead.
+        self.__loaded_entities = None
+        #: Flag indicating if more entities follow the loaded slice.
+        self.__has_more = None
 
     def clone(self):
         """
@@ -110,6 +123,8 @@ class Aggregate(object):
         clone._order_spec = self._order_spec
         clone._slice_key = self._slice_key
         clone.__loaded_query = None
+        clone.__loaded_entities = None
+        clone.__has_more = None
         # pylint: enable=W0212
         return clone
 
@@ -122,7 +137,9 @@ class Aggregate(object):
 
         :returns: An iterator for the aggregate entities.
         """
-        if self.__loaded_query is None:
+        if not self.__loaded_entities is None:
+            q = self.__loaded_entities
+        elif self.__loaded_query is None:
             q = self._get_ordered_query(None)
         else:
             q = self.__loaded_query
@@ -145,13 +162,34 @@ class Aggregate(object):
             q = self.__loaded_query
         return q.count()
 
-    def load(self):
+    def load(self, look_ahead=False):
         """
         Loads the aggregate with the current filter, order, and slice
         settings. Future changes to these settings will not change what the
         :method:`iterator` and :method:`count` methods return.
+
+        :param bool look_ahead: If this is set and a slice with an upper
+          bound is set, the entities in the slice are fetched right away
+          along with one more entity so that :attr:`has_more` can tell if
+          more entities follow the slice without counting all entities.
         """
-        self.__loaded_query = self._get_ordered_query(None)
+        slice_key = self._slice_key
+        if look_ahead and not slice_key is None \
+           and not slice_key.stop is None:
+            start = slice_key.start or 0
+            self._slice_key = slice(start, slice_key.stop + 1)
+            try:
+                ents = list(self._get_ordered_query(None))
+            finally:
+                self._slice_key = slice_key
+            size = max(slice_key.stop - start, 0)
+            self.__has_more = len(ents) > size
+            self.__loaded_entities = ents[:size]
+            self.__loaded_query = None
+        else:
+            self.__loaded_query = self._get_ordered_query(None)
+            self.__loaded_entities = None
+            self.__has_more = None
 
     def unload(self):
         """
@@ -159,6 +197,17 @@ class Aggregate(object):
         the aggregate is not loaded, this method has no effect.
         """
         self.__loaded_query = None
+        self.__loaded_entities = None
+        self.__has_more = None
+
+    @property
+    def has_more(self):
+        """
+        Flag indicating if more entities follow the current slice. This is
+        only known after loading with look-ahead (cf. :method:`load`);
+        otherwise, it is `None`.
+        """
+        return self.__has_more
 
     def get_by_id(self, id_key):
         """
@@ -230,6 +279,48 @@ class Aggregate(object):
         """
         raise NotImplementedError('Abstract method.')
 
+    def add_many(self, data_items):
+        """
+        Adds the given sequence of entity data to the aggregate.
+
+        This default implementation calls :meth:`add` for each item;
+        derived classes may process all items in one batch.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        :raise ValueError: If an entity with the same ID exists.
+        """
+        for data in data_items:
+            self.add(data)
+
+    def remove_many(self, data_items):
+        """
+        Removes the given sequence of entity data from the aggregate.
+
+        This default implementation calls :meth:`remove` for each item;
+        derived classes may process all items in one batch.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        :raise ValueError: If any of the given entities was not found.
+        """
+        for data in data_items:
+            self.remove(data)
+
+    def update_many(self, data_items):
+        """
+        Updates existing entities with the given sequence of entity data.
+        The target entities are looked up by the IDs of the given data.
+
+        This default implementation calls :meth:`update` for each item;
+        derived classes may process all items in one batch.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        :returns: List of the updated entities.
+        """
+        return [self.update(data) for data in data_items]
+
     def query(self, **options):
         """
         Returns a query for this aggregate.
@@ -250,6 +341,17 @@ class Aggregate(object):
         """
         raise NotImplementedError('Abstract property.')
 
+    def can_seek(self, attribute_names):
+        """
+        Checks if keyset pagination (cf. :mod:`everest.querying.keyset`)
+        over the given entity attributes reaches all entities of this
+        aggregate. The default implementation returns `True`.
+
+        :param attribute_names: Sequence of (possibly nested) entity
+          attribute names.
+        """
+        return True
+
     def get_root_aggregate(self, rc):
         """
         Returns a root aggregate for the given registered resource.
@@ -446,6 +548,15 @@ class RootAggregate(Aggregate):
     def update(self, data, target=None):
         return self._session.update(self.entity_class, data, target=target)
 
+    def add_many(self, data_items):
+        self._session.add_many(self.entity_class, data_items)
+
+    def remove_many(self, data_items):
+        self._session.remove_many(self.entity_class, data_items)
+
+    def update_many(self, data_items):
+        return self._session.update_many(self.entity_class, data_items)
+
     def query(self, **options):
         return self._session.query(self.entity_class, **options)
 
@@ -459,6 +570,11 @@ class RootAggregate(Aggregate):
     def get_root_aggregate(self, rc):
         return self.__repository.get_aggregate(rc)
 
+    @property
+    def _repository(self):
+        #: The repository that created this aggregate.
+        return self.__repository
+
     def make_relationship_aggregate(self, relationship):
         """
         Returns a new relationship aggregate for the given relationship.
@@ -528,6 +644,9 @@ class RelationshipAggregate(Aggregate):
     def expression_kind(self):
         return self._root_aggregate.expression_kind
 
+    def can_seek(self, attribute_names):
+        return self._root_aggregate.can_seek(attribute_names)
+
     def get_root_aggregate(self, rc):
         return self._root_aggregate.get_root_aggregate(rc)
 
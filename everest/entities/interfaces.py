@@ -72,6 +72,18 @@ class IAggregate(Interface):
         """
         """
 
+    def add_many(data_items):
+        """
+        """
+
+    def remove_many(data_items):
+        """
+        """
+
+    def update_many(data_items):
+        """
+        """
+
     def query(**options):
         """
         """
@@ -108,11 +108,15 @@ class AruVisitor(ResourceDataTreeVisitor):
         self.__pass_path_to_callbacks = pass_path_to_callbacks
         self.__commands = None
         self.root = None
+        self.roots = None
 
     def prepare(self):
         #: The root of the new source tree (ADD) or of the updated target
         #: tree (UPDATE) or the removed entity (REMOVE).
         self.root = None
+        #: The list of all roots visited (when traversing a sequence of
+        #: root nodes; in traversal order).
+        self.roots = []
         #
         self.__commands = []
 
@@ -171,6 +175,7 @@ class AruVisitor(ResourceDataTreeVisitor):
                     rel.add(entity)
         if is_root:
             self.root = entity
+            self.roots.append(entity)
         elif isinstance(rel, LazyDomainRelationship):
             self.__commands.append(rel)
 
@@ -180,6 +185,8 @@ class AruVisitor(ResourceDataTreeVisitor):
 
 
 class DomainDataTraversalProxy(DataTraversalProxy):
+    __slots__ = ()
+
     def get_id(self):
         return self._data.id
 
@@ -189,7 +196,9 @@ class DomainDataTraversalProxy(DataTraversalProxy):
                                                 self.relationship_direction)
 
     def _get_entity_type(self):
-        return type(self._data)
+        # We use __class__ rather than type() here since the latter does not
+        # resolve lazy clones created by the memory session.
+        return self._data.__class__
 
     def get_entity(self):
         return self._data
@@ -212,6 +221,8 @@ class DomainDataTraversalProxyAdapter(DataTraversalProxyAdapter):
 
 
 class LinkedDomainDataTraversalProxy(DomainDataTraversalProxy):
+    __slots__ = ()
+
     def do_traverse(self):
         return False
 
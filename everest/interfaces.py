@@ -18,6 +18,7 @@ __all__ = ['IAtomEntryMime',
            'IAtomMime',
            'IAtomRequest',
            'IAtomServiceMime',
+           'IBinaryMime',
            'ICsvMime',
            'IDataTraversalProxyAdapter',
            'IDataTraversalProxyAdapter',
@@ -99,6 +100,10 @@ class IZipMime(IMime):
     """Marker interface for Zip compressed mime type."""
 
 
+class IBinaryMime(IMime):
+    """Marker interface for the everest binary storage mime type."""
+
+
 class IHtmlMime(IMime):
     """Marker interface for HTML mime type."""
 
@@ -11,6 +11,7 @@ from everest.interfaces import IAtomFeedMime
 from everest.interfaces import IAtomMime
 from everest.interfaces import IAtomRequest
 from everest.interfaces import IAtomServiceMime
+from everest.interfaces import IBinaryMime
 from everest.interfaces import ICsvMime
 from everest.interfaces import ICsvRequest
 from everest.interfaces import IHtmlMime
@@ -37,6 +38,8 @@ __all__ = ['ATOM_FEED_MIME',
            'AtomFeedMime',
            'AtomMime',
            'AtomServiceMime',
+           'BINARY_MIME',
+           'BinaryMime',
            'CSV_MIME',
            'CsvMime',
            'HTML_MIME',
@@ -221,6 +224,14 @@ class ZipMime(object):
 ZIP_MIME = ZipMime.mime_type_string
 
 
+@provider(IBinaryMime)
+class BinaryMime(object):
+    mime_type_string = 'application/vnd.everest.binary'
+    file_extension = '.bin'
+
+BINARY_MIME = BinaryMime.mime_type_string
+
+
 MIME_REQUEST = {JSON_MIME : IJsonRequest,
                 ATOM_MIME : IAtomRequest,
                 ATOM_FEED_MIME : IAtomRequest,
@@ -234,7 +234,6 @@ class RepositoryQuery(Query): # still abstract pylint:disable=W0223
             yield self._session.load(self._entity_class, repo_ent)
 
     def count(self):
-        return sum(1 for _ in self._repository.retrieve(
-                                        self._entity_class,
-                                        filter_expression=self._filter_expr))
+        return self._repository.count(self._entity_class,
+                                      filter_expression=self._filter_expr)
 
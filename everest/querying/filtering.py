@@ -9,9 +9,12 @@ Created on Jul 5, 2011.
 from everest.entities.utils import slug_from_identifier
 from everest.querying.base import CqlExpression
 from everest.querying.base import SpecificationVisitor
+from everest.entities.interfaces import IEntity
 from everest.querying.interfaces import IFilterSpecificationVisitor
+from everest.querying.operators import CONJUNCTION
 from everest.querying.operators import CONTAINED
 from everest.querying.operators import CONTAINS
+from everest.querying.operators import DISJUNCTION
 from everest.querying.operators import ENDS_WITH
 from everest.querying.operators import EQUAL_TO
 from everest.querying.operators import GREATER_OR_EQUALS
@@ -19,7 +22,10 @@ from everest.querying.operators import GREATER_THAN
 from everest.querying.operators import IN_RANGE
 from everest.querying.operators import LESS_OR_EQUALS
 from everest.querying.operators import LESS_THAN
+from everest.querying.operators import NEGATION
 from everest.querying.operators import STARTS_WITH
+from everest.resources.interfaces import ICollectionResource
+from everest.resources.interfaces import IMemberResource
 from everest.resources.interfaces import IResource
 from everest.resources.utils import resource_to_url
 from functools import reduce as func_reduce
@@ -31,6 +37,7 @@ from zope.interface import implementer # pylint: disable=E0611,F0401
 __docformat__ = 'reStructuredText en'
 __all__ = ['CqlFilterExpression',
            'CqlFilterSpecificationVisitor',
+           'FilterSpecificationKeyVisitor',
            'FilterSpecificationVisitor',
            'RepositoryFilterSpecificationVisitor',
            ]
@@ -212,6 +219,110 @@ class CqlFilterSpecificationVisitor(FilterSpecificationVisitor):
         return result
 
 
+class FilterSpecificationKeyVisitor(FilterSpecificationVisitor):
+    """
+    Specification visitor building a normalized, hashable key for a filter
+    specification tree.
+
+    Two specifications with the same key select the same entities; this
+    allows backends to use the key for caching query results and counts.
+    The operands of (nested) conjunctions and disjunctions are collected in
+    frozen sets so the key does not depend on their order. Entity and
+    member resource values are represented by their entity class and ID.
+
+    No key is built for specifications with criteria on nested attributes
+    (e.g., "parent.text"): The entities they select also depend on the
+    related entities, so cached results could not be invalidated by the
+    entity class of the query alone.
+    """
+    @classmethod
+    def make_key(cls, spec):
+        """
+        Returns the key for the given filter specification or `None` if
+        the specification holds values which can not be represented in a
+        key (e.g., unhashable objects or entities without an ID) or
+        criteria on nested attributes.
+        """
+        vst = cls()
+        try:
+            spec.accept(vst)
+            key = vst.expression
+            hash(key)
+        except TypeError:
+            key = None
+        return key
+
+    def _conjunction_op(self, spec, *expressions):
+        return self.__make_composite_key(CONJUNCTION.name, expressions)
+
+    def _disjunction_op(self, spec, *expressions):
+        return self.__make_composite_key(DISJUNCTION.name, expressions)
+
+    def _negation_op(self, spec, expression):
+        return (NEGATION.name, expression)
+
+    def _starts_with_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _ends_with_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _contains_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _contained_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _equal_to_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _less_than_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _less_than_or_equal_to_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _greater_than_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _greater_than_or_equal_to_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def _in_range_op(self, spec):
+        return self.__make_criterion_key(spec)
+
+    def __make_composite_key(self, op_name, expressions):
+        operands = set()
+        for expr in expressions:
+            if expr[0] == op_name:
+                operands.update(expr[1])
+            else:
+                operands.add(expr)
+        return (op_name, frozenset(operands))
+
+    def __make_criterion_key(self, spec):
+        if '.' in spec.attr_name:
+            raise TypeError('Nested attributes are not supported.')
+        return (spec.operator.name, spec.attr_name,
+                self.__make_value_key(spec.attr_value))
+
+    def __make_value_key(self, value):
+        if IMemberResource.providedBy(value): # pylint: disable=E1101
+            value = value.get_entity()
+        elif ICollectionResource.providedBy(value): # pylint: disable=E1101
+            raise TypeError('Collection resources are not supported.')
+        if IEntity.providedBy(value): # pylint: disable=E1101
+            if value.id is None:
+                raise TypeError('Entities without ID are not supported.')
+            key = (type(value), value.id)
+        elif isinstance(value, (list, tuple)):
+            key = (type(value),
+                   tuple([self.__make_value_key(item) for item in value]))
+        else:
+            key = value
+        return key
+
+
 class RepositoryFilterSpecificationVisitor(FilterSpecificationVisitor): # pylint: disable=W0223
     """
     Specification visitors that build filter expressions for a repository
@@ -0,0 +1,136 @@
+"""
+Keyset (seek) pagination support.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from everest.querying.ordering import OrderSpecificationVisitor
+from everest.querying.specifications import NaturalOrderSpecification
+from everest.querying.utils import get_filter_specification_factory
+from everest.querying.utils import get_order_specification_factory
+from functools import reduce as func_reduce
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['KeysetOrderSpecificationVisitor',
+           'get_keyset_order_keys',
+           'make_keyset_order_specification',
+           'make_keyset_filter_specification',
+           ]
+
+
+class KeysetOrderSpecificationVisitor(OrderSpecificationVisitor):
+    """
+    Order specification visitor building the list of (attribute name,
+    descending flag) tuples for the order criteria of an order specification
+    in order of precedence.
+    """
+    def _conjunction_op(self, spec, *expressions):
+        return func_reduce(lambda left, right: left + right, expressions)
+
+    def _asc_op(self, spec):
+        if isinstance(spec, NaturalOrderSpecification):
+            # Natural order can not be expressed with value comparisons.
+            raise ValueError('Keyset pagination is not supported for '
+                             'natural order criteria.')
+        return [(spec.attr_name, False)]
+
+    def _desc_op(self, spec):
+        return [(spec.attr_name, True)]
+
+
+def make_keyset_order_specification(order_spec):
+    """
+    Returns the order specification to use for keyset pagination over a
+    collection ordered by the given order specification.
+
+    An ascending ID criterion is appended if the ID is not one of the order
+    criteria already so that the order is unique.
+
+    :raises ValueError: if the order specification contains a natural order
+      criterion.
+    """
+    if not 'id' in [attr_name for (attr_name, _) in _get_keys(order_spec)]:
+        order_fac = get_order_specification_factory()
+        order_spec = order_fac.create_conjunction(
+                                        order_spec,
+                                        order_fac.create_ascending('id'))
+    return order_spec
+
+
+def get_keyset_order_keys(order_spec):
+    """
+    Returns the keys for keyset pagination over a collection ordered by the
+    given order specification (cf. :func:`make_keyset_order_specification`).
+
+    :returns: list of (attribute name, descending flag) tuples.
+    :raises ValueError: if the order specification contains a natural order
+      criterion.
+    """
+    return _get_keys(make_keyset_order_specification(order_spec))
+
+
+def make_keyset_filter_specification(keys, values):
+    """
+    Returns a filter specification selecting all members which come after
+    the member with the given key values in the order given by the given
+    keys (cf. :func:`get_keyset_order_keys`).
+
+    For the keys k1, ..., kn with the values v1, ..., vn, the resulting
+    criterion is the lexicographic comparison
+
+      (k1 > v1) or (k1 = v1 and k2 > v2) or ... or
+      (k1 = v1 and ... and kn-1 = vn-1 and kn > vn)
+
+    (with "<" instead of ">" for descending keys), which is prefixed with
+    the (redundant) range criterion k1 >= v1 if there is more than one key
+    so that backends can use a range index on the first key for seeking.
+
+    Members with `None` values for any of the keys are not matched by the
+    comparisons in SQL backends, so the keys should be checked with
+    :meth:`everest.entities.base.Aggregate.can_seek` first.
+
+    :raises ValueError: if the number of values does not match the number
+      of keys or if any of the values is `None`.
+    """
+    if len(values) != len(keys):
+        raise ValueError('Invalid cursor: Expected %d values, got %d.'
+                         % (len(keys), len(values)))
+    if None in values:
+        raise ValueError('Invalid cursor: Values must not be None.')
+    spec_fac = get_filter_specification_factory()
+    disjunction = None
+    equal_to_specs = []
+    for (attr_name, descending), value in zip(keys, values):
+        if descending:
+            seek_spec = spec_fac.create_less_than(attr_name, value)
+        else:
+            seek_spec = spec_fac.create_greater_than(attr_name, value)
+        if len(equal_to_specs) > 0:
+            seek_spec = func_reduce(spec_fac.create_conjunction,
+                                    equal_to_specs + [seek_spec])
+        if disjunction is None:
+            disjunction = seek_spec
+        else:
+            disjunction = spec_fac.create_disjunction(disjunction,
+                                                      seek_spec)
+        equal_to_specs.append(spec_fac.create_equal_to(attr_name, value))
+    if len(keys) > 1:
+        attr_name, descending = keys[0]
+        if descending:
+            range_spec = spec_fac.create_less_than_or_equal_to(attr_name,
+                                                               values[0])
+        else:
+            range_spec = spec_fac.create_greater_than_or_equal_to(attr_name,
+                                                                  values[0])
+        spec = spec_fac.create_conjunction(range_spec, disjunction)
+    else:
+        spec = disjunction
+    return spec
+
+
+def _get_keys(order_spec):
+    vst = KeysetOrderSpecificationVisitor()
+    order_spec.accept(vst)
+    return vst.expression
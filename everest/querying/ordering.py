@@ -12,6 +12,7 @@ from everest.querying.base import SpecificationVisitor
 from everest.querying.interfaces import IOrderSpecificationVisitor
 from everest.querying.operators import CQL_ORDER_OPERATORS
 from functools import reduce as func_reduce
+from operator import add as add_operator
 from operator import and_ as and_operator
 from zope.interface import implementer # pylint: disable=E0611,F0401
 
@@ -19,6 +20,7 @@ __docformat__ = 'reStructuredText en'
 __all__ = ['BubbleSorter',
            'CqlOrderExpression',
            'CqlOrderSpecificationVisitor',
+           'OrderSpecificationKeyVisitor',
            'OrderSpecificationVisitor',
            'RepositoryOrderSpecificationVisitor',
            'Sorter',
@@ -129,6 +131,41 @@ class CqlOrderSpecificationVisitor(OrderSpecificationVisitor):
         return slug_from_identifier(attr_name)
 
 
+class OrderSpecificationKeyVisitor(OrderSpecificationVisitor):
+    """
+    Specification visitor building a normalized, hashable key for an order
+    specification tree.
+
+    The key is a flat tuple holding the specification class and attribute
+    name of each order criterion in order of precedence. As with
+    :class:`everest.querying.filtering.FilterSpecificationKeyVisitor`, no
+    key is built for specifications ordering by nested attributes.
+    """
+    @classmethod
+    def make_key(cls, spec):
+        """
+        Returns the key for the given order specification or `None` if the
+        specification orders by a nested attribute.
+        """
+        vst = cls()
+        spec.accept(vst)
+        key = vst.expression
+        if any('.' in attr_name for (_, attr_name) in key):
+            key = None
+        return key
+
+    def _conjunction_op(self, spec, *expressions):
+        return func_reduce(add_operator, expressions)
+
+    def _asc_op(self, spec):
+        # Natural order specifications also use the ASCENDING operator, so
+        # we need the specification class to tell them apart.
+        return ((type(spec), spec.attr_name),)
+
+    def _desc_op(self, spec):
+        return ((type(spec), spec.attr_name),)
+
+
 class RepositoryOrderSpecificationVisitor(OrderSpecificationVisitor): # pylint: disable=W0223
     """
     Specification visitors that build order expressions for a repository
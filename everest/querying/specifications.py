@@ -456,6 +456,22 @@ class OrderSpecification(Specification):
     def cmp(self, x, y):
         raise NotImplementedError('Abstract method')
 
+    def get_key(self, candidate):
+        """
+        Returns the sort key tuple for the given candidate. Comparing the
+        keys of two candidates element-wise (with the direction given by
+        :attr:`key_descending`) is equivalent to calling :meth:`cmp`.
+        """
+        raise NotImplementedError('Abstract method')
+
+    @property
+    def key_descending(self):
+        """
+        Tuple of flags indicating for each element of the key returned by
+        :meth:`get_key` whether it sorts in descending order.
+        """
+        raise NotImplementedError('Abstract property')
+
     def ne(self, x, y):
         return not self.eq(x, y)
 
@@ -506,6 +522,13 @@ class ObjectOrderSpecification(OrderSpecification): # pylint: disable=W0223
     def cmp(self, x, y):
         return self.operator.apply(self._get_value(x), self._get_value(y))
 
+    def get_key(self, candidate):
+        return (self._get_value(candidate),)
+
+    @property
+    def key_descending(self):
+        return (self.operator is DESCENDING,)
+
     def accept(self, visitor):
         visitor.visit_nullary(self)
 
@@ -532,11 +555,12 @@ class NaturalOrderSpecification(ObjectOrderSpecification):
     See http://www.codinghorror.com/blog/2007/12/sorting-for-humans-natural-sort-order.html
     """
     operator = ASCENDING
+    __split_regex = re.compile(r'([0-9]+)')
 
     def _get_value(self, obj):
         value = ObjectOrderSpecification._get_value(self, obj)
         if isinstance(value, string_types):
-            res = [self.__convert(c) for c in re.split(r'([0-9]+)', value)]
+            res = [self.__convert(c) for c in self.__split_regex.split(value)]
         else:
             res = value
         return res
@@ -586,6 +610,14 @@ class ConjunctionOrderSpecification(OrderSpecification):
             res = left_cmp
         return res
 
+    def get_key(self, candidate):
+        return self.__left.get_key(candidate) \
+               + self.__right.get_key(candidate)
+
+    @property
+    def key_descending(self):
+        return self.__left.key_descending + self.__right.key_descending
+
     @property
     def left(self):
         return self.__left
@@ -40,6 +40,21 @@ class SessionFactory(object):
         """
         raise NotImplementedError('Abstract method.')
 
+    def set_read_only(self, value):
+        """
+        Switches the sessions returned by this factory for the current
+        thread to read-only mode (or back to normal mode).
+
+        Read-only sessions can load entities without tracking their state
+        but raise an exception on any attempt to change the repository
+        data. The default implementation does nothing; factories for
+        backends supporting read-only sessions override this.
+
+        :param bool value: Flag indicating if read-only mode should be
+          enabled.
+        """
+        pass
+
 
 class Session(object):
     """
@@ -123,6 +138,38 @@ class Session(object):
         """
         raise NotImplementedError('Abstract method.')
 
+    def add_many(self, entity_class, data_items):
+        """
+        Adds the given sequence of entity data of the given entity class to
+        the session in one batch.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        """
+        raise NotImplementedError('Abstract method.')
+
+    def remove_many(self, entity_class, data_items):
+        """
+        Removes the given sequence of entity data of the given entity class
+        from the session in one batch.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        """
+        raise NotImplementedError('Abstract method.')
+
+    def update_many(self, entity_class, data_items):
+        """
+        Updates existing entities with the given sequence of entity data in
+        one batch. The target entities are determined through the IDs
+        supplied with the data.
+
+        :param data_items: Sequence of objects that can be adapted to
+          :class:`everest.interfaces.IDataTraversalProxyAdapter`.
+        :returns: List of the updated entities.
+        """
+        raise NotImplementedError('Abstract method.')
+
     def query(self, entity_class):
         raise NotImplementedError('Abstract method.')
 
@@ -161,6 +208,25 @@ class AutocommittingSessionMixin(object):
         self.commit()
         return updated_entity
 
+    def add_many(self, entity_class, data_items):
+        self.begin()
+        super(AutocommittingSessionMixin, self).add_many(entity_class,
+                                                         data_items)
+        self.commit()
+
+    def remove_many(self, entity_class, data_items):
+        self.begin()
+        super(AutocommittingSessionMixin, self).remove_many(entity_class,
+                                                            data_items)
+        self.commit()
+
+    def update_many(self, entity_class, data_items):
+        self.begin()
+        spr = super(AutocommittingSessionMixin, self)
+        updated_entities = spr.update_many(entity_class, data_items)
+        self.commit()
+        return updated_entities
+
 
 @implementer(IRepository)
 class Repository(object):
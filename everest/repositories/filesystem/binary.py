@@ -0,0 +1,336 @@
+"""
+Binary storage format for the file system repository.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from everest.constants import RESOURCE_ATTRIBUTE_KINDS
+from everest.entities.attributes import get_domain_class_attribute_iterator
+from everest.entities.utils import get_entity_class
+from everest.mime import BinaryMime
+from everest.resources.storing import get_read_collection_path
+from pyramid.compat import integer_types
+from pyramid.compat import pickle
+from pyramid.compat import string_types
+from pyramid.compat import text_type
+from threading import Lock
+import mmap
+import struct
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['BinaryCollectionLoader',
+           'COLUMN_KINDS',
+           'dump_binary_collection',
+           'get_binary_schema',
+           'read_binary_collection',
+           ]
+
+
+class COLUMN_KINDS(object):
+    """
+    Column kind codes used in the binary collection file schema.
+    """
+    INTEGER = 'i'
+    FLOAT = 'd'
+    BOOLEAN = '?'
+    TEXT = 'u'
+    PICKLE = 'p'
+    MEMBER = 'r'
+    COLLECTION = 'l'
+
+
+#: Identifies binary collection files (and the format version).
+MAGIC = b'EVEREST-BINARY-1\n'
+
+# Record lengths and element counts.
+_LENGTH = struct.Struct('>I')
+# Value tags; each column value starts with one of these.
+_TAG = struct.Struct('>B')
+_TAG_NONE = 0
+_TAG_NATIVE = 1
+_TAG_PICKLE = 2
+# Native value encodings by column kind.
+_INTEGER = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_BOOLEAN = struct.Struct('>?')
+_MIN_INTEGER = -2 ** 63
+_MAX_INTEGER = 2 ** 63 - 1
+
+
+def get_binary_schema(entity_class):
+    """
+    Returns the column schema for binary collection files of the given
+    entity class.
+
+    There is one column for each domain attribute of the entity class
+    which maps to a (non-nested) entity attribute. The column kind is
+    derived from the attribute kind and, for terminal attributes, from the
+    attribute type; terminal attributes with other types than integer,
+    float, boolean and string are stored as pickles.
+
+    :returns: list of (entity attribute name, column kind, referenced entity
+      class or `None`) tuples.
+    """
+    schema = []
+    for attr in get_domain_class_attribute_iterator(entity_class):
+        entity_attr = attr.entity_attr
+        if entity_attr is None or '.' in entity_attr:
+            continue
+        target = None
+        if attr.kind == RESOURCE_ATTRIBUTE_KINDS.TERMINAL:
+            attr_type = attr.attr_type
+            if not isinstance(attr_type, type):
+                kind = COLUMN_KINDS.PICKLE
+            elif issubclass(attr_type, bool):
+                kind = COLUMN_KINDS.BOOLEAN
+            elif issubclass(attr_type, integer_types):
+                kind = COLUMN_KINDS.INTEGER
+            elif issubclass(attr_type, float):
+                kind = COLUMN_KINDS.FLOAT
+            elif issubclass(attr_type, string_types):
+                kind = COLUMN_KINDS.TEXT
+            else:
+                kind = COLUMN_KINDS.PICKLE
+        else:
+            if attr.kind == RESOURCE_ATTRIBUTE_KINDS.MEMBER:
+                kind = COLUMN_KINDS.MEMBER
+            else:
+                kind = COLUMN_KINDS.COLLECTION
+            target = get_entity_class(attr.attr_type)
+        schema.append((entity_attr, kind, target))
+    return schema
+
+
+def dump_binary_collection(entity_class, entities, stream):
+    """
+    Writes the given entities to the given (binary) stream.
+
+    The file starts with a magic string followed by a length-prefixed
+    header record holding the column names and kinds and one
+    length-prefixed record for each entity. Each value in a record starts
+    with a tag byte indicating if the value is `None`, encoded natively for
+    the column kind or pickled (for values which do not fit the column
+    kind). References to other entities are stored as entity IDs.
+    """
+    schema = get_binary_schema(entity_class)
+    stream.write(MAGIC)
+    header = pickle.dumps([(name, kind) for (name, kind, _) in schema],
+                          protocol=2)
+    stream.write(_LENGTH.pack(len(header)))
+    stream.write(header)
+    for ent in entities:
+        parts = []
+        for name, kind, _ in schema:
+            _encode_value(kind, getattr(ent, name), parts)
+        record = b''.join(parts)
+        stream.write(_LENGTH.pack(len(record)))
+        stream.write(record)
+
+
+def read_binary_collection(path):
+    """
+    Reads the binary collection file with the given path.
+
+    The file is memory mapped for reading.
+
+    :returns: tuple holding the list of (entity attribute name, column
+      kind) tuples from the file header and a list of rows (one list of
+      column values for each entity; references to other entities are
+      returned as entity IDs).
+    :raises ValueError: if the file is not a binary collection file.
+    """
+    with open(path, 'rb') as stream:
+        buf = stream.read(len(MAGIC))
+        if buf != MAGIC:
+            raise ValueError('"%s" is not a binary collection file.' % path)
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size = len(buf)
+        offset = len(MAGIC)
+        header_length, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        columns = pickle.loads(buf[offset:offset + header_length])
+        offset += header_length
+        rows = []
+        while offset < size:
+            record_length, = _LENGTH.unpack_from(buf, offset)
+            offset += _LENGTH.size
+            end = offset + record_length
+            row = []
+            for _, kind in columns:
+                value, offset = _decode_value(kind, buf, offset)
+                row.append(value)
+            if offset != end:
+                raise ValueError('Corrupt record in binary collection file '
+                                 '"%s".' % path)
+            rows.append(row)
+    finally:
+        buf.close()
+    return columns, rows
+
+
+class BinaryCollectionLoader(object):
+    """
+    Cache loader reading the binary collection files of a file system
+    repository.
+
+    On the first call, all collection files are read and the entities for
+    all collections are created from the terminal column values without
+    going through the representer machinery. The entity references are
+    then resolved by entity class and ID; references to entities which
+    were not found are set to `None` (member references) or skipped
+    (collection references). Columns which are not in the current schema
+    of an entity class are ignored.
+    """
+    def __init__(self, collection_classes, directory):
+        """
+        :param collection_classes: Sequence of registered collection
+          classes to load.
+        :param str directory: Directory holding the collection files.
+        """
+        self.__collection_classes = list(collection_classes)
+        self.__directory = directory
+        self.__entity_map = None
+        self.__lock = Lock()
+
+    def __call__(self, entity_class):
+        """
+        Returns the loaded entities for the given entity class.
+        """
+        with self.__lock:
+            if self.__entity_map is None:
+                self.__entity_map = self.__load()
+            ents = self.__entity_map.pop(entity_class, [])
+        return ents
+
+    def __load(self):
+        entity_map = {}
+        link_map = {}
+        for coll_cls in self.__collection_classes:
+            path = get_read_collection_path(coll_cls, BinaryMime,
+                                            directory=self.__directory)
+            if path is None:
+                continue
+            ent_cls = get_entity_class(coll_cls)
+            schema_map = dict((name, (kind, target))
+                              for (name, kind, target)
+                              in get_binary_schema(ent_cls))
+            columns, rows = read_binary_collection(path)
+            terminals = []
+            references = []
+            for idx, (name, kind) in enumerate(columns):
+                schema_kind, target = schema_map.get(name, (None, None))
+                if schema_kind is None:
+                    continue
+                elif kind in (COLUMN_KINDS.MEMBER, COLUMN_KINDS.COLLECTION):
+                    if kind == schema_kind:
+                        references.append((idx, name, kind, target))
+                elif not schema_kind in (COLUMN_KINDS.MEMBER,
+                                         COLUMN_KINDS.COLLECTION):
+                    terminals.append((idx, name))
+            ents = entity_map[ent_cls] = \
+                [ent_cls.create_from_data(dict((name, row[idx])
+                                               for (idx, name) in terminals))
+                 for row in rows]
+            link_map[ent_cls] = (references, rows)
+        id_map = dict((ent_cls, dict((ent.id, ent) for ent in ents))
+                      for (ent_cls, ents) in entity_map.items())
+        for ent_cls, (references, rows) in link_map.items():
+            for ent, row in zip(entity_map[ent_cls], rows):
+                for idx, name, kind, target in references:
+                    target_ids = id_map.get(target, {})
+                    value = row[idx]
+                    if kind == COLUMN_KINDS.MEMBER:
+                        if not value is None:
+                            value = target_ids.get(value)
+                    elif not value is None:
+                        value = [target_ids[val] for val in value
+                                 if val in target_ids]
+                    setattr(ent, name, value)
+        return entity_map
+
+
+def _encode_value(kind, value, parts):
+    # Appends the encoded value for the given column kind to the given list
+    # of parts.
+    if value is None:
+        parts.append(_TAG.pack(_TAG_NONE))
+        return
+    if kind == COLUMN_KINDS.MEMBER:
+        value = value.id
+        native = _is_integer(value)
+    elif kind == COLUMN_KINDS.COLLECTION:
+        value = [ent.id for ent in value]
+        native = all(_is_integer(val) for val in value)
+    elif kind == COLUMN_KINDS.INTEGER:
+        native = _is_integer(value)
+    elif kind == COLUMN_KINDS.FLOAT:
+        native = type(value) is float
+    elif kind == COLUMN_KINDS.BOOLEAN:
+        native = isinstance(value, bool)
+    elif kind == COLUMN_KINDS.TEXT:
+        native = isinstance(value, text_type)
+    else:
+        native = False
+    if not native:
+        data = pickle.dumps(value, protocol=2)
+        parts.append(_TAG.pack(_TAG_PICKLE))
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+        return
+    parts.append(_TAG.pack(_TAG_NATIVE))
+    if kind in (COLUMN_KINDS.INTEGER, COLUMN_KINDS.MEMBER):
+        parts.append(_INTEGER.pack(value))
+    elif kind == COLUMN_KINDS.COLLECTION:
+        parts.append(_LENGTH.pack(len(value)))
+        parts.extend(_INTEGER.pack(val) for val in value)
+    elif kind == COLUMN_KINDS.FLOAT:
+        parts.append(_FLOAT.pack(value))
+    elif kind == COLUMN_KINDS.BOOLEAN:
+        parts.append(_BOOLEAN.pack(value))
+    else:
+        data = value.encode('utf-8')
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+
+
+def _decode_value(kind, buf, offset):
+    # Decodes the value for the given column kind at the given offset of
+    # the given buffer; returns the value and the offset of the next value.
+    tag, = _TAG.unpack_from(buf, offset)
+    offset += _TAG.size
+    if tag == _TAG_NONE:
+        value = None
+    elif tag == _TAG_PICKLE:
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        value = pickle.loads(buf[offset:offset + length])
+        offset += length
+    elif kind in (COLUMN_KINDS.INTEGER, COLUMN_KINDS.MEMBER):
+        value, = _INTEGER.unpack_from(buf, offset)
+        offset += _INTEGER.size
+    elif kind == COLUMN_KINDS.COLLECTION:
+        count, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        value = list(struct.unpack_from('>%dq' % count, buf, offset))
+        offset += _INTEGER.size * count
+    elif kind == COLUMN_KINDS.FLOAT:
+        value, = _FLOAT.unpack_from(buf, offset)
+        offset += _FLOAT.size
+    elif kind == COLUMN_KINDS.BOOLEAN:
+        value, = _BOOLEAN.unpack_from(buf, offset)
+        offset += _BOOLEAN.size
+    else:
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        value = buf[offset:offset + length].decode('utf-8')
+        offset += length
+    return value, offset
+
+
+def _is_integer(value):
+    return isinstance(value, integer_types) \
+           and not isinstance(value, bool) \
+           and _MIN_INTEGER <= value <= _MAX_INTEGER
@@ -0,0 +1,210 @@
+"""
+Parallel loading of collection files for the file system repository.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from everest.constants import RESOURCE_KINDS
+from everest.entities.utils import get_entity_class
+from everest.representers.interfaces import ILinkedDataElement
+from everest.representers.interfaces import IResourceDataElement
+from everest.representers.utils import as_representer
+from everest.resources.staging import create_staging_collection
+from everest.resources.storing import get_read_collection_path
+from everest.resources.utils import get_registered_collection_resources
+from everest.utils import set_nested_attribute
+from multiprocessing import Pool
+from pyramid.compat import iteritems_
+from pyramid.compat import url_unquote
+from pyramid.compat import urlparse
+from pyramid.threadlocal import get_current_registry
+from pyramid.threadlocal import manager
+from threading import Lock
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['ParallelCollectionLoader',
+           ]
+
+
+# Maps collection root names to registered collection classes in the worker
+# processes (the collection classes are created at runtime and can
+# therefore not be passed to the workers).
+_COLLECTION_CLASSES = {}
+
+class ParallelCollectionLoader(object):
+    """
+    Cache loader parsing the collection files of a file system repository
+    in a pool of worker processes.
+
+    On the first call, each worker parses one collection file with the
+    configured representer and converts the members into a compact form
+    (the terminal attribute values and the URLs of the linked members).
+    The parent process then creates the entities for all collections and
+    links the entity references among them; references are resolved by
+    the collection name and the member slug in the link URL.
+
+    Collections which can not be loaded this way are left to the regular
+    (sequential) loading: The loader returns `None` for collections with
+    inline nested members or collection links and for collections
+    referencing members which were not found in the parsed collections.
+
+    The worker processes are forked from the loading process and inherit
+    its configuration; the loader can therefore only be used on platforms
+    which support forking processes.
+    """
+    def __init__(self, collection_classes, content_type, directory,
+                 processes):
+        """
+        :param collection_classes: Sequence of registered collection
+          classes to load.
+        :param content_type: MIME content type of the collection files.
+        :param str directory: Directory holding the collection files.
+        :param int processes: Number of worker processes.
+        """
+        self.__collection_classes = list(collection_classes)
+        self.__content_type = content_type
+        self.__directory = directory
+        self.__processes = processes
+        self.__entity_map = None
+        self.__lock = Lock()
+
+    def __call__(self, entity_class):
+        """
+        Returns the loaded entities for the given entity class or `None`
+        if the entities of this class need to be loaded sequentially.
+        """
+        with self.__lock:
+            if self.__entity_map is None:
+                self.__entity_map = self.__load()
+            ents = self.__entity_map.pop(entity_class, None)
+        return ents
+
+    def __load(self):
+        coll_clss = []
+        jobs = []
+        for coll_cls in self.__collection_classes:
+            path = get_read_collection_path(coll_cls, self.__content_type,
+                                            directory=self.__directory)
+            if not path is None:
+                coll_clss.append(coll_cls)
+                jobs.append((coll_cls.root_name, path, self.__content_type))
+        if len(jobs) == 0:
+            return {}
+        pool = Pool(min(self.__processes, len(jobs)),
+                    initializer=_initialize_worker,
+                    initargs=(get_current_registry(),))
+        try:
+            results = pool.map(_parse_collection_file, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        # Create all entities first so that references between them can be
+        # resolved in a single pass.
+        records_map = {}
+        entity_map = {}
+        for coll_cls, records in zip(coll_clss, results):
+            if records is None:
+                continue
+            ent_cls = get_entity_class(coll_cls)
+            records_map[ent_cls] = records
+            entity_map[ent_cls] = [ent_cls.create_from_data(init_map)
+                                   for (init_map, _) in records]
+        slug_map = {}
+        for coll_cls in self.__collection_classes:
+            ents = entity_map.get(get_entity_class(coll_cls))
+            if not ents is None:
+                slug_map[coll_cls.root_name] = \
+                            dict((ent.slug, ent) for ent in ents)
+        # Resolve the links, dropping collections with unresolved links
+        # and (repeatedly) all collections referencing dropped ones.
+        link_map = {}
+        dependency_map = {}
+        for ent_cls, records in iteritems_(records_map):
+            ent_links = []
+            dependencies = set()
+            for ent, (_, url_map) in zip(entity_map[ent_cls], records):
+                for entity_attr, url in iteritems_(url_map):
+                    target = _resolve_url(url, slug_map)
+                    if target is None:
+                        dependencies = None
+                        break
+                    ent_links.append((ent, entity_attr, target))
+                    dependencies.add(type(target))
+                if dependencies is None:
+                    break
+            if dependencies is None:
+                del entity_map[ent_cls]
+            else:
+                link_map[ent_cls] = ent_links
+                dependency_map[ent_cls] = dependencies
+        is_changed = True
+        while is_changed:
+            is_changed = False
+            for ent_cls, dependencies in list(dependency_map.items()):
+                if not all(dep in entity_map for dep in dependencies):
+                    del entity_map[ent_cls]
+                    del dependency_map[ent_cls]
+                    is_changed = True
+        for ent_cls in entity_map:
+            for ent, entity_attr, target in link_map[ent_cls]:
+                set_nested_attribute(ent, entity_attr, target)
+        return entity_map
+
+
+def _initialize_worker(registry):
+    # The representers need the registry of the loading process.
+    manager.push(dict(registry=registry, request=None))
+    _COLLECTION_CLASSES.update((coll_cls.root_name, coll_cls)
+                               for coll_cls
+                               in get_registered_collection_resources())
+
+
+def _parse_collection_file(job):
+    # Parses the given collection file into a list of (terminal attribute
+    # map, link URL map) tuples (one for each member) or returns None if the
+    # collection contains data which can not be represented this way.
+    # Nested terminal attributes (e.g., "parent.text") are skipped since
+    # their values are loaded with the referenced entity.
+    root_name, path, content_type = job
+    coll_cls = _COLLECTION_CLASSES[root_name]
+    rpr = as_representer(create_staging_collection(coll_cls), content_type)
+    with open(path, 'rU') as stream:
+        coll_el = rpr.data_from_stream(stream)
+    records = []
+    for mb_el in coll_el.get_members():
+        mapping = mb_el.mapping
+        init_map = {}
+        url_map = {}
+        data = mb_el.data
+        for attr in mapping.attribute_iterator(
+                                        mapped_class=mapping.mapped_class):
+            if not attr.repr_name in data:
+                continue
+            value = data[attr.repr_name]
+            entity_attr = attr.entity_attr
+            if entity_attr is None:
+                continue
+            elif ILinkedDataElement.providedBy(value): # pylint: disable=E1101
+                if value.get_kind() != RESOURCE_KINDS.MEMBER:
+                    return None
+                url_map[entity_attr] = value.get_url()
+            elif IResourceDataElement.providedBy(value): # pylint: disable=E1101
+                # Inline nested member or collection.
+                return None
+            elif not '.' in entity_attr:
+                init_map[entity_attr] = value
+        records.append((init_map, url_map))
+    return records
+
+
+def _resolve_url(url, slug_map):
+    # Looks up the entity for the given member URL by the collection name
+    # and the member slug (the last two segments of the URL path).
+    segments = [seg for seg in urlparse.urlparse(url).path.split('/') # pylint: disable=E1101
+                if seg != '']
+    if len(segments) < 2:
+        return None
+    slugs = slug_map.get(url_unquote(segments[-2]))
+    return None if slugs is None else slugs.get(url_unquote(segments[-1]))
@@ -6,16 +6,38 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jan 7, 2013.
 """
+from collections import OrderedDict
+from everest.interfaces import IBinaryMime
 from everest.mime import CsvMime
+from everest.repositories.filesystem.binary import BinaryCollectionLoader
+from everest.repositories.filesystem.binary import dump_binary_collection
+from everest.repositories.filesystem.loader import ParallelCollectionLoader
+from everest.repositories.memory.commitlog import CommitLog
 from everest.repositories.memory.repository import MemoryRepository
 from everest.repositories.memory.repository import MemorySessionFactory
+from everest.repositories.memory.snapshot import SnapshotScheduler
+from everest.repositories.state import ENTITY_STATUS
+from everest.repositories.utils import StripedLock
+from everest.representers.utils import as_representer
+from everest.resources.staging import create_staging_collection
 from everest.resources.storing import dump_resource
 from everest.resources.storing import get_read_collection_path
 from everest.resources.storing import get_write_collection_path
 from everest.resources.storing import load_collection_from_url
 from everest.resources.utils import get_collection_class
+from everest.resources.utils import get_member_class
 from everest.resources.utils import get_root_collection
+from pyramid.compat import NativeIO
+from pyramid.compat import itervalues_
+from pyramid.threadlocal import get_current_registry
+from pyramid.threadlocal import get_current_request
+from pyramid.threadlocal import manager
+from threading import Lock
+from threading import Thread
+import atexit
 import os
+import time
+import transaction
 
 __all__ = ['FileSystemRepository',
            ]
@@ -28,9 +50,60 @@ class FileSystemRepository(MemoryRepository):
     On initialization, this repository loads resource representations from
     files into the root repository. Each commit operation writes the specified
     resource back to file.
+
+    Writing a collection to file holds a separate lock for its entity class
+    so that commits to different entity classes can write their files in
+    parallel. Collection files are written to a temporary file first which
+    then replaces the old file so that readers never see a partially written
+    collection.
+
+    In addition to the options of the memory repository, the following
+    options can be configured:
+
+    directory
+        Directory holding the collection files. Defaults to the current
+        working directory.
+    content_type
+        MIME content type of the collection files. Defaults to CSV. With
+        :class:`everest.mime.BinaryMime`, the collections are stored in a
+        compact binary format which is read without going through the
+        representers (see
+        :mod:`everest.repositories.filesystem.binary`); this format does
+        not support incremental commits and parallel loading.
+    incremental
+        Flag indicating if commits should only append the changed
+        collection members to a delta file next to each collection file
+        instead of rewriting the whole collection. The delta file for a
+        collection holds one record per commit with representations of the
+        added and updated members and the IDs of the deleted members (see
+        :class:`everest.repositories.memory.commitlog.CommitLog`); the
+        records are merged into the collection on startup. Defaults to
+        `False`.
+    delta_compaction_size
+        Size (in bytes) of a delta file beyond which the collection file is
+        rewritten (and the delta file is emptied) in a background thread.
+        Defaults to 1 MB.
+    write_interval
+        If this is set, commits only mark the entity classes with changes
+        as dirty and a background writer thread rewrites the collection
+        file for each dirty entity class at most once per interval (in
+        seconds), coalescing all commits in the meantime. Pending writes
+        are performed when the repository is reset and when the process
+        exits; :attr:`write_lag` reports how far the files lag behind the
+        committed data. The resource URLs in the files are generated with
+        the request of the last commit. This
+        does not apply to incremental commits. Defaults to `None`
+        (collection files are written during the commit).
+    load_processes
+        Number of worker processes parsing the collection files in parallel
+        when the repository data are loaded (see
+        :class:`everest.repositories.filesystem.loader.ParallelCollectionLoader`).
+        Defaults to `None` (the collection files are parsed sequentially).
     """
     _configurables = MemoryRepository._configurables \
-                     + ['directory', 'content_type']
+                     + ['directory', 'content_type', 'incremental',
+                        'delta_compaction_size', 'write_interval',
+                        'load_processes']
 
     def __init__(self, name, aggregate_class=None,
                  join_transaction=True, autocommit=False):
@@ -38,52 +111,355 @@ class FileSystemRepository(MemoryRepository):
                                   aggregate_class=aggregate_class,
                                   join_transaction=join_transaction,
                                   autocommit=autocommit)
+        self.__dump_lock = StripedLock()
+        # Maps entity classes to delta files opened for appending.
+        self.__delta_logs = {}
+        # Maps entity classes to running background compaction threads.
+        self.__compactions = {}
+        self.__compaction_lock = Lock()
+        # Entity classes with changes not yet written by the background
+        # writer and the times of the oldest commits not yet written.
+        self.__dirty_entity_classes = set()
+        self.__dirty_since = None
+        self.__writing_since = None
+        self.__dirty_lock = Lock()
+        # The request of the last commit (for generating resource URLs).
+        self.__write_request = None
+        self.__writer = None
+        self.__is_exit_hook_registered = False
+        self.__parallel_loader = None
+        self.__binary_loader = None
         self.configure(directory=os.getcwd(), content_type=CsvMime,
-                       cache_loader=self.__load_entities)
+                       cache_loader=self.__load_entities, incremental=False,
+                       delta_compaction_size=1024 * 1024,
+                       write_interval=None, load_processes=None)
 
     def commit(self, unit_of_work):
         """
         Dump all resources that were modified by the given session back into
         the repository.
         """
-        MemoryRepository.commit(self, unit_of_work)
-        if self.is_initialized:
-            entity_classes_to_dump = set()
-            for state in unit_of_work.iterator():
-                entity_classes_to_dump.add(type(state.entity))
-            for entity_cls in entity_classes_to_dump:
-                self.__dump_entities(entity_cls)
+        entity_classes_to_dump = set()
+        for state in unit_of_work.iterator():
+            entity_classes_to_dump.add(type(state.entity))
+        if not self._config['incremental']:
+            MemoryRepository.commit(self, unit_of_work)
+            if not self.__writer is None:
+                request = get_current_request()
+                with self.__dirty_lock:
+                    self.__dirty_entity_classes.update(entity_classes_to_dump)
+                    if self.__dirty_since is None:
+                        self.__dirty_since = time.time()
+                    if not request is None:
+                        self.__write_request = request
+            elif self.is_initialized:
+                with self.__dump_lock.locking(entity_classes_to_dump):
+                    for entity_cls in entity_classes_to_dump:
+                        self.__dump_entities(entity_cls)
+                        self.__discard_delta(entity_cls)
+        else:
+            # Holding the lock while publishing keeps the delta records in
+            # the order in which the changes were published.
+            with self.__dump_lock.locking(entity_classes_to_dump):
+                MemoryRepository.commit(self, unit_of_work)
+                if self.is_initialized:
+                    changed_entity_classes = \
+                                    self.__append_deltas(unit_of_work)
+                else:
+                    changed_entity_classes = []
+            threshold = self._config['delta_compaction_size']
+            for entity_cls in changed_entity_classes:
+                if os.path.getsize(self.__get_delta_path(entity_cls)) \
+                                                                > threshold:
+                    self.__start_compaction(entity_cls)
+
+    @property
+    def write_lag(self):
+        """
+        Time (in seconds) since the oldest commit whose changes were not
+        written to the collection files by the background writer yet (0 if
+        all changes were written).
+        """
+        with self.__dirty_lock:
+            since = [tm for tm in (self.__dirty_since, self.__writing_since)
+                     if not tm is None]
+        if len(since) > 0:
+            lag = time.time() - min(since)
+        else:
+            lag = 0
+        return lag
+
+    def reset(self):
+        # Perform pending writes before the data are discarded.
+        self.__stop_writer()
+        # Pending compactions need the repository in working order.
+        with self.__compaction_lock:
+            threads = list(itervalues_(self.__compactions))
+        for thread in threads:
+            thread.join()
+        MemoryRepository.reset(self)
+
+    def _initialize(self):
+        if self.__is_binary and self._config['incremental']:
+            raise ValueError('Incremental commits are not supported with '
+                             'the binary storage format.')
+        MemoryRepository._initialize(self)
+        load_processes = self._config['load_processes']
+        if self.__is_binary:
+            self.__binary_loader = BinaryCollectionLoader(
+                                            self.registered_resources,
+                                            self._config['directory'])
+        elif load_processes and load_processes > 1:
+            self.__parallel_loader = ParallelCollectionLoader(
+                                            self.registered_resources,
+                                            self._config['content_type'],
+                                            self._config['directory'],
+                                            load_processes)
+        write_interval = self._config['write_interval']
+        if write_interval and not self._config['incremental']:
+            # Dumping collections requires the current registry which is not
+            # available in the writer thread otherwise.
+            registry = get_current_registry()
+            self.__writer = SnapshotScheduler(
+                        lambda: self.__write_behind(registry),
+                        write_interval)
+            self.__writer.start()
+            if not self.__is_exit_hook_registered:
+                # The writer is a daemon thread, so we perform pending
+                # writes when the process exits.
+                atexit.register(self.__stop_writer)
+                self.__is_exit_hook_registered = True
+
+    def _reset(self):
+        MemoryRepository._reset(self)
+        self.__parallel_loader = None
+        self.__binary_loader = None
+        for delta_log in itervalues_(self.__delta_logs):
+            delta_log.close()
+        self.__delta_logs.clear()
 
     def _make_session_factory(self):
         return MemorySessionFactory(self)
 
+    @property
+    def __is_binary(self):
+        return IBinaryMime.providedBy(self._config['content_type']) # pylint: disable=E1101
+
     def __load_entities(self, entity_class):
+        if not self.__binary_loader is None:
+            return self.__binary_loader(entity_class)
         coll_cls = get_collection_class(entity_class)
         fn = get_read_collection_path(coll_cls, self._config['content_type'],
                                       directory=self._config['directory'])
-        if not fn is None:
-            url = 'file://%s' % fn
-            coll = load_collection_from_url(coll_cls, url,
-                                            content_type=
-                                                self._config['content_type'])
-            ents = [mb.get_entity() for mb in coll]
+        if not self.__parallel_loader is None:
+            # This returns None for collections that need to be loaded
+            # sequentially.
+            ents = self.__parallel_loader(entity_class)
         else:
-            ents = []
+            ents = None
+        if ents is None:
+            if not fn is None:
+                url = 'file://%s' % fn
+                coll = load_collection_from_url(coll_cls, url,
+                                                content_type=
+                                                self._config['content_type'])
+                ents = [mb.get_entity() for mb in coll]
+            else:
+                ents = []
+        delta_path = self.__get_delta_path(entity_class)
+        if os.path.exists(delta_path) \
+           or os.path.exists(delta_path + '.old'):
+            ents = self.__merge_deltas(coll_cls, ents,
+                                       CommitLog(delta_path).read())
         return ents
 
+    def __merge_deltas(self, collection_class, entities, records):
+        # Applies the given delta records to the given loaded entities.
+        # Added and updated members replace loaded entities with the same
+        # ID so that records which are already contained in the collection
+        # file (e.g., after an interrupted compaction) can be merged safely.
+        ent_map = OrderedDict()
+        new_ents = []
+        for ent in entities:
+            if ent.id is None:
+                new_ents.append(ent)
+            else:
+                ent_map[ent.id] = ent
+        for changes in records:
+            for status, data in changes:
+                if status == ENTITY_STATUS.DELETED:
+                    for ent_id in data:
+                        ent_map.pop(ent_id, None)
+                else:
+                    coll = create_staging_collection(collection_class)
+                    rpr = as_representer(coll, self._config['content_type'])
+                    rpr.from_string(data, resource=coll)
+                    for mb in coll:
+                        ent = mb.get_entity()
+                        ent_map[ent.id] = ent
+        return list(ent_map.values()) + new_ents
+
+    def __append_deltas(self, unit_of_work):
+        # Appends one delta record for each entity class with changes in
+        # the given unit of work and returns the changed entity classes.
+        change_map = OrderedDict()
+        for state in unit_of_work.iterator():
+            status = state.status
+            if status == ENTITY_STATUS.CLEAN:
+                continue
+            ent = state.entity
+            changes = change_map.get(type(ent))
+            if changes is None:
+                changes = change_map[type(ent)] = \
+                                {ENTITY_STATUS.NEW : [],
+                                 ENTITY_STATUS.DIRTY : [],
+                                 ENTITY_STATUS.DELETED : []}
+            changes[status].append(ent)
+        for entity_cls, changes in change_map.items():
+            record = []
+            for status in (ENTITY_STATUS.NEW, ENTITY_STATUS.DIRTY):
+                if len(changes[status]) > 0:
+                    record.append((status,
+                                   self.__dump_delta_entities(
+                                                entity_cls, changes[status])))
+            deleted_ents = changes[ENTITY_STATUS.DELETED]
+            if len(deleted_ents) > 0:
+                record.append((ENTITY_STATUS.DELETED,
+                               [ent.id for ent in deleted_ents]))
+            self.__get_delta_log(entity_cls).append(record)
+        return list(change_map.keys())
+
+    def __dump_delta_entities(self, entity_class, entities):
+        coll = create_staging_collection(entity_class)
+        mb_cls = get_member_class(entity_class)
+        for ent in entities:
+            coll.add(mb_cls.create_from_entity(ent))
+        stream = NativeIO()
+        dump_resource(coll, stream, content_type=self._config['content_type'])
+        return stream.getvalue()
+
+    def __get_delta_log(self, entity_class):
+        delta_log = self.__delta_logs.get(entity_class)
+        if delta_log is None:
+            sync_interval = self._config['commit_log_sync_interval']
+            delta_log = self.__delta_logs[entity_class] = \
+                    CommitLog(self.__get_delta_path(entity_class),
+                              sync_interval=sync_interval)
+            delta_log.open()
+        return delta_log
+
+    def __get_delta_path(self, entity_class):
+        return '%s.delta' % get_write_collection_path(
+                                        get_collection_class(entity_class),
+                                        self._config['content_type'],
+                                        directory=self._config['directory'])
+
+    def __discard_delta(self, entity_class):
+        # The collection file was just rewritten with all changes, so any
+        # delta records left over from incremental commits are obsolete.
+        delta_path = self.__get_delta_path(entity_class)
+        for path in (delta_path, delta_path + '.old'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __stop_writer(self):
+        # Stops the background writer; its last pass performs pending
+        # writes.
+        writer = self.__writer
+        if not writer is None:
+            self.__writer = None
+            writer.stop(flush=True)
+
+    def __write_behind(self, registry):
+        # Performs one pass of the background writer. Each pass reads the
+        # current version of the repository data with a new session.
+        with self.__dirty_lock:
+            request = self.__write_request
+        manager.push(dict(registry=registry, request=request))
+        try:
+            self.__write_dirty_entities()
+        finally:
+            if self.join_transaction:
+                transaction.abort()
+            self.session_factory.reset()
+            manager.pop()
+
+    def __write_dirty_entities(self):
+        with self.__dirty_lock:
+            entity_classes = self.__dirty_entity_classes
+            self.__dirty_entity_classes = set()
+            self.__writing_since = self.__dirty_since
+            self.__dirty_since = None
+        if len(entity_classes) == 0:
+            return
+        try:
+            with self.__dump_lock.locking(entity_classes):
+                for entity_cls in entity_classes:
+                    self.__dump_entities(entity_cls)
+                    self.__discard_delta(entity_cls)
+        except:
+            # Try again with the next pass (the writer logs the error).
+            with self.__dirty_lock:
+                self.__dirty_entity_classes.update(entity_classes)
+                if self.__dirty_since is None \
+                   or self.__writing_since < self.__dirty_since:
+                    self.__dirty_since = self.__writing_since
+            raise
+        finally:
+            with self.__dirty_lock:
+                self.__writing_since = None
+
+    def __start_compaction(self, entity_class):
+        with self.__compaction_lock:
+            if entity_class in self.__compactions:
+                return
+            # Dumping the collection requires the current registry and
+            # request (for generating resource URLs) which are not available
+            # in the compaction thread otherwise.
+            thread = Thread(target=self.__compact,
+                            args=(entity_class, get_current_registry(),
+                                  get_current_request()))
+            thread.daemon = True
+            self.__compactions[entity_class] = thread
+        thread.start()
+
+    def __compact(self, entity_class, registry, request):
+        # Moves the current delta records aside, rewrites the collection
+        # file from the published entities (which contain all records that
+        # were moved aside) and then discards the old records. Commits
+        # proceed while the collection file is written; their records go
+        # to the new delta file.
+        manager.push(dict(registry=registry, request=request))
+        try:
+            delta_log = self.__get_delta_log(entity_class)
+            with self.__dump_lock.locking([entity_class]):
+                delta_log.rotate()
+            self.__dump_entities(entity_class)
+            delta_log.discard_rotated()
+        finally:
+            manager.pop()
+            with self.__compaction_lock:
+                del self.__compactions[entity_class]
+
     def __dump_entities(self, entity_class):
         coll = get_root_collection(entity_class)
-#        coll_cls = get_collection_class(entity_class)
-        fn = get_write_collection_path(coll, #_cls,
+        fn = get_write_collection_path(coll,
                                        self._config['content_type'],
                                        directory=self._config['directory'])
-#        # Wrap the entities in a temporary collection.
-#        coll = create_staging_collection(coll_cls)
-#        mb_cls = get_member_class(entity_class)
-#        for ent in self.retrieve(entity_class):
-#            coll.add(mb_cls.create_from_entity(ent))
-        # Open stream for writing and dump the collection.
-        stream = open(fn, 'w')
+        # Dump the collection to a temporary file and move it into place.
+        tmp_fn = '%s.tmp' % fn
+        if self.__is_binary:
+            stream = open(tmp_fn, 'wb')
+        else:
+            stream = open(tmp_fn, 'w')
         with stream:
-            dump_resource(coll, stream,
-                          content_type=self._config['content_type'])
+            if self.__is_binary:
+                dump_binary_collection(entity_class,
+                                       coll.get_aggregate().iterator(),
+                                       stream)
+            else:
+                dump_resource(coll, stream,
+                              content_type=self._config['content_type'])
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.rename(tmp_fn, fn)
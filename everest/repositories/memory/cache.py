@@ -6,42 +6,355 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Feb 26, 2013.
 """
-from collections import defaultdict
+from everest.entities.interfaces import IEntity
 from everest.repositories.memory.querying import MemoryQuery
 from everest.repositories.state import EntityState
-from itertools import islice
-from weakref import WeakValueDictionary
+from bisect import bisect_left
+from bisect import bisect_right
 from everest.utils import WeakList
+from itertools import chain
+from itertools import count
+from itertools import islice
+from pyramid.compat import itervalues_
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['EntityCache',
            'EntityCacheMap',
+           'HashIndex',
+           'SortedIndex',
            ]
 
 
+# Generator for entity cache version numbers. Version numbers are unique
+# across all caches so that diverging copies of a cache never share a
+# version number.
+_VERSION_GEN = count(1)
+
+
+class HashIndex(object):
+    """
+    Hash index mapping the values of an entity attribute to the set of
+    entities holding that value.
+
+    Entity values are indexed by their ID; entities referencing another
+    entity which does not have an ID yet are returned with every lookup.
+    """
+    #: Key for entity values without an ID.
+    __UNRESOLVED = object()
+    #: Marker for keys of entity values.
+    __ENTITY = object()
+
+    def __init__(self, attr_name):
+        """
+        :param str attr_name: Name of the entity attribute to index. Nested
+          attribute names (containing dots) are not supported.
+        :raises ValueError: If the attribute name is nested.
+        """
+        if '.' in attr_name:
+            raise ValueError('Can not index nested attribute "%s".'
+                             % attr_name)
+        self.attr_name = attr_name
+        # Dictionary mapping index keys to sets of entities.
+        self.__buckets = {}
+        # Dictionary mapping entities to their index keys. This allows us to
+        # remove an entity even after its attribute value has changed.
+        self.__keys = {}
+
+    def add(self, entity, position): # pylint: disable=W0613
+        """
+        Adds the given entity to this index.
+
+        :param int position: Insertion position of the entity in the cache.
+        :raises ValueError: If the attribute value is not hashable.
+        """
+        key = self.__make_key(getattr(entity, self.attr_name))
+        try:
+            bucket = self.__buckets.get(key)
+        except TypeError:
+            raise ValueError('Can not index unhashable value for attribute '
+                             '"%s" of entity %s.' % (self.attr_name, entity))
+        if bucket is None:
+            bucket = self.__buckets[key] = set()
+        bucket.add(entity)
+        self.__keys[entity] = key
+
+    def remove(self, entity):
+        """
+        Removes the given entity from this index.
+        """
+        key = self.__keys.pop(entity)
+        bucket = self.__buckets[key]
+        bucket.discard(entity)
+        if len(bucket) == 0:
+            del self.__buckets[key]
+
+    def update(self, entity):
+        """
+        Updates the index key for the given entity.
+        """
+        key = self.__make_key(getattr(entity, self.attr_name))
+        if key != self.__keys[entity]:
+            self.remove(entity)
+            self.add(entity, None)
+
+    def copy(self):
+        """
+        Returns a copy of this index.
+        """
+        clone = HashIndex(self.attr_name)
+        clone.__buckets = dict((key, set(bucket))
+                               for (key, bucket) in self.__buckets.items())
+        clone.__keys = self.__keys.copy()
+        return clone
+
+    def lookup(self, values):
+        """
+        Returns the set of entities holding any of the given values.
+        """
+        result = set(self.__buckets.get(self.__UNRESOLVED, ()))
+        for value in values:
+            try:
+                bucket = self.__buckets.get(self.__make_key(value))
+            except TypeError:
+                # Unhashable values can not be in the index.
+                continue
+            if not bucket is None:
+                result.update(bucket)
+        return result
+
+    def clear(self):
+        self.__buckets.clear()
+        self.__keys.clear()
+
+    def __make_key(self, value):
+        if IEntity.providedBy(value): # pylint: disable=E1101
+            if value.id is None:
+                key = self.__UNRESOLVED
+            else:
+                key = (self.__ENTITY, value.id)
+        else:
+            key = value
+        return key
+
+
+class SortedIndex(object):
+    """
+    Sorted index holding the entities of a cache ordered by the value of an
+    entity attribute.
+
+    Entities with equal attribute values are held in the order they were
+    added to the cache, so walking the index gives the same result as a
+    (stable) sort of the cached entities.
+    """
+    #: Position value greater than all insertion positions.
+    __MAX_POSITION = float('inf')
+
+    def __init__(self, attr_name):
+        """
+        :param str attr_name: Name of the entity attribute to index. Nested
+          attribute names (containing dots) are not supported.
+        :raises ValueError: If the attribute name is nested.
+        """
+        if '.' in attr_name:
+            raise ValueError('Can not index nested attribute "%s".'
+                             % attr_name)
+        self.attr_name = attr_name
+        # Sorted list of (has value flag, value, insertion position) keys.
+        # The flag makes `None` values sort first without comparing them
+        # to other values (which is not supported in Python 3).
+        self.__keys = []
+        # List of entities aligned with the keys list.
+        self.__entities = []
+        # Dictionary mapping entities to their index keys.
+        self.__entity_keys = {}
+
+    def add(self, entity, position):
+        """
+        Adds the given entity to this index.
+
+        :param int position: Insertion position of the entity in the cache.
+        """
+        key = self.__make_key(getattr(entity, self.attr_name), position)
+        try:
+            idx = bisect_right(self.__keys, key)
+        except TypeError:
+            raise ValueError('Can not index unorderable value for attribute '
+                             '"%s" of entity %s.' % (self.attr_name, entity))
+        self.__keys.insert(idx, key)
+        self.__entities.insert(idx, entity)
+        self.__entity_keys[entity] = key
+
+    def remove(self, entity):
+        """
+        Removes the given entity from this index.
+        """
+        key = self.__entity_keys.pop(entity)
+        idx = bisect_left(self.__keys, key)
+        del self.__keys[idx]
+        del self.__entities[idx]
+
+    def update(self, entity):
+        """
+        Updates the position of the given entity in this index.
+        """
+        _, value, position = self.__entity_keys[entity]
+        if getattr(entity, self.attr_name) != value:
+            self.remove(entity)
+            self.add(entity, position)
+
+    def copy(self):
+        """
+        Returns a copy of this index.
+        """
+        clone = SortedIndex(self.attr_name)
+        clone.__keys = list(self.__keys)
+        clone.__entities = list(self.__entities)
+        clone.__entity_keys = self.__entity_keys.copy()
+        return clone
+
+    def lookup_range(self, lower=None, upper=None,
+                     lower_inclusive=True, upper_inclusive=True):
+        """
+        Returns the set of entities with attribute values in the given range.
+
+        :param lower: Lower bound of the range or `None` for no lower bound.
+        :param upper: Upper bound of the range or `None` for no upper bound.
+        """
+        if lower is None:
+            start = 0
+        elif lower_inclusive:
+            start = bisect_left(self.__keys, (True, lower))
+        else:
+            start = bisect_right(self.__keys,
+                                 (True, lower, self.__MAX_POSITION))
+        if upper is None:
+            stop = len(self.__keys)
+        elif upper_inclusive:
+            stop = bisect_right(self.__keys,
+                                (True, upper, self.__MAX_POSITION))
+        else:
+            stop = bisect_left(self.__keys, (True, upper))
+        return set(self.__entities[start:stop])
+
+    def get_slice(self, start, stop):
+        """
+        Returns the list of entities in ascending order between the given
+        start and stop indices.
+        """
+        return self.__entities[start:stop]
+
+    def sort(self, entities, descending=False):
+        """
+        Returns a list of the given indexed entities in the order in which
+        :meth:`iterator` returns them.
+        """
+        keys = self.__entity_keys
+        if not descending:
+            ents = sorted(entities, key=keys.__getitem__)
+        else:
+            # Sorting is stable, so runs of equal values stay in insertion
+            # order.
+            ents = sorted(sorted(entities, key=lambda ent: keys[ent][2]),
+                          key=lambda ent: keys[ent][:2], reverse=True)
+        return ents
+
+    def iterator(self, descending=False):
+        """
+        Returns an iterator over the indexed entities in ascending or
+        descending order of their attribute values.
+        """
+        if not descending:
+            it = iter(self.__entities)
+        else:
+            it = self.__iter_descending()
+        return it
+
+    def clear(self):
+        del self.__keys[:]
+        del self.__entities[:]
+        self.__entity_keys.clear()
+
+    def __iter_descending(self):
+        # Walk the index backwards, but preserve the insertion order for
+        # runs of equal values.
+        keys = self.__keys
+        ents = self.__entities
+        stop = len(keys)
+        while stop > 0:
+            start = bisect_left(keys, keys[stop - 1][:2], 0, stop)
+            for idx in range(start, stop):
+                yield ents[idx]
+            stop = start
+
+    @staticmethod
+    def __make_key(value, position):
+        return (not value is None, value, position)
+
+
 class EntityCache(object):
     """
     Cache for entities.
 
     Supports add and remove operations as well as lookup by ID and
-    by slug.
+    by slug. Optionally, hash and sorted indexes can be maintained for
+    selected entity attributes (see :meth:`add_index` and
+    :meth:`add_sorted_index`).
     """
-    def __init__(self, entities=None, allow_none_id=True):
+    def __init__(self, entities=None, allow_none_id=True, indexes=None,
+                 sorted_indexes=None):
         """
         :param bool allow_none_id: Flag specifying if calling :meth:`add`
             with an entity that does not have an ID is allowed.
+        :param indexes: Sequence of names of entity attributes for which to
+            maintain a hash index.
+        :param sorted_indexes: Sequence of names of entity attributes for
+            which to maintain a sorted index.
         """
         # Flag indicating if None IDs are allowed in this cache.
         self.__allow_none_id = allow_none_id
-        # List of cached entities. This is the only place we are holding a
-        # real reference to the entity.
+        # List of cached entities in insertion order. Removed entities
+        # leave a `None` placeholder behind until the list is compacted
+        # (see :meth:`__get_entities`).
         if entities is None:
             entities = []
         self.__entities = entities
+        # Dictionary mapping entities to their offset in the entity list.
+        self.__offsets = dict((ent, idx) for (idx, ent) in enumerate(entities))
+        # Number of placeholders in the entity list.
+        self.__num_removed = 0
         # Dictionary mapping entity IDs to entities for fast lookup by ID.
-        self.__id_map = WeakValueDictionary()
+        # The entity list holds references to all entities and removals
+        # are explicit, so a plain dictionary (which is cheap to copy) is
+        # sufficient here.
+        self.__id_map = {}
         # Dictionary mapping entity slugs to entities for fast lookup by slug.
         self.__slug_map = {}
+        # Set of slugs for which this cache owns the entity list in the
+        # slug map; all other lists are shared with copies of this cache.
+        self.__own_slugs = set()
+        # Dictionary mapping entities to their (monotonically increasing)
+        # insertion position. This is used to return entities looked up
+        # through an index in the order they were added.
+        self.__position_gen = count()
+        self.__positions = dict((ent, next(self.__position_gen))
+                                for ent in entities)
+        # Dictionary mapping attribute names to hash indexes.
+        self.__indexes = {}
+        if not indexes is None:
+            for attr_name in indexes:
+                self.add_index(attr_name)
+        # Dictionary mapping attribute names to sorted indexes.
+        self.__sorted_indexes = {}
+        if not sorted_indexes is None:
+            for attr_name in sorted_indexes:
+                self.add_sorted_index(attr_name)
+        # Version number of the cache contents; incremented with every
+        # change to the cached entities.
+        self.__version = next(_VERSION_GEN)
+        # Dictionary mapping filter expression cache keys to memoized
+        # counts. Only valid for the version stored in __count_version.
+        self.__counts = {}
+        self.__count_version = 0
 
     def get_by_id(self, entity_id):
         """
@@ -83,7 +396,13 @@ class EntityCache(object):
         """
         do_append = self.__check_new(entity)
         if do_append:
+            self.__offsets[entity] = len(self.__entities)
             self.__entities.append(entity)
+            position = next(self.__position_gen)
+            self.__positions[entity] = position
+            for index in self.__iter_indexes():
+                index.add(entity, position)
+            self.__version = next(_VERSION_GEN)
 
     def remove(self, entity):
         """
@@ -94,9 +413,82 @@ class EntityCache(object):
         :raises KeyError: If the given entity is not in this cache.
         :raises ValueError: If the ID of the given entity is `None`.
         """
+        # The entity to remove might only be *equal* to (i.e., have the
+        # same ID as) the cached entity.
+        cached_entity = self.__id_map.get(entity.id, entity)
+        offset = self.__offsets.pop(cached_entity, None)
+        if offset is None:
+            raise KeyError('Entity %s is not in the cache.' % entity)
+        self.__entities[offset] = None
+        self.__num_removed += 1
         self.__id_map.pop(entity.id, None)
         self.__slug_map.pop(entity.slug, None)
-        self.__entities.remove(entity)
+        self.__own_slugs.discard(entity.slug)
+        del self.__positions[cached_entity]
+        for index in self.__iter_indexes():
+            index.remove(cached_entity)
+        self.__version = next(_VERSION_GEN)
+
+    def replace(self, entity, new_entity):
+        """
+        Replaces the given cached entity with the given new entity which
+        takes over the position of the replaced entity.
+
+        :param entity: Cached entity to replace.
+        :param new_entity: Entity with the same ID as the entity to replace.
+        :raises KeyError: If the given entity is not in this cache.
+        """
+        position = self.__positions.pop(entity)
+        offset = self.__offsets.pop(entity)
+        self.__entities[offset] = new_entity
+        self.__offsets[new_entity] = offset
+        self.__positions[new_entity] = position
+        if not entity.id is None:
+            self.__id_map[entity.id] = new_entity
+        slug = getattr(entity, 'slug', None)
+        if not slug is None:
+            ents = self.__get_slug_list(slug)
+            if not ents is None and entity in ents:
+                ents.remove(entity)
+                if len(ents) == 0:
+                    del self.__slug_map[slug]
+                    self.__own_slugs.discard(slug)
+        new_slug = getattr(new_entity, 'slug', None)
+        if not new_slug is None:
+            self.__add_to_slug_list(new_slug, new_entity)
+        for index in self.__iter_indexes():
+            index.remove(entity)
+            index.add(new_entity, position)
+        self.__version = next(_VERSION_GEN)
+
+    def copy(self):
+        """
+        Returns a copy of this cache.
+
+        The copy shares the cached entities with this cache, but not the
+        lookup structures and indexes; adding, removing or replacing
+        entities in the copy does not affect this cache and vice versa.
+        """
+        clone = EntityCache(allow_none_id=self.__allow_none_id)
+        clone.__entities = list(self.__get_entities())
+        clone.__offsets = self.__offsets.copy()
+        clone.__id_map = self.__id_map.copy()
+        # The slug lists are shared until they are modified.
+        clone.__slug_map = self.__slug_map.copy()
+        clone.__own_slugs = set()
+        self.__own_slugs = set()
+        clone.__position_gen = count(next(self.__position_gen))
+        clone.__positions = self.__positions.copy()
+        clone.__indexes = dict((attr_name, index.copy())
+                               for (attr_name, index)
+                               in self.__indexes.items())
+        clone.__sorted_indexes = dict((attr_name, index.copy())
+                                      for (attr_name, index)
+                                      in self.__sorted_indexes.items())
+        clone.__version = self.__version
+        clone.__counts = self.__counts.copy()
+        clone.__count_version = self.__count_version
+        return clone
 
     def update(self, source_data, target_entity):
         """
@@ -107,31 +499,182 @@ class EntityCache(object):
           :class:`everest.interfaces.IEntity`.
         """
         EntityState.set_state_data(target_entity, source_data)
+        for index in self.__iter_indexes():
+            index.update(target_entity)
+        self.__version = next(_VERSION_GEN)
+
+    def add_index(self, attr_name):
+        """
+        Adds a hash index for the given entity attribute to this cache. All
+        entities already in the cache are indexed immediately.
+
+        :param str attr_name: Name of the (non-nested) entity attribute to
+          index.
+        """
+        if not attr_name in self.__indexes:
+            self.__indexes[attr_name] = self.__make_index(HashIndex,
+                                                          attr_name)
+
+    def add_sorted_index(self, attr_name):
+        """
+        Adds a sorted index for the given entity attribute to this cache.
+        All entities already in the cache are indexed immediately.
+
+        Sorted indexes are used for ordering by the indexed attribute and for
+        evaluating range criteria (LESS_THAN, GREATER_THAN, IN_RANGE etc.).
+
+        :param str attr_name: Name of the (non-nested) entity attribute to
+          index.
+        """
+        if not attr_name in self.__sorted_indexes:
+            self.__sorted_indexes[attr_name] = \
+                        self.__make_index(SortedIndex, attr_name)
+
+    def has_index(self, attr_name):
+        """
+        Checks if this cache maintains a hash index for the given attribute.
+        """
+        return attr_name in self.__indexes
+
+    def has_sorted_index(self, attr_name):
+        """
+        Checks if this cache maintains a sorted index for the given
+        attribute.
+        """
+        return attr_name in self.__sorted_indexes
+
+    def lookup(self, attr_name, values):
+        """
+        Looks up the entities holding any of the given values in the
+        specified attribute through the hash index for that attribute.
+
+        :returns: Set of entities or `None`, if there is no index for the
+          given attribute.
+        """
+        index = self.__indexes.get(attr_name)
+        if not index is None:
+            ents = index.lookup(values)
+        else:
+            ents = None
+        return ents
+
+    def lookup_range(self, attr_name, lower=None, upper=None,
+                     lower_inclusive=True, upper_inclusive=True):
+        """
+        Looks up the entities with values in the given range in the
+        specified attribute through the sorted index for that attribute.
+
+        :returns: Set of entities or `None`, if there is no sorted index for
+          the given attribute.
+        """
+        index = self.__sorted_indexes.get(attr_name)
+        if not index is None:
+            ents = index.lookup_range(lower=lower, upper=upper,
+                                      lower_inclusive=lower_inclusive,
+                                      upper_inclusive=upper_inclusive)
+        else:
+            ents = None
+        return ents
 
     def get_all(self):
         """
         Returns the list of all entities in this cache in the order they
         were added.
         """
-        return self.__entities
+        return self.__get_entities()
 
     def retrieve(self, filter_expression=None,
                  order_expression=None, slice_key=None):
         """
         Retrieve entities from this cache, possibly after filtering, ordering
         and slicing.
+
+        If the filter expression provides an index lookup which can be
+        performed with the indexes of this cache, only the entities returned
+        by the lookup are evaluated. If the order expression sorts by a
+        single attribute with a sorted index, the entities (or the
+        candidates returned by the index lookup) are ordered by their
+        positions in the index instead of being sorted by the order
+        expression.
         """
-        ents = iter(self.__entities)
+        cands = None
         if not filter_expression is None:
-            ents = filter_expression(ents)
+            index_lookup = getattr(filter_expression, 'index_lookup', None)
+            if not index_lookup is None:
+                cands = index_lookup(self)
+        sorted_index = None
         if not order_expression is None:
-            # Ordering always involves a copy and conversion to a list, so
-            # we have to wrap in an iterator.
-            ents = iter(order_expression(ents))
+            index_order = getattr(order_expression, 'index_order', None)
+            if not index_order is None:
+                attr_name, descending = index_order
+                sorted_index = self.__sorted_indexes.get(attr_name)
+        if not cands is None:
+            if not sorted_index is None:
+                ents = iter(sorted_index.sort(cands, descending=descending))
+            else:
+                ents = iter(sorted(cands, key=self.__positions.__getitem__))
+            ents = filter_expression(ents)
+            if sorted_index is None and not order_expression is None:
+                ents, slice_key = self.__order(ents, order_expression,
+                                               slice_key)
+        elif not sorted_index is None:
+            if filter_expression is None and not descending \
+               and not slice_key is None:
+                # Only read the requested slice from the index.
+                ents = iter(sorted_index.get_slice(slice_key.start,
+                                                   slice_key.stop))
+                slice_key = None
+            else:
+                ents = sorted_index.iterator(descending=descending)
+                if not filter_expression is None:
+                    ents = filter_expression(ents)
+        else:
+            ents = iter(self.__get_entities())
+            if not filter_expression is None:
+                ents = filter_expression(ents)
+            if not order_expression is None:
+                ents, slice_key = self.__order(ents, order_expression,
+                                               slice_key)
         if not slice_key is None:
             ents = islice(ents, slice_key.start, slice_key.stop)
         return ents
 
+    def count(self, filter_expression=None, memoize=True):
+        """
+        Counts the entities in this cache matching the given filter
+        expression without building a list of them.
+
+        If the filter expression provides a cache key (cf.
+        :class:`everest.repositories.memory.querying.EvalFilterExpression`)
+        and the `memoize` flag is set, the count is memoized until the next
+        change to this cache.
+        """
+        if filter_expression is None:
+            cnt = len(self.__offsets)
+        else:
+            key = getattr(filter_expression, 'cache_key', None)
+            if key is None or not memoize:
+                cnt = self.__count(filter_expression)
+            else:
+                if self.__count_version != self.__version:
+                    self.__counts.clear()
+                    self.__count_version = self.__version
+                cnt = self.__counts.get(key)
+                if cnt is None:
+                    cnt = self.__counts[key] = self.__count(filter_expression)
+        return cnt
+
+    @property
+    def version(self):
+        """
+        Version number of the contents of this cache. A new (greater)
+        version number is assigned every time entities are added, removed,
+        replaced or updated. Version numbers are unique across all caches
+        except for copies (see :meth:`copy`) which start with the version
+        number of the cache they were copied from.
+        """
+        return self.__version
+
     def rebuild(self, entities):
         """
         Rebuilds the ID and slug maps of this cache.
@@ -141,12 +684,54 @@ class EntityCache(object):
         """
         for ent in entities:
             self.__check_new(ent)
+            if ent in self.__positions:
+                for index in self.__iter_indexes():
+                    index.update(ent)
+        self.__version = next(_VERSION_GEN)
+
+    def __order(self, entities, order_expression, slice_key):
+        # Ordering always involves a copy and conversion to a list, so we
+        # have to wrap in an iterator. Returns the ordered entities and the
+        # slice key still to apply.
+        select = getattr(order_expression, 'select', None)
+        if not (slice_key is None or select is None):
+            # Let the order expression pick the requested slice without
+            # sorting all entities if possible.
+            ents = iter(select(entities, slice_key))
+            slice_key = None
+        else:
+            ents = iter(order_expression(entities))
+        return ents, slice_key
+
+    def __count(self, filter_expression):
+        return sum(1 for _ in self.retrieve(filter_expression))
+
+    def __make_index(self, index_class, attr_name):
+        index = index_class(attr_name)
+        for ent in self.__get_entities():
+            index.add(ent, self.__positions[ent])
+        return index
+
+    def __get_entities(self):
+        # Compacts the entity list if entities were removed since it was
+        # last compacted. Removing is O(1) this way while the cost of
+        # compacting is spread over the removals preceding it.
+        if self.__num_removed > 0:
+            ents = [ent for ent in self.__entities if not ent is None]
+            self.__entities = ents
+            self.__offsets = dict((ent, idx) for (idx, ent) in enumerate(ents))
+            self.__num_removed = 0
+        return self.__entities
+
+    def __iter_indexes(self):
+        return chain(itervalues_(self.__indexes),
+                     itervalues_(self.__sorted_indexes))
 
     def __contains__(self, entity):
         if not entity.id is None:
             is_contained = entity.id in self.__id_map
         else:
-            is_contained = entity in self.__entities
+            is_contained = entity in self.__offsets
         return is_contained
 
     def __check_new(self, entity):
@@ -168,56 +753,111 @@ class EntityCache(object):
         # value of other (possibly not yet initialized) attributes which is
         # why we can not always assume it is available at this point.
         if do_append and hasattr(entity, 'slug') and not entity.slug is None:
-            ents = self.__slug_map.get(entity.slug)
-            if not ents is None:
-                ents.append(entity)
-            else:
-                self.__slug_map[entity.slug] = WeakList([entity])
+            self.__add_to_slug_list(entity.slug, entity)
         return do_append
 
+    def __add_to_slug_list(self, slug, entity):
+        ents = self.__get_slug_list(slug)
+        if not ents is None:
+            ents.append(entity)
+        else:
+            self.__slug_map[slug] = WeakList([entity])
+            self.__own_slugs.add(slug)
+
+    def __get_slug_list(self, slug):
+        # Returns the entity list for the given slug for modification,
+        # copying it first if it is shared with a copy of this cache.
+        ents = self.__slug_map.get(slug)
+        if not ents is None and not slug in self.__own_slugs:
+            ents = self.__slug_map[slug] = WeakList(ents)
+            self.__own_slugs.add(slug)
+        return ents
+
 
 class EntityCacheMap(object):
     """
     Map for entity caches.
     """
     def __init__(self):
-        self.__cache_map = defaultdict(EntityCache)
+        self.__cache_map = {}
+        # Dictionaries mapping entity classes to the names of the attributes
+        # to maintain hash and sorted indexes for, respectively.
+        self.__index_map = {}
+        self.__sorted_index_map = {}
 
     def __getitem__(self, entity_class):
-        return self.__cache_map[entity_class]
+        return self.__get_cache(entity_class)
+
+    def __setitem__(self, entity_class, cache):
+        self.__cache_map[entity_class] = cache
+
+    def copy(self):
+        """
+        Returns a copy of this cache map which shares the entity caches (and
+        the index declarations) with this map.
+        """
+        clone = EntityCacheMap()
+        clone.__cache_map = self.__cache_map.copy()
+        clone.__index_map = self.__index_map.copy()
+        clone.__sorted_index_map = self.__sorted_index_map.copy()
+        return clone
+
+    def set_indexes(self, entity_class, attr_names):
+        """
+        Declares hash indexes for the given attributes of the given entity
+        class. If the cache for the entity class already exists, the
+        indexes are added to it immediately.
+        """
+        self.__index_map[entity_class] = tuple(attr_names)
+        cache = self.__cache_map.get(entity_class)
+        if not cache is None:
+            for attr_name in attr_names:
+                cache.add_index(attr_name)
+
+    def set_sorted_indexes(self, entity_class, attr_names):
+        """
+        Declares sorted indexes for the given attributes of the given entity
+        class. If the cache for the entity class already exists, the
+        indexes are added to it immediately.
+        """
+        self.__sorted_index_map[entity_class] = tuple(attr_names)
+        cache = self.__cache_map.get(entity_class)
+        if not cache is None:
+            for attr_name in attr_names:
+                cache.add_sorted_index(attr_name)
 
     def has_key(self, entity_class):
         return entity_class in self.__cache_map
 
     def get_by_id(self, entity_class, entity_id):
-        cache = self.__cache_map[entity_class]
+        cache = self.__get_cache(entity_class)
         return cache.get_by_id(entity_id)
 
     def get_by_slug(self, entity_class, slug):
-        cache = self.__cache_map[entity_class]
+        cache = self.__get_cache(entity_class)
         return cache.get_by_slug(slug)
 
     def add(self, entity_class, entity):
-        cache = self.__cache_map[entity_class]
+        cache = self.__get_cache(entity_class)
         cache.add(entity)
 
     def remove(self, entity_class, entity):
-        cache = self.__cache_map[entity_class]
+        cache = self.__get_cache(entity_class)
         cache.remove(entity)
 
     def update(self, entity_class, source_data, target_entity):
-        cache = self.__cache_map[entity_class]
+        cache = self.__get_cache(entity_class)
         cache.update(source_data, target_entity)
 
     def query(self, entity_class):
         return MemoryQuery(entity_class,
-                           self.__cache_map[entity_class].get_all())
+                           self.__get_cache(entity_class).get_all())
 
     def __contains__(self, entity_or_entity_class):
         if isinstance(entity_or_entity_class, type):
             result = entity_or_entity_class in self.__cache_map
         else:
-            cache = self.__cache_map[type(entity_or_entity_class)]
+            cache = self.__get_cache(type(entity_or_entity_class))
             result = entity_or_entity_class in cache
         return result
 
@@ -226,3 +866,12 @@ class EntityCacheMap(object):
 
     def clear(self):
         self.__cache_map.clear()
+
+    def __get_cache(self, entity_class):
+        cache = self.__cache_map.get(entity_class)
+        if cache is None:
+            cache = EntityCache(
+                    indexes=self.__index_map.get(entity_class),
+                    sorted_indexes=self.__sorted_index_map.get(entity_class))
+            self.__cache_map[entity_class] = cache
+        return cache
@@ -0,0 +1,206 @@
+"""
+Append-only commit log for the memory repository.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from everest.compat import BytesIO
+from everest.entities.interfaces import IEntity
+from pyramid.compat import pickle
+from threading import Lock
+from threading import Timer
+import os
+import struct
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['CommitLog',
+           'EntityReference',
+           ]
+
+
+# Each record is preceded by its length as a 4 byte unsigned integer.
+_HEADER = struct.Struct('>I')
+
+
+class EntityReference(tuple):
+    """
+    Reference to an entity (by entity class and ID) in a commit log record.
+    """
+    def __new__(cls, entity_class, entity_id):
+        return tuple.__new__(cls, (entity_class, entity_id))
+
+    @property
+    def entity_class(self):
+        return self[0]
+
+    @property
+    def entity_id(self):
+        return self[1]
+
+
+class CommitLog(object):
+    """
+    Append-only log of the changes committed to a memory repository.
+
+    Each record is a pickled list of changes (cf. :meth:`append`). Entities
+    referenced in the changed data are stored as :class:`EntityReference`
+    instances which need to be resolved when the log is replayed.
+
+    Records are written to the operating system immediately, but the log
+    file is only synchronized to disk (`fsync`) at most every
+    `sync_interval` seconds; all records appended in the meantime are
+    synchronized in one batch. With a sync interval of 0, the log is
+    synchronized after each record.
+
+    Compacting the log is a two step operation: :meth:`rotate` moves the
+    current records aside and starts a new log; once a snapshot of the
+    repository data containing the rotated records has been written,
+    :meth:`discard_rotated` deletes them. Until then, :meth:`read` returns
+    the rotated records before the current ones.
+    """
+    def __init__(self, path, sync_interval=0):
+        """
+        :param str path: Path of the log file.
+        :param float sync_interval: Maximum time (in seconds) between
+          appending a record and synchronizing the log file to disk.
+        """
+        self.__path = path
+        self.__rotated_path = '%s.old' % path
+        self.__sync_interval = sync_interval
+        self.__stream = None
+        self.__sync_timer = None
+        self.__lock = Lock()
+
+    def read(self):
+        """
+        Returns an iterator over all records in the log, starting with the
+        rotated records (if any). A trailing partial record (as left behind
+        by a crash while appending) is ignored and truncated when the log
+        is opened for appending.
+        """
+        for path in (self.__rotated_path, self.__path):
+            if os.path.exists(path):
+                for record in self.__read_records(path)[0]:
+                    yield record
+
+    def open(self):
+        """
+        Opens the log for appending.
+        """
+        if os.path.exists(self.__path):
+            end = self.__read_records(self.__path)[1]
+            if end < os.path.getsize(self.__path):
+                with open(self.__path, 'r+b') as stream:
+                    stream.truncate(end)
+        self.__stream = open(self.__path, 'ab')
+
+    def close(self):
+        """
+        Synchronizes and closes the log file.
+        """
+        with self.__lock:
+            if not self.__stream is None:
+                self.__sync()
+                self.__stream.close()
+                self.__stream = None
+
+    def append(self, changes):
+        """
+        Appends a record with the given changes to the log.
+
+        :param changes: Sequence of (status, entity class, entity ID, state)
+          tuples where status is one of the
+          :class:`everest.repositories.state.ENTITY_STATUS` constants and
+          state is a dictionary mapping entity attribute names to values (or
+          `None` for deleted entities).
+        """
+        buf = BytesIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = _get_persistent_id
+        pickler.dump(list(changes))
+        data = buf.getvalue()
+        with self.__lock:
+            self.__stream.write(_HEADER.pack(len(data)) + data)
+            self.__stream.flush()
+            if self.__sync_interval > 0:
+                if self.__sync_timer is None:
+                    self.__sync_timer = Timer(self.__sync_interval,
+                                              self.sync)
+                    self.__sync_timer.daemon = True
+                    self.__sync_timer.start()
+            else:
+                os.fsync(self.__stream.fileno())
+
+    def sync(self):
+        """
+        Synchronizes the log file to disk.
+        """
+        with self.__lock:
+            if not self.__stream is None:
+                self.__sync()
+
+    def rotate(self):
+        """
+        Moves all records in the log aside and starts a new log. If there
+        are rotated records from an earlier, unfinished compaction, the
+        records are appended to them.
+        """
+        with self.__lock:
+            self.__sync()
+            self.__stream.close()
+            if os.path.exists(self.__rotated_path):
+                with open(self.__rotated_path, 'ab') as rotated_stream:
+                    with open(self.__path, 'rb') as stream:
+                        rotated_stream.write(stream.read())
+                    rotated_stream.flush()
+                    os.fsync(rotated_stream.fileno())
+                self.__stream = open(self.__path, 'wb')
+            else:
+                os.rename(self.__path, self.__rotated_path)
+                self.__stream = open(self.__path, 'ab')
+
+    def discard_rotated(self):
+        """
+        Deletes the records moved aside with :meth:`rotate`.
+        """
+        if os.path.exists(self.__rotated_path):
+            os.remove(self.__rotated_path)
+
+    def __sync(self):
+        if not self.__sync_timer is None:
+            self.__sync_timer.cancel()
+            self.__sync_timer = None
+        self.__stream.flush()
+        os.fsync(self.__stream.fileno())
+
+    def __read_records(self, path):
+        # Returns the list of complete records in the given file and the
+        # offset of the end of the last complete record.
+        with open(path, 'rb') as stream:
+            data = stream.read()
+        records = []
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            size = _HEADER.unpack_from(data, offset)[0]
+            start = offset + _HEADER.size
+            if start + size > len(data):
+                break
+            unpickler = pickle.Unpickler(BytesIO(data[start:start + size]))
+            unpickler.persistent_load = _load_persistent_id
+            records.append(unpickler.load())
+            offset = start + size
+        return records, offset
+
+
+def _get_persistent_id(obj):
+    if IEntity.providedBy(obj): # pylint: disable=E1101
+        pid = (obj.__class__, obj.id)
+    else:
+        pid = None
+    return pid
+
+
+def _load_persistent_id(pid):
+    return EntityReference(*pid)
@@ -0,0 +1,154 @@
+"""
+Lazy entity clones for the memory session.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from everest.constants import RESOURCE_ATTRIBUTE_KINDS
+from everest.entities.attributes import get_domain_class_attribute_iterator
+from threading import Lock
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['is_lazy_clone',
+           'make_lazy_clone',
+           'materialize_lazy_clone',
+           ]
+
+
+#: Name of the instance attribute holding the loader of a lazy clone.
+LOADER_ATTRIBUTE = '__everest_loader__'
+#: Name of the instance attribute holding the source of a lazy clone.
+SOURCE_ATTRIBUTE = '__everest_source__'
+
+# Attributes that can be accessed without materializing a lazy clone. Lazy
+# clones do not have an entity state ("__everest__") since they can not
+# have changes.
+_PASS_THROUGH_ATTRIBUTES = frozenset(['id', '__dict__', '__everest__',
+                                      LOADER_ATTRIBUTE, SOURCE_ATTRIBUTE])
+
+# Map entity class -> lazy clone class and lazy clone class -> entity class.
+_LAZY_CLONE_CLASSES = {}
+_ENTITY_CLASSES = {}
+# Map lazy clone class -> names of the terminal attributes which are read
+# from the source entity.
+_READ_THROUGH_ATTRIBUTES = {}
+_LAZY_CLONE_CLASSES_LOCK = Lock()
+
+
+def _get_attribute(entity, name):
+    if name in _PASS_THROUGH_ATTRIBUTES:
+        value = object.__getattribute__(entity, name)
+    elif name == '__class__':
+        # Lazy clones compare equal to their entities.
+        value = _ENTITY_CLASSES[type(entity)]
+    elif name in _READ_THROUGH_ATTRIBUTES[type(entity)]:
+        ent_dict = object.__getattribute__(entity, '__dict__')
+        source = ent_dict[SOURCE_ATTRIBUTE]
+        if callable(source):
+            source = ent_dict[SOURCE_ATTRIBUTE] = source()
+        value = getattr(source, name)
+    else:
+        materialize_lazy_clone(entity)
+        value = getattr(entity, name)
+    return value
+
+
+def _set_attribute(entity, name, value):
+    materialize_lazy_clone(entity)
+    setattr(entity, name, value)
+
+
+def _delete_attribute(entity, name):
+    materialize_lazy_clone(entity)
+    delattr(entity, name)
+
+
+def _get_lazy_clone_class(entity_class):
+    lazy_cls = _LAZY_CLONE_CLASSES.get(entity_class)
+    if lazy_cls is None:
+        with _LAZY_CLONE_CLASSES_LOCK:
+            lazy_cls = _LAZY_CLONE_CLASSES.get(entity_class)
+            if lazy_cls is None:
+                # The slug is read when the clone is added to the session
+                # cache.
+                read_through_attrs = frozenset(
+                        [attr.entity_attr for attr in
+                         get_domain_class_attribute_iterator(entity_class)
+                         if attr.kind == RESOURCE_ATTRIBUTE_KINDS.TERMINAL
+                         and not attr.entity_attr is None
+                         and not '.' in attr.entity_attr] + ['slug'])
+                # We use the metaclass of the entity class to create the
+                # lazy clone class so that the class layouts are
+                # compatible.
+                lazy_cls = type(entity_class)(
+                                'Lazy%s' % entity_class.__name__,
+                                (entity_class,),
+                                dict(__getattribute__=_get_attribute,
+                                     __setattr__=_set_attribute,
+                                     __delattr__=_delete_attribute,
+                                     __module__=entity_class.__module__))
+                _ENTITY_CLASSES[lazy_cls] = entity_class
+                _READ_THROUGH_ATTRIBUTES[lazy_cls] = read_through_attrs
+                _LAZY_CLONE_CLASSES[entity_class] = lazy_cls
+    return lazy_cls
+
+
+def make_lazy_clone(entity_class, entity_id, loader, source):
+    """
+    Creates a lazy clone of an entity of the given class with the given ID.
+
+    The lazy clone is an instance of a (dynamically created) subclass of
+    the given entity class which only holds the entity ID. Reading a
+    terminal attribute (or the slug) of the lazy clone returns the value of
+    the source entity it was cloned from. When any other attribute of the lazy clone
+    is accessed (in particular, when an attribute is set) for the first
+    time, the clone is materialized: Its class is set to the given entity
+    class and the given loader is called with the clone as the only
+    argument to copy the state of the source entity.
+
+    Entity classes without an instance dictionary (i.e., classes using
+    `__slots__`) can not be cloned lazily; for these, the loader is called
+    immediately.
+
+    :param entity_class: Entity class to create a lazy clone for.
+    :param entity_id: ID of the entity to clone.
+    :param loader: Callable initializing the state of the clone.
+    :param source: Callable without arguments returning the source entity.
+      This is called at most once, when the first terminal attribute is
+      read from the lazy clone.
+    """
+    if entity_class.__dictoffset__ == 0:
+        clone = object.__new__(entity_class)
+        clone.id = entity_id
+        loader(clone)
+    else:
+        clone = object.__new__(_get_lazy_clone_class(entity_class))
+        ent_dict = object.__getattribute__(clone, '__dict__')
+        ent_dict['id'] = entity_id
+        ent_dict[LOADER_ATTRIBUTE] = loader
+        ent_dict[SOURCE_ATTRIBUTE] = source
+    return clone
+
+
+def is_lazy_clone(entity):
+    """
+    Checks if the given entity is a lazy clone that has not been
+    materialized yet.
+    """
+    return type(entity) in _ENTITY_CLASSES
+
+
+def materialize_lazy_clone(entity):
+    """
+    Materializes the given entity if it is a lazy clone; does nothing
+    otherwise.
+    """
+    entity_class = _ENTITY_CLASSES.get(type(entity))
+    if not entity_class is None:
+        ent_dict = object.__getattribute__(entity, '__dict__')
+        loader = ent_dict.pop(LOADER_ATTRIBUTE)
+        del ent_dict[SOURCE_ATTRIBUTE]
+        object.__setattr__(entity, '__class__', entity_class)
+        loader(entity)
@@ -9,62 +9,594 @@ Created on Jan 7, 2013.
 from everest.querying.base import EXPRESSION_KINDS
 from everest.querying.base import ExpressionBuilderMixin
 from everest.querying.base import Query
+from everest.entities.interfaces import IEntity
 from everest.querying.base import RepositoryQuery
+from everest.querying.filtering import FilterSpecificationKeyVisitor
+from everest.querying.filtering import FilterSpecificationVisitor
 from everest.querying.filtering import RepositoryFilterSpecificationVisitor
 from everest.querying.interfaces import IFilterSpecificationVisitor
 from everest.querying.interfaces import IOrderSpecificationVisitor
+from everest.querying.operators import DESCENDING
+from everest.querying.ordering import OrderSpecificationKeyVisitor
 from everest.querying.ordering import RepositoryOrderSpecificationVisitor
+from everest.querying.specifications import AscendingOrderSpecification
+from everest.querying.specifications import DescendingOrderSpecification
+from everest.resources.interfaces import ICollectionResource
+from everest.resources.interfaces import IMemberResource
+from everest.resources.interfaces import IResource
 from itertools import islice
+from functools import reduce as func_reduce
+from operator import and_ as operator_and
+from operator import attrgetter
+from operator import contains as operator_contains
+from operator import eq as operator_eq
+from operator import ge as operator_ge
+from operator import gt as operator_gt
+from operator import le as operator_le
+from operator import lt as operator_lt
+from operator import or_ as operator_or
 from zope.interface import implementer # pylint: disable=E0611,F0401
-import functools
+import heapq
 
 __docformat__ = 'reStructuredText en'
-__all__ = ['EvalFilterExpression',
+__all__ = ['ConjunctionIndexLookup',
+           'DisjunctionIndexLookup',
+           'EvalFilterExpression',
            'EvalOrderExpression',
+           'FilterSpecificationCompiler',
+           'IndexLookup',
            'MemoryQuery',
            'MemoryRepositoryQuery',
            'ObjectFilterSpecificationVisitor',
            'ObjectOrderSpecificationVisitor',
+           'RangeIndexLookup',
+           'ValueIndexLookup',
            ]
 
 
+#: Marker for lazily built attributes which have not been built yet.
+_NOT_BUILT = object()
+
+
+class IndexLookup(object):
+    """
+    Abstract base class for index lookups.
+
+    An index lookup is a plan for obtaining candidate entities for a filter
+    expression from the indexes of an entity cache. The candidates are a
+    superset of the entities satisfying the filter; the filter still needs
+    to be applied to them.
+    """
+    def __call__(self, cache):
+        """
+        Performs the lookup in the given entity cache.
+
+        :param cache: Entity cache to perform the lookup in.
+        :type cache: :class:`everest.repositories.memory.cache.EntityCache`
+        :returns: Set of candidate entities or `None`, if the cache does not
+          provide a suitable index.
+        """
+        raise NotImplementedError('Abstract method.')
+
+    def __and__(self, other):
+        return ConjunctionIndexLookup(self, other)
+
+    def __or__(self, other):
+        return DisjunctionIndexLookup(self, other)
+
+
+class ValueIndexLookup(IndexLookup):
+    """
+    Lookup of the entities holding any of the given values in the given
+    attribute.
+    """
+    def __init__(self, attr_name, values):
+        IndexLookup.__init__(self)
+        self.attr_name = attr_name
+        self.values = values
+
+    def __call__(self, cache):
+        return cache.lookup(self.attr_name, self.values)
+
+
+class RangeIndexLookup(IndexLookup):
+    """
+    Lookup of the entities holding a value within the given range in the
+    given attribute.
+    """
+    def __init__(self, attr_name, lower=None, upper=None,
+                 lower_inclusive=True, upper_inclusive=True):
+        IndexLookup.__init__(self)
+        self.attr_name = attr_name
+        self.lower = lower
+        self.upper = upper
+        self.lower_inclusive = lower_inclusive
+        self.upper_inclusive = upper_inclusive
+
+    def __call__(self, cache):
+        return cache.lookup_range(self.attr_name,
+                                  lower=self.lower, upper=self.upper,
+                                  lower_inclusive=self.lower_inclusive,
+                                  upper_inclusive=self.upper_inclusive)
+
+
+class ConjunctionIndexLookup(IndexLookup):
+    """
+    Intersection of two index lookups. If only one of the two lookups can be
+    performed, its result is used.
+    """
+    def __init__(self, left, right):
+        IndexLookup.__init__(self)
+        self.left = left
+        self.right = right
+
+    def __call__(self, cache):
+        left_cands = self.left(cache)
+        right_cands = self.right(cache)
+        if left_cands is None:
+            cands = right_cands
+        elif right_cands is None:
+            cands = left_cands
+        else:
+            cands = left_cands & right_cands
+        return cands
+
+
+class DisjunctionIndexLookup(IndexLookup):
+    """
+    Union of two index lookups. Both lookups need to be possible to produce
+    a result.
+    """
+    def __init__(self, left, right):
+        IndexLookup.__init__(self)
+        self.left = left
+        self.right = right
+
+    def __call__(self, cache):
+        left_cands = self.left(cache)
+        if left_cands is None:
+            cands = None
+        else:
+            right_cands = self.right(cache)
+            if right_cands is None:
+                cands = None
+            else:
+                cands = left_cands | right_cands
+        return cands
+
+
 class EvalFilterExpression(object):
     """
     Evaluation filter expression.
+
+    Optionally holds an index lookup (cf. :class:`IndexLookup`) which
+    allows entity caches to narrow down the entities to evaluate.
     """
-    def __init__(self, spec):
+    def __init__(self, spec, index_lookup=None, resolve=None):
         self.__spec = spec
+        self.__index_lookup = index_lookup
+        self.__resolve = resolve
+        self.__predicate = None
+        self.__cache_key = _NOT_BUILT
 
     def __call__(self, entities):
-        return self.__evaluator(self.__spec, entities)
+        return self.__evaluator(entities)
 
     def __and__(self, other):
-        return EvalFilterExpression(self.__spec & other.__spec) # pylint: disable=W0212
+        if self.__index_lookup is None:
+            index_lookup = other.index_lookup
+        elif other.index_lookup is None:
+            index_lookup = self.__index_lookup
+        else:
+            index_lookup = self.__index_lookup & other.index_lookup
+        return EvalFilterExpression(self.__spec & other.__spec, # pylint: disable=W0212
+                                    index_lookup=index_lookup)
 
     def __or__(self, other):
-        return EvalFilterExpression(self.__spec | other.__spec) # pylint: disable=W0212
+        if self.__index_lookup is None or other.index_lookup is None:
+            index_lookup = None
+        else:
+            index_lookup = self.__index_lookup | other.index_lookup
+        return EvalFilterExpression(self.__spec | other.__spec, # pylint: disable=W0212
+                                    index_lookup=index_lookup)
 
     def __invert__(self):
         return EvalFilterExpression(~self.__spec)
 
-    @staticmethod
-    def __evaluator(spec, entities):
-        return (ent for ent in entities if spec.is_satisfied_by(ent))
+    def bind(self, resolve):
+        """
+        Returns a copy of this expression which reads nested attributes
+        (e.g., "parent.text") from the related entities returned by the
+        given callable.
+
+        Memory repositories use this to evaluate nested attributes against
+        the version of the related entities which the query reads.
+
+        :param resolve: Callable taking a related entity and returning the
+          entity to read the next attribute from.
+        """
+        expr = EvalFilterExpression(self.__spec,
+                                    index_lookup=self.__index_lookup,
+                                    resolve=resolve)
+        expr.__cache_key = self.__cache_key
+        return expr
+
+    @property
+    def spec(self):
+        """
+        The filter specification evaluated by this expression.
+        """
+        return self.__spec
+
+    @property
+    def index_lookup(self):
+        """
+        The index lookup for this expression or `None`.
+        """
+        return self.__index_lookup
+
+    @property
+    def cache_key(self):
+        """
+        Normalized, hashable key for the filter specification of this
+        expression (see
+        :class:`everest.querying.filtering.FilterSpecificationKeyVisitor`)
+        or `None` if no key can be built for it. The key is built on first
+        access.
+        """
+        if self.__cache_key is _NOT_BUILT:
+            self.__cache_key = FilterSpecificationKeyVisitor.make_key(
+                                                                self.__spec)
+        return self.__cache_key
+
+    @property
+    def predicate(self):
+        """
+        The predicate compiled from the filter specification of this
+        expression (see :class:`FilterSpecificationCompiler`). The
+        specification is compiled on first access.
+        """
+        if self.__predicate is None:
+            self.__predicate = FilterSpecificationCompiler.compile(
+                                                self.__spec,
+                                                resolve=self.__resolve)
+        return self.__predicate
+
+    def __evaluator(self, entities):
+        predicate = self.predicate
+        return (ent for ent in entities if predicate(ent))
+
+
+class FilterSpecificationCompiler(FilterSpecificationVisitor):
+    """
+    Filter specification visitor compiling a filter specification tree into
+    a single predicate function taking an entity as the only argument.
+
+    Compared to calling :meth:`is_satisfied_by` on the specification for
+    each entity, the compiled predicate
+     * resolves the attribute getter for each criterion only once;
+     * converts resource criterion values to entities (or to sets of entity
+       IDs for collection resources) only once;
+     * flattens nested conjunctions and disjunctions and short-circuits
+       their evaluation.
+    """
+    def __init__(self, resolve=None):
+        FilterSpecificationVisitor.__init__(self)
+        self.__resolve = resolve
+
+    @classmethod
+    def compile(cls, spec, resolve=None):
+        """
+        Compiles the given filter specification into a predicate.
+
+        :param resolve: Optional callable taking an entity and returning the
+          entity to read nested attributes from (see
+          :meth:`EvalFilterExpression.bind`).
+        """
+        vst = cls(resolve=resolve)
+        spec.accept(vst)
+        return vst.expression
+
+    def _conjunction_op(self, spec, *expressions):
+        predicates = self.__flatten(expressions, _all_of)
+        if len(predicates) == 2:
+            left, right = predicates
+            predicate = lambda ent: left(ent) and right(ent)
+        else:
+            predicate = lambda ent: all(pred(ent) for pred in predicates)
+        return _all_of(predicate, predicates)
+
+    def _disjunction_op(self, spec, *expressions):
+        predicates = self.__flatten(expressions, _any_of)
+        if len(predicates) == 2:
+            left, right = predicates
+            predicate = lambda ent: left(ent) or right(ent)
+        else:
+            predicate = lambda ent: any(pred(ent) for pred in predicates)
+        return _any_of(predicate, predicates)
+
+    def _negation_op(self, spec, expression):
+        return lambda ent: not expression(ent)
+
+    def _starts_with_op(self, spec):
+        return self.__make_predicate(spec, spec.operator.apply)
+
+    def _ends_with_op(self, spec):
+        return self.__make_predicate(spec, spec.operator.apply)
+
+    def _contains_op(self, spec):
+        return self.__make_predicate(spec, operator_contains)
+
+    def _contained_op(self, spec):
+        value = spec.attr_value
+        if ICollectionResource.providedBy(value): # pylint: disable=E1101
+            ids = set(mb.id for mb in value)
+            getter = self.__make_getter(spec.attr_name)
+            predicate = lambda ent: _get_id(getter(ent)) in ids
+        else:
+            values = [self.__convert_value(val) for val in value]
+            op_func = operator_contains
+            if not any(IEntity.providedBy(val) for val in values): # pylint: disable=E1101
+                try:
+                    values = frozenset(values)
+                except TypeError:
+                    pass
+                else:
+                    op_func = _contains_hashable
+            predicate = self.__make_predicate(spec, op_func,
+                                              value=values,
+                                              swap_arguments=True)
+        return predicate
+
+    def _equal_to_op(self, spec):
+        return self.__make_predicate(spec, operator_eq)
+
+    def _less_than_op(self, spec):
+        return self.__make_predicate(spec, operator_lt)
+
+    def _less_than_or_equal_to_op(self, spec):
+        return self.__make_predicate(spec, operator_le)
+
+    def _greater_than_op(self, spec):
+        return self.__make_predicate(spec, operator_gt)
+
+    def _greater_than_or_equal_to_op(self, spec):
+        return self.__make_predicate(spec, operator_ge)
+
+    def _in_range_op(self, spec):
+        getter = self.__make_getter(spec.attr_name)
+        from_value = self.__convert_value(spec.from_value)
+        to_value = self.__convert_value(spec.to_value)
+        return lambda ent: from_value <= getter(ent) <= to_value
+
+    def __make_predicate(self, spec, op_func, value=None,
+                         swap_arguments=False):
+        getter = self.__make_getter(spec.attr_name)
+        if value is None:
+            value = self.__convert_value(spec.attr_value)
+        if swap_arguments:
+            predicate = lambda ent: op_func(value, getter(ent))
+        else:
+            predicate = lambda ent: op_func(getter(ent), value)
+        return predicate
+
+    def __make_getter(self, attr_name):
+        if not '.' in attr_name:
+            getter = attrgetter(attr_name)
+        else:
+            # Nested attributes evaluate to None if any of the intermediate
+            # values is None (cf. :func:`everest.utils.get_nested_attribute`).
+            tokens = attr_name.split('.')
+            parent_getters = [attrgetter(token) for token in tokens[:-1]]
+            value_getter = attrgetter(tokens[-1])
+            resolve = self.__resolve
+            def getter(obj):
+                for parent_getter in parent_getters:
+                    obj = parent_getter(obj)
+                    if obj is None:
+                        return None
+                    if not resolve is None:
+                        obj = resolve(obj)
+                return value_getter(obj)
+        return getter
+
+    def __convert_value(self, value):
+        if IMemberResource.providedBy(value): # pylint: disable=E1101
+            value = value.get_entity()
+        elif ICollectionResource.providedBy(value): # pylint: disable=E1101
+            value = value.get_aggregate()
+        return value
+
+    def __flatten(self, expressions, kind):
+        predicates = []
+        for expr in expressions:
+            if getattr(expr, 'kind', None) is kind:
+                predicates.extend(expr.predicates)
+            else:
+                predicates.append(expr)
+        return predicates
+
+
+def _all_of(predicate, predicates):
+    # Marks the given predicate as a conjunction of the given predicates.
+    predicate.kind = _all_of
+    predicate.predicates = predicates
+    return predicate
+
+
+def _any_of(predicate, predicates):
+    # Marks the given predicate as a disjunction of the given predicates.
+    predicate.kind = _any_of
+    predicate.predicates = predicates
+    return predicate
+
+
+def _contains_hashable(values, value):
+    # Membership test for a set of values. Unhashable values (e.g., lists)
+    # can not be in the set.
+    try:
+        is_contained = value in values
+    except TypeError:
+        is_contained = False
+    return is_contained
+
+
+def _get_id(entity):
+    return None if entity is None else entity.id
 
 
 class EvalOrderExpression(object):
     """
     Evaluation order expression.
     """
-    def __init__(self, spec):
+    #: If the stop index of a requested slice is no larger than this
+    #: fraction of the number of entities to order, :meth:`select` uses a
+    #: bounded heap instead of a full sort.
+    partial_sort_fraction = 0.25
+
+    def __init__(self, spec, resolve=None):
         self.__spec = spec
+        self.__resolve = resolve
+        self.__cache_key = _NOT_BUILT
+        self.__key_function = None
 
     def __call__(self, entities):
-        return sorted(entities, key=functools.cmp_to_key(self.__spec.cmp))
+        # The sort key of each entity is computed exactly once. If all key
+        # elements sort in the same direction, a single sort on the full
+        # key tuple suffices; otherwise, we perform one stable sort pass for
+        # each run of key elements sharing a direction, starting with the
+        # least significant run.
+        get_key = self.__get_key_function()
+        descending = self.__spec.key_descending
+        if all(descending) or not any(descending):
+            res = sorted(entities, key=get_key, reverse=descending[0])
+        else:
+            decorated = [(get_key(ent), ent) for ent in entities]
+            for start, stop, reverse in reversed(self.__get_runs(descending)):
+                decorated.sort(key=lambda item, start=start, stop=stop:
+                                            item[0][start:stop],
+                               reverse=reverse)
+            res = [item[1] for item in decorated]
+        return res
+
+    def select(self, entities, slice_key):
+        """
+        Orders the given entities and returns the given slice of the result
+        as a list.
+
+        If the slice is small compared to the number of entities and all
+        sort key elements share the same direction, only the first entities
+        up to the stop index of the slice are selected with a bounded heap;
+        otherwise, all entities are sorted.
+        """
+        ents = list(entities)
+        stop = slice_key.stop
+        descending = self.__spec.key_descending
+        if stop is None \
+           or stop > len(ents) * self.partial_sort_fraction \
+           or (any(descending) and not all(descending)):
+            ordered = self(ents)
+        else:
+            select_func = heapq.nlargest if descending[0] else heapq.nsmallest
+            ordered = select_func(stop, ents,
+                                  key=self.__get_key_function())
+        return ordered[slice_key]
 
     def __and__(self, other):
         return EvalOrderExpression(self.__spec & other.__spec) # pylint: disable=W0212
 
+    def bind(self, resolve):
+        """
+        Returns a copy of this expression which reads nested attributes
+        from the related entities returned by the given callable (see
+        :meth:`EvalFilterExpression.bind`).
+        """
+        expr = EvalOrderExpression(self.__spec, resolve=resolve)
+        expr.__cache_key = self.__cache_key
+        return expr
+
+    @property
+    def spec(self):
+        """
+        The order specification evaluated by this expression.
+        """
+        return self.__spec
+
+    @property
+    def cache_key(self):
+        """
+        Normalized, hashable key for the order specification of this
+        expression (see
+        :class:`everest.querying.ordering.OrderSpecificationKeyVisitor`)
+        or `None` if no key can be built for it. The key is built on first
+        access.
+        """
+        if self.__cache_key is _NOT_BUILT:
+            self.__cache_key = OrderSpecificationKeyVisitor.make_key(
+                                                                self.__spec)
+        return self.__cache_key
+
+    @property
+    def index_order(self):
+        """
+        If this expression orders by the plain value of a single
+        (non-nested) attribute, a tuple holding the attribute name and a
+        flag indicating descending order; `None` otherwise. Entity caches
+        use this to read ordered entities from a sorted index.
+        """
+        spec = self.__spec
+        if isinstance(spec, (AscendingOrderSpecification,
+                             DescendingOrderSpecification)) \
+           and not '.' in spec.attr_name:
+            index_order = (spec.attr_name,
+                           spec.operator is DESCENDING)
+        else:
+            index_order = None
+        return index_order
+
+    def __get_key_function(self):
+        if self.__key_function is None:
+            get_key = self.__spec.get_key
+            resolve = self.__resolve
+            if not resolve is None:
+                # The key visitor lists all order attribute names.
+                vst = OrderSpecificationKeyVisitor()
+                self.__spec.accept(vst)
+                if any('.' in attr_name
+                       for (_, attr_name) in vst.expression):
+                    spec_get_key = get_key
+                    get_key = lambda ent: spec_get_key(
+                                            _ResolvingEntityView(ent, resolve))
+            self.__key_function = get_key
+        return self.__key_function
+
+    @staticmethod
+    def __get_runs(descending):
+        runs = []
+        start = 0
+        for idx in range(1, len(descending) + 1):
+            if idx == len(descending) or descending[idx] != descending[start]:
+                runs.append((start, idx, descending[start]))
+                start = idx
+        return runs
+
+
+class _ResolvingEntityView(object):
+    # Read-only view of an entity which returns views of the related
+    # entities returned by the given callable for member attributes.
+    __slots__ = ('__entity', '__resolve')
+
+    def __init__(self, entity, resolve):
+        self.__entity = entity
+        self.__resolve = resolve
+
+    def __getattr__(self, name):
+        value = getattr(self.__entity, name)
+        if IEntity.providedBy(value): # pylint: disable=E1101
+            value = _ResolvingEntityView(self.__resolve(value),
+                                         self.__resolve)
+        return value
+
 
 class EvalExpressionBuilderMixin(ExpressionBuilderMixin):
     """
@@ -89,8 +621,11 @@ class MemoryQuery(EvalExpressionBuilderMixin, Query):
         if not self._order_expr is None:
             # Ordering always involves a copy and conversion to a list, so
             # we have to wrap in an iterator.
-            ents = iter(self._order_expr(ents))
-        if not self._slice_key is None:
+            if not self._slice_key is None:
+                ents = iter(self._order_expr.select(ents, self._slice_key))
+            else:
+                ents = iter(self._order_expr(ents))
+        elif not self._slice_key is None:
             ents = islice(ents, self._slice_key.start, self._slice_key.stop)
         return ents
 
@@ -98,14 +633,39 @@ class MemoryQuery(EvalExpressionBuilderMixin, Query):
         ents = iter(self.__entities)
         if not self._filter_expr is None:
             ents = self._filter_expr(ents)
-        return len(list(ents))
+        return sum(1 for _ in ents)
 
 
 class MemoryRepositoryQuery(EvalExpressionBuilderMixin, RepositoryQuery):
     """
     Query operating on objects kept in a memory repository.
     """
-    pass
+    def __iter__(self):
+        repo_ents = self._repository.retrieve(
+                                        self._entity_class,
+                                        filter_expression=self._filter_expr,
+                                        order_expression=self._order_expr,
+                                        slice_key=self._slice_key,
+                                        memoize=self.__can_memoize(),
+                                        unit_of_work=
+                                            self._session.unit_of_work
+                                        )
+        for repo_ent in repo_ents:
+            yield self._session.load(self._entity_class, repo_ent)
+
+    def count(self):
+        return self._repository.count(self._entity_class,
+                                      filter_expression=self._filter_expr,
+                                      memoize=self.__can_memoize(),
+                                      unit_of_work=self._session.unit_of_work)
+
+    def __can_memoize(self):
+        # NEW entities are shared between the session and the repository
+        # after they have been flushed, so changes to them bypass the entity
+        # cache. We therefore only use memoized results if the session does
+        # not hold NEW entities of the queried class.
+        return not any(isinstance(ent, self._entity_class)
+                       for ent in self._session.new)
 
 
 @implementer(IFilterSpecificationVisitor)
@@ -113,12 +673,27 @@ class ObjectFilterSpecificationVisitor(RepositoryFilterSpecificationVisitor):
     """
     Filter specification visitor building an evaluator for in-memory
     filtering.
+
+    For EQUAL_TO and CONTAINED criteria on plain (non-nested) attributes,
+    the built expressions carry an index lookup which entity caches with
+    a matching hash index use to avoid a full scan.
     """
     def _conjunction_op(self, spec, *expressions):
-        return EvalFilterExpression(spec)
+        lookups = [expr.index_lookup for expr in expressions
+                   if not expr.index_lookup is None]
+        if len(lookups) > 0:
+            index_lookup = func_reduce(operator_and, lookups)
+        else:
+            index_lookup = None
+        return EvalFilterExpression(spec, index_lookup=index_lookup)
 
     def _disjunction_op(self, spec, *expressions):
-        return EvalFilterExpression(spec)
+        lookups = [expr.index_lookup for expr in expressions]
+        if not None in lookups:
+            index_lookup = func_reduce(operator_or, lookups)
+        else:
+            index_lookup = None
+        return EvalFilterExpression(spec, index_lookup=index_lookup)
 
     def _negation_op(self, spec, expression):
         return EvalFilterExpression(spec)
@@ -133,25 +708,67 @@ class ObjectFilterSpecificationVisitor(RepositoryFilterSpecificationVisitor):
         return EvalFilterExpression(spec)
 
     def _contained_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_index_lookup(spec.attr_name, spec.attr_value)
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _equal_to_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_index_lookup(spec.attr_name, [spec.attr_value])
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _less_than_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_range_index_lookup(spec.attr_name,
+                                                upper=spec.attr_value,
+                                                upper_inclusive=False)
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _less_than_or_equal_to_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_range_index_lookup(spec.attr_name,
+                                                upper=spec.attr_value)
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _greater_than_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_range_index_lookup(spec.attr_name,
+                                                lower=spec.attr_value,
+                                                lower_inclusive=False)
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _greater_than_or_equal_to_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_range_index_lookup(spec.attr_name,
+                                                lower=spec.attr_value)
+        return EvalFilterExpression(spec, index_lookup=lookup)
 
     def _in_range_op(self, spec):
-        return EvalFilterExpression(spec)
+        lookup = self.__make_range_index_lookup(spec.attr_name,
+                                                lower=spec.from_value,
+                                                upper=spec.to_value)
+        return EvalFilterExpression(spec, index_lookup=lookup)
+
+    def __make_range_index_lookup(self, attr_name, lower=None, upper=None,
+                                  lower_inclusive=True, upper_inclusive=True):
+        # Resources can not be used as range bounds. Note that a bound of
+        # None means "unbounded" which yields a superset of the candidates.
+        if '.' in attr_name \
+           or IResource.providedBy(lower) or IResource.providedBy(upper): # pylint: disable=E1101
+            lookup = None
+        else:
+            lookup = RangeIndexLookup(attr_name, lower=lower, upper=upper,
+                                      lower_inclusive=lower_inclusive,
+                                      upper_inclusive=upper_inclusive)
+        return lookup
+
+    def __make_index_lookup(self, attr_name, attr_values):
+        # Nested attributes can not be indexed (the index would not notice
+        # changes to the intermediate objects).
+        if '.' in attr_name:
+            return None
+        values = []
+        for attr_value in attr_values:
+            if IMemberResource.providedBy(attr_value): # pylint: disable=E1101
+                attr_value = attr_value.get_entity()
+            elif ICollectionResource.providedBy(attr_value): # pylint: disable=E1101
+                return None
+            values.append(attr_value)
+        return ValueIndexLookup(attr_name, values)
 
 
 @implementer(IOrderSpecificationVisitor)
@@ -161,13 +778,10 @@ class ObjectOrderSpecificationVisitor(RepositoryOrderSpecificationVisitor):
     ordering.
     """
     def _conjunction_op(self, spec, *expressions):
-        return lambda entities: sorted(entities,
-                                       key=functools.cmp_to_key(spec.cmp))
+        return EvalOrderExpression(spec)
 
     def _asc_op(self, spec):
-        return lambda entities: sorted(entities,
-                                       key=functools.cmp_to_key(spec.cmp))
+        return EvalOrderExpression(spec)
 
     def _desc_op(self, spec):
-        return lambda entities: sorted(entities,
-                                       key=functools.cmp_to_key(spec.cmp))
+        return EvalOrderExpression(spec)
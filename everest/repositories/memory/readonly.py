@@ -0,0 +1,157 @@
+"""
+Read-only entity proxies for the read-only memory session.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from collections import MutableSet
+from everest.constants import RESOURCE_ATTRIBUTE_KINDS
+from everest.entities.attributes import get_domain_class_attribute_iterator
+from everest.exceptions import UnsupportedOperationException
+from threading import Lock
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['ReadOnlyList',
+           'is_read_only_proxy',
+           'make_read_only_proxy',
+           ]
+
+
+# Map entity class -> read-only proxy class and proxy class -> entity class.
+_PROXY_CLASSES = {}
+_ENTITY_CLASSES = {}
+_PROXY_CLASSES_LOCK = Lock()
+
+
+class ReadOnlyList(list):
+    """
+    List of read-only entity proxies which raises an
+    :class:`everest.exceptions.UnsupportedOperationException` on every
+    attempt to change it.
+    """
+    def __raise_read_only(self, *args, **kw): # pylint: disable=W0613
+        raise UnsupportedOperationException('Can not change entities loaded '
+                                            'in a read-only session.')
+
+    append = extend = insert = remove = pop = sort = reverse = \
+        __setitem__ = __delitem__ = __iadd__ = __imul__ = \
+        __setslice__ = __delslice__ = __raise_read_only
+
+
+def _raise_read_only(proxy, name, *args): # pylint: disable=W0613
+    raise UnsupportedOperationException('Can not change attribute "%s" of '
+                                        'entity %s loaded in a read-only '
+                                        'session.' % (name, proxy))
+
+
+def _make_read_only_value(value, is_collection, resolve):
+    if value is None:
+        pass
+    elif not is_collection:
+        value = make_read_only_proxy(value, resolve=resolve)
+    elif isinstance(value, (MutableSet, frozenset)):
+        value = frozenset([make_read_only_proxy(item, resolve=resolve)
+                           for item in value])
+    else:
+        value = ReadOnlyList([make_read_only_proxy(item, resolve=resolve)
+                              for item in value])
+    return value
+
+
+def _make_reference_property(entity_class, name, is_collection):
+    # Returns a property reading the given member or collection attribute
+    # of the entity class from a proxy and returning read-only value(s).
+    descr = None
+    for cls in entity_class.__mro__:
+        if name in cls.__dict__:
+            descr = cls.__dict__[name]
+            break
+    if not hasattr(descr, '__set__'):
+        # Plain class attribute (default value) or non-data descriptor;
+        # the instance dictionary takes precedence.
+        def fget(proxy):
+            try:
+                value = proxy.__dict__[name]
+            except KeyError:
+                value = getattr(entity_class, name)
+            return _make_read_only_value(value, is_collection,
+                                         proxy._everest_resolve)
+    else:
+        def fget(proxy):
+            return _make_read_only_value(descr.__get__(proxy, entity_class),
+                                         is_collection,
+                                         proxy._everest_resolve)
+    return property(fget)
+
+
+def _get_proxy_class(entity_class):
+    proxy_cls = _PROXY_CLASSES.get(entity_class)
+    if proxy_cls is None:
+        with _PROXY_CLASSES_LOCK:
+            proxy_cls = _PROXY_CLASSES.get(entity_class)
+            if proxy_cls is None:
+                ns = dict(__slots__=('_everest_resolve',),
+                          __setattr__=_raise_read_only,
+                          __delattr__=_raise_read_only,
+                          # Entities compare equal to proxies for the same
+                          # entity (cf. :meth:`Entity.__eq__`).
+                          __class__=property(lambda proxy: entity_class),
+                          __module__=entity_class.__module__)
+                for attr in get_domain_class_attribute_iterator(
+                                                            entity_class):
+                    name = attr.entity_attr
+                    if attr.kind != RESOURCE_ATTRIBUTE_KINDS.TERMINAL \
+                       and not name is None and not '.' in name:
+                        is_coll = \
+                            attr.kind == RESOURCE_ATTRIBUTE_KINDS.COLLECTION
+                        ns[name] = _make_reference_property(entity_class,
+                                                            name, is_coll)
+                # We use the metaclass of the entity class to create the
+                # proxy class so that the class layouts are compatible.
+                proxy_cls = type(entity_class)(
+                                    'ReadOnly%s' % entity_class.__name__,
+                                    (entity_class,), ns)
+                _ENTITY_CLASSES[proxy_cls] = entity_class
+                _PROXY_CLASSES[entity_class] = proxy_cls
+    return proxy_cls
+
+
+def make_read_only_proxy(entity, resolve=None):
+    """
+    Returns a read-only proxy for the given entity.
+
+    The proxy is an instance of a (dynamically created) subclass of the
+    entity class which shares the instance dictionary of the given entity,
+    so reading terminal attributes is as fast as reading them from the
+    entity itself. Member and collection attributes return read-only
+    proxies for the referenced entities (collections are returned as
+    :class:`ReadOnlyList` or `frozenset` instances). Setting or deleting an
+    attribute of the proxy raises an
+    :class:`everest.exceptions.UnsupportedOperationException`.
+
+    Entity classes without an instance dictionary (i.e., classes using
+    `__slots__`) are not supported.
+
+    :param entity: Entity to create a read-only proxy for.
+    :param resolve: Optional callable returning the version of a referenced
+      entity the proxy should share its state with. This is passed on to
+      the proxies for referenced entities.
+    """
+    if is_read_only_proxy(entity):
+        proxy = entity
+    else:
+        if not resolve is None:
+            entity = resolve(entity)
+        proxy = object.__new__(_get_proxy_class(type(entity)))
+        object.__setattr__(proxy, '__dict__', entity.__dict__)
+        object.__setattr__(proxy, '_everest_resolve', resolve)
+    return proxy
+
+
+def is_read_only_proxy(entity):
+    """
+    Checks if the given entity is a read-only proxy.
+    """
+    return type(entity) in _ENTITY_CLASSES
@@ -6,28 +6,123 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jan 7, 2013.
 """
+from everest.entities.attributes import get_domain_class_attribute_iterator
 from everest.entities.utils import get_entity_class
 from everest.entities.utils import new_entity_id
 from everest.repositories.base import Repository
 from everest.repositories.memory.aggregate import MemoryAggregate
 from everest.repositories.memory.cache import EntityCacheMap
+from everest.repositories.memory.commitlog import CommitLog
+from everest.repositories.memory.commitlog import EntityReference
 from everest.repositories.memory.session import MemorySessionFactory
+from everest.repositories.memory.snapshot import SnapshotLoader
+from everest.repositories.memory.snapshot import SnapshotScheduler
+from everest.repositories.memory.snapshot import write_snapshot
 from everest.repositories.state import ENTITY_STATUS
-from threading import RLock
+from everest.repositories.state import EntityState
+from everest.repositories.utils import QueryResultCache
+from everest.repositories.utils import StripedLock
+from copy import copy
+from functools import partial
+from pyramid.compat import iteritems_
+from threading import Lock
+from threading import local
+from weakref import WeakKeyDictionary
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['MemoryRepository',
            ]
 
 
+class _Branch(object):
+    """
+    Private version of the repository data for a unit of work.
+    """
+    def __init__(self, cache_map):
+        #: The version of the repository caches that was current when the
+        #: branch was created.
+        self.cache_map = cache_map
+        #: Maps entity classes to private copies of their caches.
+        self.caches = {}
+
+
 class MemoryRepository(Repository):
     """
     A repository that caches entities in memory.
+
+    The following options can be configured:
+
+    cache_loader
+        Callable returning the initial entities for a given entity class.
+        Defaults to a
+        :class:`everest.repositories.memory.snapshot.SnapshotLoader` if a
+        snapshot path is configured.
+    cache_indexes
+        Dictionary mapping registered resources to sequences of entity
+        attribute names for which the entity cache should maintain hash
+        indexes. Filter expressions with EQUAL_TO and CONTAINED criteria on
+        indexed attributes are evaluated without a full scan of the cache.
+    cache_sorted_indexes
+        Dictionary mapping registered resources to sequences of entity
+        attribute names for which the entity cache should maintain sorted
+        indexes. Ordering by a single indexed attribute and range criteria
+        (LESS_THAN, GREATER_THAN, IN_RANGE etc.) on indexed attributes are
+        evaluated by walking the index.
+    query_cache_size
+        Maximum number of filtered or ordered query results (lists of entity
+        IDs) to keep in the query result cache (see :attr:`query_cache`).
+        The cached results for an entity class are discarded whenever
+        changes to entities of that class are flushed or rolled back. Set
+        this to 0 to disable the query result cache.
+    snapshot_path
+        Path of the file to write snapshots of the cached entities to (see
+        :meth:`write_snapshot`). Unless another cache loader is
+        configured, the entities are restored from this file on startup.
+    snapshot_interval
+        Time (in seconds) between two snapshots written automatically in a
+        background thread. Automatic snapshots are disabled if this is not
+        set or no snapshot path is configured.
+    commit_log_path
+        Path of the append-only commit log file (see
+        :class:`everest.repositories.memory.commitlog.CommitLog`). If this
+        is set, the changes made by each commit are appended to the log as
+        one record and the log is replayed on top of the entities returned
+        by the cache loader on startup. Writing a snapshot to the configured
+        snapshot path compacts the log.
+    commit_log_sync_interval
+        Maximum time (in seconds) between committing changes and
+        synchronizing the commit log file to disk. Commits within this
+        interval are synchronized in one batch; set this to 0 to
+        synchronize after every commit. Defaults to 0.1 seconds.
+
+    The cached data are versioned (multi-version concurrency control): A
+    unit of work reads from the version of the entity caches that was
+    current when it first accessed the repository and flushes its changes
+    to private copies of the affected caches. Committing publishes a new
+    version which shares the caches of all entity classes without changes
+    and all unchanged entities with the previous version; changed entities
+    are replaced with updated copies rather than being modified in place.
+    Readers therefore neither block writers nor see partially applied
+    units of work, and old versions are garbage collected once no unit of
+    work references them any longer. Publishing changes holds a lock for
+    each affected entity class (see :attr:`lock`); if another unit of
+    work published changes to one of these classes in the meantime, the
+    changes are re-applied to the current version, failing if the same
+    entity was changed by both units of work.
+
+    Published entities are never modified, including their relationship
+    attributes: A cached entity keeps referencing the version of a related
+    entity that was current when the referencing entity was published. All
+    readers therefore look up related entities by ID in the version they
+    read (see :meth:`resolve`); sessions do this when they load related
+    entities and queries when they evaluate nested attributes such as
+    "parent.text".
     """
     _configurables = Repository._configurables \
-                     + ['cache_loader']
-
-    lock = RLock()
+                     + ['cache_loader', 'cache_indexes',
+                        'cache_sorted_indexes', 'query_cache_size',
+                        'snapshot_path', 'snapshot_interval',
+                        'commit_log_path', 'commit_log_sync_interval']
 
     def __init__(self, name, aggregate_class=None,
                  join_transaction=False, autocommit=False):
@@ -36,94 +131,554 @@ class MemoryRepository(Repository):
         Repository.__init__(self, name, aggregate_class,
                             join_transaction=join_transaction,
                             autocommit=autocommit)
+        # The current version of the entity caches.
         self.__cache_map = EntityCacheMap()
-        # By default, we do not use a cache loader.
-        self.configure(cache_loader=None)
+        # Maps units of work to their private branches.
+        self.__branches = WeakKeyDictionary()
+        self.__query_cache = None
+        self.__snapshot_scheduler = None
+        self.__snapshot_lock = Lock()
+        self.__commit_log = None
+        self.__lock = StripedLock()
+        self.__publish_lock = Lock()
+        # Thread-local state; keeps track of running cache loaders.
+        self.__local = local()
+        # By default, we do not use a cache loader or indexes.
+        self.configure(cache_loader=None, cache_indexes=None,
+                       cache_sorted_indexes=None, query_cache_size=256,
+                       snapshot_path=None, snapshot_interval=None,
+                       commit_log_path=None, commit_log_sync_interval=0.1)
 
     def retrieve(self, entity_class, filter_expression=None,
-                 order_expression=None, slice_key=None):
-        cache = self.__get_cache(entity_class)
-        return cache.retrieve(filter_expression=filter_expression,
-                              order_expression=order_expression,
-                              slice_key=slice_key)
+                 order_expression=None, slice_key=None, memoize=True,
+                 unit_of_work=None):
+        """
+        Retrieves entities of the given class, possibly after filtering,
+        ordering and slicing.
 
-    def flush(self, unit_of_work):
-        for state in unit_of_work.iterator():
-            if state.is_persisted:
-                continue
+        Unless the `memoize` flag is unset, the IDs of the entities returned
+        by filtered or ordered queries are kept in the query result cache.
+
+        Nested attributes in the filter and order expressions are read from
+        the related entities in the same version of the repository data as
+        the queried entities (see :meth:`resolve`).
+
+        :param unit_of_work: Unit of work to retrieve the entities for. If
+          this is given, the entities are read from the version of the
+          repository data pinned by the unit of work (including its flushed
+          changes); otherwise, the current version is used.
+        """
+        cache = self.__get_cache(entity_class, unit_of_work)
+        query_key = None
+        if memoize and not self.__query_cache is None:
+            query_key = self.__make_query_key(cache, filter_expression,
+                                              order_expression, slice_key)
+        filter_expression, order_expression = \
+                    self.__bind(unit_of_work, filter_expression,
+                                order_expression)
+        if query_key is None:
+            ents = cache.retrieve(filter_expression=filter_expression,
+                                  order_expression=order_expression,
+                                  slice_key=slice_key)
+        else:
+            ids = self.__query_cache.get(entity_class, query_key)
+            if not ids is None:
+                ents = iter([cache.get_by_id(ent_id) for ent_id in ids])
             else:
-                self.__persist(state)
-                unit_of_work.mark_persisted(state.entity)
+                generation = self.__query_cache.get_generation(entity_class)
+                ent_list = list(cache.retrieve(
+                                        filter_expression=filter_expression,
+                                        order_expression=order_expression,
+                                        slice_key=slice_key))
+                self.__query_cache.set(entity_class, query_key,
+                                       [ent.id for ent in ent_list],
+                                       generation)
+                ents = iter(ent_list)
+        return ents
+
+    def get_by_id(self, entity_class, entity_id, unit_of_work=None):
+        """
+        Returns the cached entity of the given class with the given ID or
+        `None` if no such entity exists.
+
+        :param unit_of_work: See :meth:`retrieve`.
+        """
+        cache = self.__get_cache(entity_class, unit_of_work)
+        return cache.get_by_id(entity_id)
+
+    def get_by_slug(self, entity_class, entity_slug, unit_of_work=None):
+        """
+        Returns the list of cached entities of the given class with the
+        given slug or `None` if no such entity exists.
+
+        :param unit_of_work: See :meth:`retrieve`.
+        """
+        cache = self.__get_cache(entity_class, unit_of_work)
+        return cache.get_by_slug(entity_slug)
+
+    def count(self, entity_class, filter_expression=None, memoize=True,
+              unit_of_work=None):
+        """
+        Returns the number of entities of the given class matching the given
+        filter expression. Unless the `memoize` flag is unset, counts are
+        memoized in the entity cache until the next change to the cached
+        entities of the given class.
+
+        :param unit_of_work: See :meth:`retrieve`.
+        """
+        cache = self.__get_cache(entity_class, unit_of_work)
+        filter_expression, _ = self.__bind(unit_of_work, filter_expression)
+        return cache.count(filter_expression=filter_expression,
+                           memoize=memoize)
+
+    def resolve(self, entity, unit_of_work=None):
+        """
+        Returns the cached version of the given (related) entity.
+
+        Relationship attributes of cached entities may reference older
+        versions of the related entities, so readers use this to look up
+        the version in the repository data they read. Entities which are
+        not cached in this version (e.g., entities from other
+        repositories) are returned as they are.
+
+        :param unit_of_work: See :meth:`retrieve`.
+        """
+        ent_cls = entity.__class__
+        if self.__cache_map.has_key(ent_cls):
+            cached_entity = self.__get_cache(ent_cls,
+                                             unit_of_work).get_by_id(entity.id)
+            if not cached_entity is None:
+                entity = cached_entity
+        return entity
+
+    def flush(self, unit_of_work):
+        """
+        Flushes the pending changes recorded in the given unit of work to
+        the private branch of the repository data for the unit of work.
+        """
+        if getattr(self.__local, 'is_loading', False):
+            # Cache loaders may trigger flushes (e.g., when looking up
+            # referenced entities); we defer these to the outer flush since
+            # we must not copy partially loaded caches.
+            return
+        states = [state for state in unit_of_work.iterator()
+                  if not state.is_persisted]
+        # Make sure the caches are loaded before we copy them.
+        for state in states:
+            self.__get_published_cache(type(state.entity))
+        branch = self.__get_branch(unit_of_work)
+        for ent_cls, status, batch_states in unit_of_work.batch_iterator():
+            self.__persist(ent_cls, status, batch_states, branch)
+        for state in states:
+            unit_of_work.mark_persisted(state.entity)
 
     def commit(self, unit_of_work):
+        """
+        Flushes the pending changes recorded in the given unit of work and
+        publishes all changes made in the unit of work as a new version of
+        the repository data.
+
+        :raises ValueError: If an entity changed in the given unit of work
+          was also changed by another unit of work which was committed
+          since the given unit of work pinned the repository data.
+        """
         self.flush(unit_of_work)
+        branch = self.__branches.pop(unit_of_work, None)
+        if not branch is None and len(branch.caches) > 0:
+            if not self.__commit_log is None:
+                changes = self.__make_log_changes(unit_of_work)
+            else:
+                changes = None
+            self.__publish(branch, changes)
 
     def rollback(self, unit_of_work):
-        for state in unit_of_work.iterator():
-            if state.is_persisted:
-                self.__rollback(state)
+        """
+        Discards all changes flushed for the given unit of work.
+        """
+        self.release(unit_of_work)
+
+    def release(self, unit_of_work):
+        """
+        Releases the version of the repository data pinned by the given
+        unit of work, discarding all changes flushed to it. The unit of
+        work will pin the then current version with its next access to
+        the repository.
+        """
+        branch = self.__branches.pop(unit_of_work, None)
+        if not branch is None and len(branch.caches) > 0:
+            # Discard the query results for the private caches.
+            self.__invalidate_query_cache(list(branch.caches.keys()))
+
+    def write_snapshot(self, path=None):
+        """
+        Writes a binary snapshot of all cached entities (including the
+        relationships between them) to the given file. The snapshot reflects
+        the current version of the repository data; changes which are not
+        committed yet are not included.
 
-    def __persist(self, state):
-        source_entity = state.entity
-        cache = self.__get_cache(type(source_entity))
-        status = state.status
+        :param str path: Path of the snapshot file. Defaults to the
+          configured `snapshot_path`.
+        :raises ValueError: If no path was given and no snapshot path is
+          configured.
+        """
+        if path is None:
+            path = self._config['snapshot_path']
+            if path is None:
+                raise ValueError('No snapshot path configured.')
+        # Make sure all entities are loaded before we take the snapshot.
+        for rc in self.registered_resources:
+            self.__get_published_cache(get_entity_class(rc))
+        self.__write_snapshot(path)
+
+    @property
+    def lock(self):
+        """
+        The striped lock (:class:`everest.repositories.utils.StripedLock`)
+        which serializes publishing changes to the cached entities of each
+        entity class.
+        """
+        return self.__lock
+
+    @property
+    def query_cache(self):
+        """
+        The query result cache of this repository
+        (:class:`everest.repositories.utils.QueryResultCache`) or `None`, if
+        the query result cache is disabled. Use this to inspect the hit and
+        miss counters at runtime.
+        """
+        return self.__query_cache
+
+    def __persist(self, entity_class, status, states, branch):
+        # Persists a batch of entity states with the same class and status.
+        cache = self.__get_private_cache(branch, entity_class)
         if status == ENTITY_STATUS.NEW:
-            # Autogenerate new ID.
-            if source_entity.id is None:
-                source_entity.id = new_entity_id()
-            cache.add(source_entity)
-        else:
-            target_entity = cache.get_by_id(source_entity.id)
-            if target_entity is None:
-                raise ValueError('Could not persist data - target entity not '
-                                 'found (ID used for lookup: %s).'
-                                 % source_entity.id)
-            if status == ENTITY_STATUS.DELETED:
-                cache.remove(target_entity)
-            elif status == ENTITY_STATUS.DIRTY:
-                cache.update(state.data, target_entity)
-
-    def __rollback(self, state):
-        source_entity = state.entity
-        cache = self.__get_cache(type(source_entity))
-        if state.status == ENTITY_STATUS.DELETED:
-            cache.add(source_entity)
+            for state in states:
+                source_entity = state.entity
+                # Autogenerate new ID.
+                if source_entity.id is None:
+                    source_entity.id = new_entity_id()
+                cache.add(source_entity)
         else:
-            if state.status == ENTITY_STATUS.NEW:
-                cache.remove(source_entity)
-            elif state.status == ENTITY_STATUS.DIRTY:
+            if status == ENTITY_STATUS.DIRTY:
+                pinned_cache = self.__get_pinned_cache(branch, entity_class)
+            for state in states:
+                source_entity = state.entity
                 target_entity = cache.get_by_id(source_entity.id)
-                cache.update(state.clean_data, target_entity)
+                if target_entity is None:
+                    raise ValueError('Could not persist data - target entity '
+                                     'not found (ID used for lookup: %s).'
+                                     % source_entity.id)
+                if status == ENTITY_STATUS.DELETED:
+                    cache.remove(target_entity)
+                else:
+                    # Only the changed attributes are transferred.
+                    data = state.changed_data
+                    if pinned_cache.get_by_id(target_entity.id) \
+                       is target_entity:
+                        # The target entity is shared with other versions;
+                        # we update a copy instead.
+                        new_target_entity = copy(target_entity)
+                        EntityState.set_state_data(new_target_entity, data)
+                        cache.replace(target_entity, new_target_entity)
+                    else:
+                        cache.update(data, target_entity)
+
+    def __make_log_changes(self, unit_of_work):
+        changes = []
+        for state in unit_of_work.iterator():
+            status = state.status
+            if status == ENTITY_STATUS.CLEAN:
+                continue
+            if status == ENTITY_STATUS.DELETED:
+                data = None
+            else:
+                if status == ENTITY_STATUS.DIRTY:
+                    # Only the changed attributes are logged.
+                    state_data = state.changed_data
+                else:
+                    state_data = state.data
+                # Nested attributes are not logged; they are restored with
+                # the referenced entity.
+                data = dict((attr.entity_attr, value)
+                            for (attr, value) in iteritems_(state_data)
+                            if not '.' in attr.entity_attr)
+            ent = state.entity
+            changes.append((status, type(ent), ent.id, data))
+        return changes
+
+    def __publish(self, branch, changes=None):
+        ent_clss = list(branch.caches.keys())
+        with self.__lock.locking(ent_clss):
+            new_caches = {}
+            for ent_cls, cache in iteritems_(branch.caches):
+                pinned_cache = branch.cache_map[ent_cls]
+                current_cache = self.__get_published_cache(ent_cls)
+                if not current_cache is pinned_cache:
+                    # Changes to entities of this class were published since
+                    # the branch was created.
+                    cache = self.__rebase(cache, pinned_cache, current_cache)
+                new_caches[ent_cls] = cache
+            with self.__publish_lock:
+                if not changes is None:
+                    # Logging the changes while holding the publish lock
+                    # keeps the log records in publishing order.
+                    self.__commit_log.append(changes)
+                cache_map = self.__cache_map.copy()
+                for ent_cls, cache in iteritems_(new_caches):
+                    cache_map[ent_cls] = cache
+                self.__cache_map = cache_map
+            self.__invalidate_query_cache(ent_clss)
+
+    def __rebase(self, cache, pinned_cache, current_cache):
+        # Re-applies the changes made in the given private cache relative
+        # to the given pinned cache to a copy of the given current cache.
+        new_cache = current_cache.copy()
+        for ent in cache.get_all():
+            pinned_ent = pinned_cache.get_by_id(ent.id)
+            if not pinned_ent is ent:
+                current_ent = new_cache.get_by_id(ent.id)
+                self.__check_conflict(ent, pinned_ent, current_ent)
+                if current_ent is None:
+                    new_cache.add(ent)
+                else:
+                    new_cache.replace(current_ent, ent)
+        for pinned_ent in pinned_cache.get_all():
+            if not cache.has_id(pinned_ent.id):
+                current_ent = new_cache.get_by_id(pinned_ent.id)
+                self.__check_conflict(pinned_ent, pinned_ent, current_ent)
+                new_cache.remove(current_ent)
+        return new_cache
+
+    def __check_conflict(self, entity, pinned_entity, current_entity):
+        if not current_entity is pinned_entity:
+            raise ValueError('Could not persist data - entity %s (ID: %s) '
+                             'was changed concurrently.'
+                             % (entity, entity.id))
 
     def _initialize(self):
-        pass
+        query_cache_size = self._config['query_cache_size']
+        if query_cache_size > 0:
+            self.__query_cache = QueryResultCache(query_cache_size)
+        cache_indexes = self._config['cache_indexes']
+        if not cache_indexes is None:
+            for rc, attr_names in iteritems_(cache_indexes):
+                self.__cache_map.set_indexes(get_entity_class(rc),
+                                             attr_names)
+        cache_sorted_indexes = self._config['cache_sorted_indexes']
+        if not cache_sorted_indexes is None:
+            for rc, attr_names in iteritems_(cache_sorted_indexes):
+                self.__cache_map.set_sorted_indexes(get_entity_class(rc),
+                                                    attr_names)
+        snapshot_path = self._config['snapshot_path']
+        if self._config['cache_loader'] is None and not snapshot_path is None:
+            self._config['cache_loader'] = SnapshotLoader(snapshot_path)
+        commit_log_path = self._config['commit_log_path']
+        if not commit_log_path is None:
+            sync_interval = self._config['commit_log_sync_interval']
+            self.__commit_log = CommitLog(commit_log_path,
+                                          sync_interval=sync_interval)
+            self.__commit_log.open()
+        snapshot_interval = self._config['snapshot_interval']
+        if snapshot_interval and not snapshot_path is None:
+            # The entity classes are looked up here since the scheduler
+            # thread does not have access to the current registry.
+            ent_clss = [get_entity_class(rc)
+                        for rc in self.registered_resources]
+            self.__snapshot_scheduler = \
+                SnapshotScheduler(lambda: self.__write_scheduled_snapshot(
+                                                                ent_clss),
+                                  snapshot_interval)
+            self.__snapshot_scheduler.start()
 
     def _reset(self):
+        if not self.__snapshot_scheduler is None:
+            self.__snapshot_scheduler.stop()
+            self.__snapshot_scheduler = None
+        if not self.__commit_log is None:
+            self.__commit_log.close()
+            self.__commit_log = None
         self.__cache_map.clear()
+        self.__branches.clear()
+        if not self.__query_cache is None:
+            self.__query_cache.clear()
 
     def _make_session_factory(self):
         return MemorySessionFactory(self)
 
-    def __get_cache(self, entity_class):
+    def __make_query_key(self, cache, filter_expression, order_expression,
+                         slice_key):
+        # Returns None for unfiltered and unordered queries (which are cheap
+        # to run) and for queries with expressions that do not provide a
+        # cache key. The key includes the version of the given cache so
+        # that results are never shared between versions.
+        if filter_expression is None and order_expression is None:
+            return None
+        if not filter_expression is None:
+            filter_key = getattr(filter_expression, 'cache_key', None)
+            if filter_key is None:
+                return None
+        else:
+            filter_key = None
+        if not order_expression is None:
+            order_key = getattr(order_expression, 'cache_key', None)
+            if order_key is None:
+                return None
+        else:
+            order_key = None
+        if not slice_key is None:
+            slice_key = (slice_key.start, slice_key.stop)
+        return (cache.version, filter_key, order_key, slice_key)
+
+    def __write_snapshot(self, path):
+        # Writing a snapshot to the configured snapshot path compacts the
+        # commit log: The log records which are contained in the snapshot
+        # are moved aside and only discarded once the snapshot is written.
+        compact = not self.__commit_log is None \
+                  and path == self._config['snapshot_path']
+        with self.__snapshot_lock:
+            with self.__publish_lock:
+                cache_map = self.__cache_map
+                if compact:
+                    self.__commit_log.rotate()
+            # The published version of the repository data is never
+            # modified, so we can write it without holding any lock.
+            write_snapshot([(ent_cls, list(cache_map[ent_cls].get_all()))
+                            for ent_cls in list(cache_map.keys())],
+                           path)
+            if compact:
+                self.__commit_log.discard_rotated()
+
+    def __write_scheduled_snapshot(self, entity_classes):
+        # Loading entities requires the current registry which is not
+        # available in the scheduler thread; we therefore skip snapshots
+        # until all entities were loaded.
+        cache_map = self.__cache_map
+        if all(cache_map.has_key(ent_cls) for ent_cls in entity_classes):
+            self.__write_snapshot(self._config['snapshot_path'])
+
+    def __bind(self, unit_of_work, filter_expression,
+               order_expression=None):
+        # Binds the given expressions to the related entities in the version
+        # of the repository data read for the given unit of work.
+        resolve = partial(self.resolve, unit_of_work=unit_of_work)
+        if not filter_expression is None:
+            filter_expression = filter_expression.bind(resolve)
+        if not order_expression is None:
+            order_expression = order_expression.bind(resolve)
+        return filter_expression, order_expression
+
+    def __invalidate_query_cache(self, entity_classes):
+        if not self.__query_cache is None:
+            for ent_cls in entity_classes:
+                self.__query_cache.invalidate(ent_cls)
+
+    def __get_cache(self, entity_class, unit_of_work):
+        if unit_of_work is None:
+            cache = self.__get_published_cache(entity_class)
+        else:
+            branch = self.__get_branch(unit_of_work)
+            cache = branch.caches.get(entity_class)
+            if cache is None:
+                cache = self.__get_pinned_cache(branch, entity_class)
+        return cache
+
+    def __get_branch(self, unit_of_work):
+        branch = self.__branches.get(unit_of_work)
+        if branch is None:
+            branch = self.__branches[unit_of_work] = \
+                                            _Branch(self.__cache_map)
+        return branch
+
+    def __get_pinned_cache(self, branch, entity_class):
+        if not branch.cache_map.has_key(entity_class):
+            # The entities of this class were loaded after the branch was
+            # created.
+            branch.cache_map[entity_class] = \
+                            self.__get_published_cache(entity_class)
+        return branch.cache_map[entity_class]
+
+    def __get_private_cache(self, branch, entity_class):
+        cache = branch.caches.get(entity_class)
+        if cache is None:
+            cache = branch.caches[entity_class] = \
+                    self.__get_pinned_cache(branch, entity_class).copy()
+        return cache
+
+    def __get_published_cache(self, entity_class):
         run_loader = not entity_class in self.__cache_map
         if run_loader:
             is_top_level = len(self.__cache_map.keys()) == 0
-            self.__load_entities(entity_class, is_top_level)
+            was_loading = getattr(self.__local, 'is_loading', False)
+            self.__local.is_loading = True
+            try:
+                self.__load_entities(entity_class, is_top_level)
+            finally:
+                self.__local.is_loading = was_loading
         return self.__cache_map[entity_class]
 
     def __load_entities(self, entity_class, is_top_level):
+        cache = self.__cache_map[entity_class]
         # Check if we have an entity loader configured.
         loader = self.configuration['cache_loader']
         if not loader is None:
-            cache = self.__cache_map[entity_class]
             for ent in loader(entity_class):
                 if ent.id is None:
                     ent.id = new_entity_id()
                 cache.add(ent)
+        if is_top_level \
+           and not (loader is None and self.__commit_log is None):
             # To fully initialize the cache, we also need to load collections
             # that are not linked to from any of the entities just loaded.
-            if is_top_level:
-                for reg_rc in self.registered_resources:
-                    reg_ent_cls = get_entity_class(reg_rc)
-                    if not reg_ent_cls in self.__cache_map:
-                        self.__load_entities(reg_ent_cls, False)
+            for reg_rc in self.registered_resources:
+                reg_ent_cls = get_entity_class(reg_rc)
+                if not reg_ent_cls in self.__cache_map:
+                    self.__load_entities(reg_ent_cls, False)
+            if not self.__commit_log is None:
+                # Replay the changes committed since the last snapshot.
+                for changes in self.__commit_log.read():
+                    self.__replay(changes)
+
+    def __replay(self, changes):
+        # Applies the changes from a commit log record to the published
+        # caches. Replaying is idempotent so that records which are already
+        # contained in the loaded entities (e.g., after an interrupted
+        # compaction) can be replayed safely.
+        cache_map = self.__cache_map
+        # Create all new entities first so that references between them
+        # can be resolved.
+        new_ents = {}
+        for status, ent_cls, ent_id, _ in changes:
+            if status == ENTITY_STATUS.NEW \
+               and not cache_map[ent_cls].has_id(ent_id):
+                ent = ent_cls.__new__(ent_cls)
+                ent.id = ent_id
+                new_ents[(ent_cls, ent_id)] = ent
+        def resolve(value):
+            if isinstance(value, EntityReference):
+                ent = new_ents.get(value)
+                if ent is None:
+                    ent = cache_map[value.entity_class].get_by_id(
+                                                            value.entity_id)
+                value = ent
+            elif isinstance(value, list):
+                value = [resolve(item) for item in value]
+            return value
+        for status, ent_cls, ent_id, state in changes:
+            cache = cache_map[ent_cls]
+            if status == ENTITY_STATUS.DELETED:
+                ent = cache.get_by_id(ent_id)
+                if not ent is None:
+                    cache.remove(ent)
+                continue
+            attrs = get_domain_class_attribute_iterator(ent_cls)
+            data = dict((attr, resolve(state[attr.entity_attr]))
+                        for attr in attrs if attr.entity_attr in state)
+            ent = new_ents.get((ent_cls, ent_id))
+            if not ent is None:
+                EntityState.set_state_data(ent, data)
+                cache.add(ent)
+            else:
+                ent = cache.get_by_id(ent_id)
+                if not ent is None:
+                    cache.update(data, ent)
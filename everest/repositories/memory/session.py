@@ -7,19 +7,28 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 Created on Jan 8, 2013.
 """
 from collections import MutableSequence
+from collections import OrderedDict
 from collections import MutableSet
+from collections import defaultdict
+from everest.compat import izip
 from everest.constants import RELATION_OPERATIONS
 from everest.constants import RESOURCE_ATTRIBUTE_KINDS
 from everest.entities.traversal import AruVisitor
 from everest.entities.utils import get_entity_class
+from everest.exceptions import UnsupportedOperationException
 from everest.repositories.base import AutocommittingSessionMixin
 from everest.repositories.base import Session
 from everest.repositories.base import SessionFactory
 from everest.repositories.memory.cache import EntityCache
+from everest.repositories.memory.lazy import is_lazy_clone
+from everest.repositories.memory.lazy import make_lazy_clone
+from everest.repositories.memory.lazy import materialize_lazy_clone
 from everest.repositories.memory.querying import MemoryRepositoryQuery
+from everest.repositories.memory.readonly import make_read_only_proxy
 from everest.repositories.state import EntityState
 from everest.repositories.uow import UnitOfWork
 from everest.traversal import SourceTargetDataTreeTraverser
+from functools import partial
 from pyramid.compat import iteritems_
 from threading import local
 from transaction.interfaces import IDataManager
@@ -29,6 +38,7 @@ import transaction
 __docformat__ = 'reStructuredText en'
 __all__ = ['DataManager',
            'MemoryAutocommittingSession',
+           'MemoryReadOnlySession',
            'MemorySession',
            'MemorySessionFactory',
            ]
@@ -50,6 +60,9 @@ class MemorySession(Session):
         self.__repository = repository
         self.__unit_of_work = UnitOfWork()
         self.__cache_map = {}
+        # Map entity class -> dictionary mapping entity IDs to lazy clones
+        # which have not been materialized yet.
+        self.__lazy_clone_map = defaultdict(dict)
         if query_class is None:
             query_class = MemoryRepositoryQuery
         self.__query_class = query_class
@@ -61,7 +74,10 @@ class MemorySession(Session):
         if self.__needs_flushing:
             self.flush()
         cache = self.__get_cache(entity_class)
-        return cache.get_by_id(entity_id)
+        ent = cache.get_by_id(entity_id)
+        if ent is None:
+            ent = self.__lazy_clone_map[entity_class].get(entity_id)
+        return ent
 
     def get_by_slug(self, entity_class, entity_slug):
         if self.__needs_flushing:
@@ -86,7 +102,21 @@ class MemorySession(Session):
 
     def update(self, entity_class, data, target=None):
         return self.__traverse(entity_class, data, target,
-                               RELATION_OPERATIONS.UPDATE)
+                               RELATION_OPERATIONS.UPDATE).root
+
+    def add_many(self, entity_class, data_items):
+        new_ents = []
+        self.__traverse(entity_class, list(data_items), None,
+                        RELATION_OPERATIONS.ADD, add_callback=new_ents.append)
+        self.__add_many(new_ents)
+
+    def remove_many(self, entity_class, data_items):
+        self.__traverse(entity_class, None, list(data_items),
+                        RELATION_OPERATIONS.REMOVE)
+
+    def update_many(self, entity_class, data_items):
+        return self.__traverse(entity_class, list(data_items), None,
+                               RELATION_OPERATIONS.UPDATE).roots
 
     def query(self, entity_class):
         if self.__needs_flushing:
@@ -96,8 +126,7 @@ class MemorySession(Session):
     def flush(self):
         if self.__needs_flushing and not self.__is_flushing:
             self.__is_flushing = True
-            with self.__repository.lock:
-                self.__repository.flush(self.__unit_of_work)
+            self.__repository.flush(self.__unit_of_work)
             self.__is_flushing = False
             for ent_cls in self.__cache_map.keys():
                 # The flush may have auto-generated IDs for NEW entities,
@@ -108,18 +137,22 @@ class MemorySession(Session):
 
     def begin(self):
         self.__unit_of_work.reset()
+        self.__repository.release(self.__unit_of_work)
 
     def commit(self):
-        with self.__repository.lock:
-            self.__repository.commit(self.__unit_of_work)
+        self.__repository.commit(self.__unit_of_work)
         self.__unit_of_work.reset()
         self.__cache_map.clear()
+        self.__lazy_clone_map.clear()
+        # Committing may have triggered reads (e.g., for persisting the
+        # repository data) which pinned the repository data again.
+        self.__repository.release(self.__unit_of_work)
 
     def rollback(self):
-        with self.__repository.lock:
-            self.__repository.rollback(self.__unit_of_work)
+        self.__repository.rollback(self.__unit_of_work)
         self.__unit_of_work.reset()
         self.__cache_map.clear()
+        self.__lazy_clone_map.clear()
 
     def reset(self):
         self.rollback()
@@ -130,8 +163,13 @@ class MemorySession(Session):
         clone. If it was already loaded before, look up the loaded entity
         and return it.
 
-        All entities referenced by the loaded entity will also be loaded
-        (and cloned) recursively.
+        The clone is lazy: It reads terminal attributes from the repository
+        entity it stands for and only copies its state when an attribute is
+        set or a related entity is accessed for the first time. Entities
+        referenced by the loaded entity are represented by lazy clones as
+        well. Lazy clones are registered with the unit of work of this
+        session when their state is copied (they can not have changes
+        before).
 
         :raises ValueError: When an attempt is made to load an entity that
           has no ID
@@ -144,11 +182,12 @@ class MemorySession(Session):
         sess_ent = cache.get_by_id(entity.id)
         if sess_ent is None:
             if self.__clone_on_load:
-                sess_ent = self.__clone(entity, cache)
+                sess_ent = self.__load_lazy(entity_class, entity)
+                cache.add(sess_ent)
             else: # Only needed by the nosql backend pragma: no cover
                 cache.add(entity)
                 sess_ent = entity
-            self.__unit_of_work.register_clean(entity_class, sess_ent)
+                self.__unit_of_work.register_clean(entity_class, sess_ent)
         return sess_ent
 
     @property
@@ -159,7 +198,17 @@ class MemorySession(Session):
     def deleted(self):
         return self.__unit_of_work.get_deleted()
 
+    @property
+    def unit_of_work(self):
+        """
+        The unit of work tracking the changes made in this session. The
+        repository uses this to look up the version of the repository data
+        pinned by this session.
+        """
+        return self.__unit_of_work
+
     def __contains__(self, entity):
+        materialize_lazy_clone(entity)
         cache = self.__cache_map.get(type(entity))
         if not cache is None:
             found = entity in cache
@@ -167,20 +216,24 @@ class MemorySession(Session):
             found = False
         return found
 
-    def __traverse(self, entity_class, source_data, target_data, rel_op):
+    def __traverse(self, entity_class, source_data, target_data, rel_op,
+                   add_callback=None):
         agg = self.__repository.get_aggregate(entity_class)
         trv = SourceTargetDataTreeTraverser.make_traverser(source_data,
                                                            target_data,
                                                            rel_op,
                                                            accessor=agg)
+        if add_callback is None:
+            add_callback = self.__add
         vst = AruVisitor(entity_class,
-                         self.__add, self.__remove, self.__update)
+                         add_callback, self.__remove, self.__update)
         trv.run(vst)
         # Indicate that we need to flush the changes.
         self.__needs_flushing = True
-        return vst.root
+        return vst
 
     def __add(self, entity):
+        materialize_lazy_clone(entity)
         entity_class = type(entity)
         cache = self.__get_cache(entity_class)
         # We allow adding the same entity multiple times.
@@ -204,7 +257,41 @@ class MemorySession(Session):
                     self.__unit_of_work.mark_pending(entity)
             cache.add(entity)
 
+    def __add_many(self, entities):
+        # Entities which are not registered yet are registered as NEW in
+        # one batch per entity class; all others go through the regular
+        # per-entity logic in :meth:`__add`.
+        new_ent_map = OrderedDict()
+        unique_ents = []
+        is_new_flags = []
+        seen_ent_ids = set()
+        for ent in entities:
+            # We allow adding the same entity multiple times.
+            if id(ent) in seen_ent_ids:
+                continue
+            seen_ent_ids.add(id(ent))
+            materialize_lazy_clone(ent)
+            is_new = not self.__unit_of_work.is_registered(ent)
+            if is_new:
+                new_ents = new_ent_map.get(type(ent))
+                if new_ents is None:
+                    new_ents = new_ent_map[type(ent)] = []
+                new_ents.append(ent)
+            unique_ents.append(ent)
+            is_new_flags.append(is_new)
+        for ent_cls, new_ents in iteritems_(new_ent_map):
+            self.__unit_of_work.register_new_many(ent_cls, new_ents)
+        for ent, is_new in izip(unique_ents, is_new_flags):
+            if is_new:
+                cache = self.__get_cache(type(ent))
+                if not ent.id is None and cache.has_id(ent.id):
+                    raise ValueError('Duplicate entity ID "%s".' % ent.id)
+                cache.add(ent)
+            else:
+                self.__add(ent)
+
     def __remove(self, entity):
+        materialize_lazy_clone(entity)
         entity_class = type(entity)
         if not self.__unit_of_work.is_registered(entity):
             if entity.id is None:
@@ -225,6 +312,7 @@ class MemorySession(Session):
             cache.remove(entity)
 
     def __update(self, source_data, target_entity): # pylint: disable=W0613
+        materialize_lazy_clone(target_entity)
         EntityState.set_state_data(target_entity, source_data)
         if self.__unit_of_work.is_marked_persisted(target_entity):
             self.__unit_of_work.mark_pending(target_entity)
@@ -235,12 +323,51 @@ class MemorySession(Session):
             cache = self.__cache_map[entity_class] = EntityCache()
         return cache
 
-    def __clone(self, entity, cache):
-        clone = object.__new__(entity.__class__)
-        # We add the clone with its ID set to the cache *before* we load it
-        # so that circular references will work.
-        clone.id = entity.id
-        cache.add(clone)
+    def __load_lazy(self, entity_class, entity):
+        # Returns the session entity for the given repository entity,
+        # creating a lazy clone if it has not been loaded yet.
+        sess_ent = self.__get_cache(entity_class).get_by_id(entity.id)
+        if sess_ent is None:
+            lazy_clones = self.__lazy_clone_map[entity_class]
+            sess_ent = lazy_clones.get(entity.id)
+            if sess_ent is None:
+                sess_ent = make_lazy_clone(entity_class, entity.id,
+                                           partial(self.__materialize,
+                                                   entity_class, entity),
+                                           partial(self.__get_source,
+                                                   entity_class, entity))
+                if is_lazy_clone(sess_ent):
+                    lazy_clones[entity.id] = sess_ent
+                else:
+                    # Entity classes without an instance dictionary are
+                    # cloned right away.
+                    self.__get_cache(entity_class).add(sess_ent)
+                    self.__unit_of_work.register_clean(entity_class,
+                                                       sess_ent)
+        return sess_ent
+
+    def __get_source(self, entity_class, entity):
+        # We read the state of the entity from the version of the
+        # repository data pinned by this session, which may differ from the
+        # version the lazy clone was created from.
+        return self.__repository.resolve(entity,
+                                         unit_of_work=self.__unit_of_work)
+
+    def __materialize(self, entity_class, entity, clone):
+        # The lazy clone stays in the lazy clone map while we copy the
+        # state so that circular references will work.
+        self.__copy_state(self.__get_source(entity_class, entity), clone)
+        lazy_clones = self.__lazy_clone_map[entity_class]
+        # Lazy clones which were handed out before the last commit or
+        # rollback are materialized without being loaded into the session.
+        # Loaded clones are in the session cache already (adding them again
+        # does nothing).
+        if lazy_clones.get(clone.id) is clone:
+            del lazy_clones[clone.id]
+            self.__get_cache(entity_class).add(clone)
+            self.__unit_of_work.register_clean(entity_class, clone)
+
+    def __copy_state(self, entity, clone):
         state = EntityState.get_state_data(entity)
         id_attr = None
         for attr, value in iteritems_(state):
@@ -257,7 +384,7 @@ class MemorySession(Session):
             elif attr.kind == RESOURCE_ATTRIBUTE_KINDS.MEMBER \
                and not value is None:
                 ent_cls = get_entity_class(attr_type)
-                new_value = self.load(ent_cls, value)
+                new_value = self.__load_lazy(ent_cls, value)
                 state[attr] = new_value
             elif attr.kind == RESOURCE_ATTRIBUTE_KINDS.COLLECTION \
                  and len(value) > 0:
@@ -273,14 +400,13 @@ class MemorySession(Session):
                                      % (type(new_value), attr))
                 ent_cls = get_entity_class(attr_type)
                 for child in value:
-                    child_clone = self.load(ent_cls, child)
+                    child_clone = self.__load_lazy(ent_cls, child)
                     add_op(child_clone)
                 state[attr] = new_value
-        # We set the ID already above.
+        # The clone has its ID set already.
         if not id_attr is None:
             del state[id_attr]
         EntityState.set_state_data(clone, state)
-        return clone
 
 
 class MemoryAutocommittingSession(AutocommittingSessionMixin, MemorySession):
@@ -290,6 +416,107 @@ class MemoryAutocommittingSession(AutocommittingSessionMixin, MemorySession):
     pass
 
 
+class MemoryReadOnlySession(Session):
+    """
+    Read-only session in memory.
+
+    Unlike :class:`MemorySession`, this session does not clone the entities
+    held by the repository: Loading an entity returns a read-only proxy
+    sharing the state of the repository entity and does not register it
+    with a unit of work (which would take a snapshot of its state). All
+    operations that would change the repository data, including setting
+    attributes of loaded entities, raise an
+    :class:`everest.exceptions.UnsupportedOperationException`.
+
+    Like a regular session, the read-only session reads the version of the
+    repository data that was current when it first accessed the
+    repository until it is reset; related entities are looked up in this
+    version as well.
+    """
+    IS_MANAGING_BACKREFERENCES = True
+
+    def __init__(self, repository, query_class=None):
+        self.__repository = repository
+        if query_class is None:
+            query_class = MemoryRepositoryQuery
+        self.__query_class = query_class
+        # The unit of work only pins the version of the repository data.
+        self.__unit_of_work = UnitOfWork()
+        self.__resolve = partial(repository.resolve,
+                                 unit_of_work=self.__unit_of_work)
+
+    def get_by_id(self, entity_class, entity_id):
+        ent = self.__repository.get_by_id(entity_class, entity_id,
+                                          unit_of_work=self.__unit_of_work)
+        if not ent is None:
+            ent = make_read_only_proxy(ent, resolve=self.__resolve)
+        return ent
+
+    def get_by_slug(self, entity_class, entity_slug):
+        ents = self.__repository.get_by_slug(entity_class, entity_slug,
+                                             unit_of_work=self.__unit_of_work)
+        if not ents is None:
+            ents = [make_read_only_proxy(ent, resolve=self.__resolve)
+                    for ent in ents]
+        return ents
+
+    def add(self, entity_class, data):
+        self.__raise_read_only()
+
+    def remove(self, entity_class, data):
+        self.__raise_read_only()
+
+    def update(self, entity_class, data, target=None):
+        self.__raise_read_only()
+
+    def query(self, entity_class):
+        return self.__query_class(entity_class, self, self.__repository)
+
+    def load(self, entity_class, entity): # pylint: disable=W0613
+        """
+        Returns a read-only proxy for the given repository entity.
+        """
+        return make_read_only_proxy(entity, resolve=self.__resolve)
+
+    def flush(self):
+        pass
+
+    def begin(self):
+        self.__repository.release(self.__unit_of_work)
+
+    def commit(self):
+        self.__repository.release(self.__unit_of_work)
+
+    def rollback(self):
+        self.__repository.release(self.__unit_of_work)
+
+    def reset(self):
+        self.__repository.release(self.__unit_of_work)
+
+    @property
+    def new(self):
+        return iter(())
+
+    @property
+    def deleted(self):
+        return iter(())
+
+    @property
+    def unit_of_work(self):
+        """
+        The unit of work pinning the version of the repository data read by
+        this session. No entities are registered with it.
+        """
+        return self.__unit_of_work
+
+    def __contains__(self, entity):
+        return False
+
+    def __raise_read_only(self):
+        raise UnsupportedOperationException('Can not change repository '
+                                            'data in a read-only session.')
+
+
 class MemorySessionFactory(SessionFactory):
     """
     Factory for :class:`MemorySession` instances.
@@ -308,8 +535,27 @@ class MemorySessionFactory(SessionFactory):
         if not session is None:
             session.reset()
             self.__session_registry.session = None
+        self.set_read_only(False)
+
+    def set_read_only(self, value):
+        # Switching modes ends the use of the read-only session, so it
+        # should read the current version of the repository data the next
+        # time.
+        session = getattr(self.__session_registry, 'read_only_session', None)
+        if not session is None:
+            session.reset()
+        self.__session_registry.read_only = value
 
     def __call__(self):
+        if getattr(self.__session_registry, 'read_only', False):
+            session = getattr(self.__session_registry, 'read_only_session',
+                              None)
+            if session is None:
+                session = MemoryReadOnlySession(
+                                        self._repository,
+                                        query_class=self.__query_class)
+                self.__session_registry.read_only_session = session
+            return session
         session = getattr(self.__session_registry, 'session', None)
         if session is None:
             if not self._repository.autocommit:
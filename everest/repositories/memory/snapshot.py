@@ -0,0 +1,230 @@
+"""
+Binary snapshots of the entities held in a memory repository.
+
+This file is part of the everest project.
+See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
+
+Created on Oct 16, 2026.
+"""
+from logging import getLogger as get_logger
+from pyramid.compat import pickle
+from threading import Event
+from threading import Lock
+from threading import Thread
+import os
+
+__docformat__ = 'reStructuredText en'
+__all__ = ['SnapshotLoader',
+           'SnapshotScheduler',
+           'dump_snapshot',
+           'load_snapshot',
+           'write_snapshot',
+           ]
+
+
+#: Leading bytes of a snapshot file; the trailing digit is the format
+#: version.
+SNAPSHOT_MAGIC = b'EVEREST-SNAPSHOT-1\n'
+
+
+def dump_snapshot(entity_map, stream):
+    """
+    Writes a binary snapshot of the given entities to the given stream.
+
+    The snapshot consists of a header listing the entity classes and the
+    IDs of the entities of each class, followed by the lists of the states
+    (instance dictionaries) of the entities of each class. References to
+    entities of the classes in the snapshot are stored as (class index,
+    entity ID) pairs so that relationships survive the round trip without
+    pickling the entity graph recursively; this also holds for referenced
+    entities which are not identical with, but equal to the given entities.
+    Other referenced entities are stored by value. The session state is
+    stripped from all entities.
+
+    :param entity_map: Sequence of (entity class, entity sequence) tuples.
+    :param stream: Binary stream to write to.
+    """
+    entity_map = [(ent_cls, list(ents)) for (ent_cls, ents) in entity_map]
+    cls_indices = dict((ent_cls, cls_idx)
+                       for (cls_idx, (ent_cls, _)) in enumerate(entity_map))
+    def persistent_id(obj):
+        cls_idx = cls_indices.get(type(obj))
+        if not cls_idx is None:
+            key = (cls_idx, obj.id)
+        elif '__everest__' in getattr(obj, '__dict__', ()):
+            key = (None, type(obj), _get_state(obj))
+        else:
+            key = None
+        return key
+    stream.write(SNAPSHOT_MAGIC)
+    pickler = pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump([(ent_cls, [ent.id for ent in ents])
+                  for (ent_cls, ents) in entity_map])
+    for _, ents in entity_map:
+        pickler.dump([_get_state(ent) for ent in ents])
+
+
+def load_snapshot(stream):
+    """
+    Reads a binary snapshot written with :func:`dump_snapshot` from the
+    given stream.
+
+    :returns: Dictionary mapping entity classes to lists of entities.
+    :raises ValueError: If the stream does not contain a snapshot.
+    """
+    if stream.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError('Invalid snapshot format.')
+    unpickler = pickle.Unpickler(stream)
+    shells = []
+    shell_maps = []
+    def persistent_load(key):
+        if key[0] is None:
+            _, ent_cls, state = key
+            ent = ent_cls.__new__(ent_cls)
+            ent.__dict__.update(state)
+        else:
+            ent = shell_maps[key[0]][key[1]]
+        return ent
+    unpickler.persistent_load = persistent_load
+    header = unpickler.load()
+    # All entities are created before any state is restored so that the
+    # references between them can be resolved by ID in a single pass.
+    for ent_cls, ent_ids in header:
+        ents = []
+        shell_map = {}
+        for ent_id in ent_ids:
+            ent = ent_cls.__new__(ent_cls)
+            ent.__dict__['id'] = ent_id
+            ents.append(ent)
+            shell_map[ent_id] = ent
+        shells.append(ents)
+        shell_maps.append(shell_map)
+    for ents in shells:
+        for ent, state in zip(ents, unpickler.load()):
+            ent.__dict__.update(state)
+    return dict((ent_cls, ents)
+                for ((ent_cls, _), ents) in zip(header, shells))
+
+
+def write_snapshot(entity_map, path):
+    """
+    Writes a binary snapshot of the given entities to the file with the
+    given path (cf. :func:`dump_snapshot`).
+
+    The snapshot is written to a temporary file first which then replaces
+    the target file so that readers never see a partially written
+    snapshot.
+    """
+    tmp_path = '%s.tmp' % path
+    stream = open(tmp_path, 'wb')
+    with stream:
+        dump_snapshot(entity_map, stream)
+    if os.name == 'nt' and os.path.exists(path):
+        # Renaming does not replace existing files on Windows.
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+class SnapshotLoader(object):
+    """
+    Cache loader reading the entities of a memory repository from a
+    snapshot file.
+
+    Configure an instance of this class as the `cache_loader` of a memory
+    repository to populate it from a snapshot written with
+    :meth:`everest.repositories.memory.repository.MemoryRepository.write_snapshot`.
+    The snapshot file is read once and its entities are handed out class by
+    class; once all of them were handed out, the next call re-reads the
+    file (e.g., after the repository was reset).
+    """
+    def __init__(self, path):
+        """
+        :param str path: Path of the snapshot file. If the file does not
+          exist, no entities are loaded.
+        """
+        self.__path = path
+        self.__entity_map = None
+        self.__lock = Lock()
+
+    def __call__(self, entity_class):
+        with self.__lock:
+            if self.__entity_map is None:
+                if not os.path.exists(self.__path):
+                    return []
+                stream = open(self.__path, 'rb')
+                with stream:
+                    self.__entity_map = load_snapshot(stream)
+            ents = self.__entity_map.pop(entity_class, [])
+            if len(self.__entity_map) == 0:
+                self.__entity_map = None
+        return ents
+
+
+class SnapshotScheduler(object):
+    """
+    Calls a snapshot writing callback at regular intervals in a daemon
+    thread.
+
+    Exceptions raised by the callback are logged; the next call happens
+    after the next interval.
+    """
+    def __init__(self, callback, interval):
+        """
+        :param callback: Callable without arguments writing a snapshot.
+        :param float interval: Time (in seconds) between two calls.
+        """
+        self.__callback = callback
+        self.__interval = interval
+        self.__stopped = Event()
+        self.__flush = False
+        self.__thread = None
+        self.__logger = get_logger('everest.repositories')
+
+    def start(self):
+        """
+        Starts calling the callback.
+        """
+        self.__stopped.clear()
+        self.__flush = False
+        self.__thread = Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self, flush=False):
+        """
+        Stops calling the callback, waiting for a running call to finish.
+
+        :param bool flush: If this is set, the callback is called one last
+          time (in the scheduler thread) before the thread ends.
+        """
+        self.__flush = flush
+        self.__stopped.set()
+        if not self.__thread is None:
+            self.__thread.join()
+            self.__thread = None
+
+    @property
+    def is_running(self):
+        return not self.__thread is None
+
+    def __run(self):
+        while not self.__stopped.wait(self.__interval):
+            self.__call()
+        if self.__flush:
+            self.__call()
+
+    def __call(self):
+        try:
+            self.__callback()
+        except Exception: # catch Exception pylint: disable=W0703
+            self.__logger.exception('Scheduled snapshot callback failed.')
+
+
+def _get_state(entity):
+    # Strips the session state (if any) from the instance dictionary.
+    state = entity.__dict__
+    if '__everest__' in state:
+        state = state.copy()
+        del state['__everest__']
+    return state
@@ -6,8 +6,13 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jan 7, 2013.
 """
+from everest.constants import RESOURCE_ATTRIBUTE_KINDS
 from everest.entities.base import RootAggregate
 from everest.querying.base import EXPRESSION_KINDS
+from everest.querying.filtering import FilterSpecificationKeyVisitor
+from everest.querying.ordering import OrderSpecificationKeyVisitor
+from everest.repositories.rdb.querying import CachedResultRdbQuery
+from everest.repositories.rdb.utils import OrmAttributeInspector
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['RdbAggregate',
@@ -29,3 +34,55 @@ class RdbAggregate(RootAggregate):
         return RootAggregate.query(
                     self,
                     query_class=self._session_factory.counting_query_class)
+
+    def can_seek(self, attribute_names):
+        # SQL comparisons with NULL are never true, so entities with a NULL
+        # value for any of the attributes could not be reached with keyset
+        # criteria. Nested attributes are read through outer joins, which
+        # produce NULL values for missing related entities.
+        for attr_name in attribute_names:
+            if '.' in attr_name:
+                return False
+            kind, entity_attr = \
+                OrmAttributeInspector.inspect(self.entity_class, attr_name)[-1]
+            if kind != RESOURCE_ATTRIBUTE_KINDS.TERMINAL \
+               or any(col.nullable
+                      for col in entity_attr.property.columns):
+                return False
+        return True
+
+    def _get_ordered_query(self, key):
+        # Overwritten to serve filtered or ordered queries from the query
+        # result cache of the repository, if enabled. We do not use the
+        # cache if the session has changed entities of our entity class
+        # in the current transaction (the cached results would not reflect
+        # these changes).
+        query = RootAggregate._get_ordered_query(self, key)
+        query_cache = self._repository.query_cache
+        if not query_cache is None \
+           and not (self.filter is None and self.order is None) \
+           and not self._session.has_changes(self.entity_class):
+            cache_key = self.__make_cache_key()
+            if not cache_key is None:
+                query = CachedResultRdbQuery(query, query_cache,
+                                             self.entity_class, cache_key)
+        return query
+
+    def __make_cache_key(self):
+        if not self.filter is None:
+            filter_key = FilterSpecificationKeyVisitor.make_key(self.filter)
+            if filter_key is None:
+                return None
+        else:
+            filter_key = None
+        if not self.order is None:
+            order_key = OrderSpecificationKeyVisitor.make_key(self.order)
+            if order_key is None:
+                return None
+        else:
+            order_key = None
+        if not self.slice is None:
+            slice_key = (self.slice.start, self.slice.stop)
+        else:
+            slice_key = None
+        return (filter_key, order_key, slice_key)
@@ -34,7 +34,8 @@ from sqlalchemy.sql.expression import over
 from zope.interface import implementer # pylint: disable=E0611,F0401
 
 __docformat__ = 'reStructuredText en'
-__all__ = ['OptimizedCountingRdbQuery',
+__all__ = ['CachedResultRdbQuery',
+           'OptimizedCountingRdbQuery',
            'OrderClauseList',
            'RdbQuery',
            'SqlFilterSpecificationVisitor',
@@ -297,3 +298,55 @@ class OptimizedCountingRdbQuery(RdbQuery): # pragma: no cover
         else:
             count = 0
         return count, res
+
+
+class CachedResultRdbQuery(object):
+    """
+    Wrapper for a query for the RDB backend which keeps the IDs of the
+    returned entities in a query result cache.
+
+    On a cache hit, the entities are loaded with a single query by ID (in
+    the order of the cached IDs) instead of running the wrapped query.
+    Counting is always delegated to the wrapped query, as is loading if
+    the session has changed entities of the queried class by the time the
+    query is run (the cached IDs would not reflect these changes).
+    """
+    def __init__(self, query, query_cache, entity_class, key):
+        """
+        :param query: Query to wrap.
+        :param query_cache: Query result cache.
+        :type query_cache:
+          :class:`everest.repositories.utils.QueryResultCache`
+        :param entity_class: Entity class queried by the wrapped query.
+        :param key: Cache key for the wrapped query.
+        """
+        self.__query = query
+        self.__query_cache = query_cache
+        self.__entity_class = entity_class
+        self.__key = key
+
+    def __iter__(self):
+        if self.__query.session.has_changes(self.__entity_class):
+            return iter(self.__query)
+        ids = self.__query_cache.get(self.__entity_class, self.__key)
+        if ids is None:
+            generation = \
+                    self.__query_cache.get_generation(self.__entity_class)
+            ents = list(self.__query)
+            self.__query_cache.set(self.__entity_class, self.__key,
+                                   [ent.id for ent in ents], generation)
+        elif len(ids) > 0:
+            ent_cls = self.__entity_class
+            id_query = self.__query.session.query(ent_cls) \
+                                        .filter(ent_cls.id.in_(ids))
+            ent_map = dict((ent.id, ent) for ent in id_query)
+            ents = [ent_map[ent_id] for ent_id in ids if ent_id in ent_map]
+        else:
+            ents = []
+        return iter(ents)
+
+    def all(self):
+        return list(iter(self))
+
+    def count(self):
+        return self.__query.count()
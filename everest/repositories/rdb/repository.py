@@ -22,6 +22,7 @@ from everest.repositories.rdb.utils import map_system_entities
 from everest.repositories.rdb.utils import reset_metadata
 from everest.repositories.rdb.utils import set_metadata
 from everest.repositories.utils import get_engine
+from everest.repositories.utils import QueryResultCache
 from everest.repositories.utils import is_engine_initialized
 from everest.repositories.utils import set_engine
 
@@ -34,9 +35,23 @@ __all__ = ['RdbRepository',
 class RdbRepository(Repository):
     """
     Repository connected to a relational database backend (through an ORM).
+
+    The following options can be configured:
+
+    db_string
+        Database connection string (defaults to an in-memory sqlite DB).
+    metadata_factory
+        Callable creating the metadata for a given engine.
+    query_cache_size
+        Maximum number of filtered or ordered query results (lists of entity
+        IDs) to keep in the query result cache (see :attr:`query_cache`).
+        The cached results for an entity class are discarded whenever a
+        transaction which changed entities of that class ends. The cache is
+        disabled by default (since it does not notice changes made to the
+        database by other processes).
     """
     _configurables = Repository._configurables \
-                     + ['db_string', 'metadata_factory']
+                     + ['db_string', 'metadata_factory', 'query_cache_size']
 
     def __init__(self, name, aggregate_class=None,
                  autoflush=True, join_transaction=True, autocommit=False):
@@ -51,9 +66,21 @@ class RdbRepository(Repository):
         #: Flag indicating if changes should be flushed to the treansaction
         #: automatically.
         self.autoflush = autoflush
+        self.__query_cache = None
         # Default to an in-memory sqlite DB.
         self.configure(db_string='sqlite://',
-                       metadata_factory=empty_metadata)
+                       metadata_factory=empty_metadata,
+                       query_cache_size=0)
+
+    @property
+    def query_cache(self):
+        """
+        The query result cache of this repository
+        (:class:`everest.repositories.utils.QueryResultCache`) or `None`, if
+        the query result cache is disabled. Use this to inspect the hit and
+        miss counters at runtime.
+        """
+        return self.__query_cache
 
     def _initialize(self):
         # Manages a RDB engine and a metadata instance for this repository.
@@ -84,6 +111,9 @@ class RdbRepository(Repository):
         else:
             metadata = get_metadata(self.name)
         metadata.bind = engine
+        query_cache_size = self._config['query_cache_size']
+        if query_cache_size > 0:
+            self.__query_cache = QueryResultCache(query_cache_size)
 
     def _reset(self):
         # It is safe to keep the engine around, even for complex unit test
@@ -91,6 +121,8 @@ class RdbRepository(Repository):
         # removed.
         if is_metadata_initialized(self.name):
             reset_metadata()
+        if not self.__query_cache is None:
+            self.__query_cache.clear()
 
     def _make_session_factory(self):
         engine = get_engine(self.name)
@@ -8,8 +8,11 @@ Created on Jan 8, 2013.
 """
 from collections import OrderedDict
 from collections import defaultdict
+from functools import partial
+from itertools import chain
 
 from pyramid.compat import itervalues_
+from sqlalchemy import event
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
@@ -229,6 +232,11 @@ class RdbSession(SaSession, Session):
         self.__repository = options.pop('repository')
         SaSession.__init__(self, *args, **options)
         self.__query_factory = QueryFactory(self)
+        # Entity classes with changes flushed in the current transaction.
+        self.__changed_entity_classes = set()
+        event.listen(self, 'after_flush', self.__after_flush)
+        event.listen(self, 'after_transaction_end',
+                     self.__after_transaction_end)
 
     def configure_loaders(self, context, representer_configuration):
         trv = RepresenterConfigTraverser(representer_configuration)
@@ -264,11 +272,47 @@ class RdbSession(SaSession, Session):
     def update(self, entity_class, data, target=None):
         if not IEntity.providedBy(data): # pylint: disable=E1101
             upd_ent = self.__run_traversal(entity_class, data, target,
-                                           RELATION_OPERATIONS.UPDATE)
+                                           RELATION_OPERATIONS.UPDATE).root
         else:
             upd_ent = SaSession.merge(self, data)
         return upd_ent
 
+    def add_many(self, entity_class, data_items):
+        data_items = list(data_items)
+        if all(IEntity.providedBy(data) # pylint: disable=E1101
+               for data in data_items):
+            SaSession.add_all(self, data_items)
+        else:
+            # The root entities are collected during the traversal and
+            # added in one call so that SQLAlchemy can batch the INSERT
+            # statements when the session is flushed.
+            new_ents = []
+            self.__run_traversal(entity_class, data_items, None,
+                                 RELATION_OPERATIONS.ADD,
+                                 add_callback=
+                                    partial(self.__add_many, new_ents))
+            SaSession.add_all(self, new_ents)
+
+    def remove_many(self, entity_class, data_items):
+        data_items = list(data_items)
+        if all(IEntity.providedBy(data) # pylint: disable=E1101
+               for data in data_items):
+            for data in data_items:
+                SaSession.delete(self, data)
+        else:
+            self.__run_traversal(entity_class, None, data_items,
+                                 RELATION_OPERATIONS.REMOVE)
+
+    def update_many(self, entity_class, data_items):
+        data_items = list(data_items)
+        if all(IEntity.providedBy(data) # pylint: disable=E1101
+               for data in data_items):
+            upd_ents = [SaSession.merge(self, data) for data in data_items]
+        else:
+            upd_ents = self.__run_traversal(entity_class, data_items, None,
+                                            RELATION_OPERATIONS.UPDATE).roots
+        return upd_ents
+
     def query(self, *entities, **options):
         if len(entities) == 1:
             ent_obj = entities[0]
@@ -286,24 +330,61 @@ class RdbSession(SaSession, Session):
         self.rollback()
         self.expunge_all()
 
-    def __run_traversal(self, entity_class, source_data, target_data, rel_op):
+    def has_changes(self, entity_class):
+        """
+        Checks if entities of the given class have been changed in the
+        current transaction, either in a flush or in pending (not yet
+        flushed) changes.
+        """
+        return entity_class in self.__changed_entity_classes \
+               or any(type(ent) is entity_class
+                      for ent in chain(self.new, self.dirty, self.deleted))
+
+    def __after_flush(self, session, flush_context): # pylint: disable=W0613
+        ent_clss = set(type(ent) for ent in chain(session.new, session.dirty,
+                                                  session.deleted))
+        self.__changed_entity_classes.update(ent_clss)
+        self.__invalidate_query_cache(ent_clss)
+
+    def __after_transaction_end(self, session, transaction): # pylint: disable=W0613
+        # Only the end of the outermost transaction (commit, rollback or
+        # close) makes our changes visible to or discards them for other
+        # sessions.
+        if transaction._parent is None: # pylint: disable=W0212
+            self.__invalidate_query_cache(self.__changed_entity_classes)
+            self.__changed_entity_classes.clear()
+
+    def __invalidate_query_cache(self, entity_classes):
+        query_cache = self.__repository.query_cache
+        if not query_cache is None:
+            for ent_cls in entity_classes:
+                query_cache.invalidate(ent_cls)
+
+    def __run_traversal(self, entity_class, source_data, target_data, rel_op,
+                        add_callback=None):
         agg = self.__repository.get_aggregate(entity_class)
         trv = SourceTargetDataTreeTraverser.make_traverser(
                                     source_data, target_data, rel_op,
                                     accessor=agg,
                                     manage_back_references=False)
+        if add_callback is None:
+            add_callback = self.__add
         vst = AruVisitor(entity_class,
-                         add_callback=self.__add,
+                         add_callback=add_callback,
                          remove_callback=self.__remove,
                          update_callback=self.__update,
                          pass_path_to_callbacks=True)
         trv.run(vst)
-        return vst.root
+        return vst
 
     def __add(self, entity, path): # pylint: disable=W0613
         if len(path) == 0:
             SaSession.add(self, entity)
 
+    def __add_many(self, new_entities, entity, path):
+        if len(path) == 0:
+            new_entities.append(entity)
+
     def __remove(self, entity, path): # pylint: disable=W0613
         if len(path) == 0:
             SaSession.delete(self, entity)
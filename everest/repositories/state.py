@@ -6,11 +6,10 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Mar 14, 2013.
 """
-from everest.entities.attributes import get_domain_class_attribute_iterator
-from everest.entities.attributes import get_domain_class_attribute_names
-from everest.utils import get_nested_attribute
-from everest.utils import set_nested_attribute
+from everest.compat import izip
+from operator import attrgetter
 from pyramid.compat import iteritems_
+from pyramid.compat import itervalues_
 from weakref import ref
 
 __docformat__ = 'reStructuredText en'
@@ -39,8 +38,25 @@ class EntityState(object):
     Only a weak reference to the tracked object is stored to avoid circular
     references.
 
+    Entities which report attribute changes (i.e., entities with a true
+    `__everest_tracking__` class attribute such as subclasses of
+    :class:`everest.entities.base.Entity`) call :meth:`attribute_changing`
+    before setting an attribute. For these, the state records the clean
+    value of each (non-nested) attribute the first time it is set and a
+    CLEAN entity is DIRTY if any recorded value differs from the current
+    value; checking the status is therefore independent of the number of
+    entity attributes. For all other entities, the state data are compared
+    with the data at the time the entity was last marked CLEAN, which are
+    stored as a tuple of values aligned with the attribute order of the
+    entity class.
+
+    As before, changes made in place to a collection attribute value (e.g.,
+    appending to a list) are not detected.
+
     Not all status transitions are allowed.
     """
+    __slots__ = ('__entity_ref', '__uow_ref', '__status', '__tracks_changes',
+                 '__clean_values', '__clean_data', 'is_persisted')
     # FIXME: Need a proper state diagram here or drop tracking alltogether.
     __invalid_transitions = set([(ENTITY_STATUS.DELETED, ENTITY_STATUS.DIRTY),
                                  (ENTITY_STATUS.NEW, ENTITY_STATUS.DIRTY)
@@ -50,7 +66,17 @@ class EntityState(object):
         self.__entity_ref = ref(entity)
         self.__uow_ref = ref(unit_of_work)
         self.__status = None
-        self.__clean_data = self.data
+        self.__tracks_changes = getattr(type(entity), '__everest_tracking__',
+                                        False)
+        if self.__tracks_changes:
+            # Maps names of attributes set since the entity was last marked
+            # CLEAN to their clean values.
+            self.__clean_values = {}
+            self.__clean_data = None
+        else:
+            self.__clean_values = None
+            self.__clean_data = \
+                        _get_accessor_plan(type(entity)).get_values(entity)
         #: Flag indicating if this state has been flushed to the backend.
         self.is_persisted = False
 
@@ -103,11 +129,7 @@ class EntityState(object):
 
         This also works for unmanaged entities.
         """
-        attrs = get_domain_class_attribute_iterator(type(entity))
-        return dict([(attr,
-                      get_nested_attribute(entity, attr.entity_attr))
-                     for attr in attrs
-                     if not attr.entity_attr is None])
+        return _get_accessor_plan(type(entity)).get_data(entity)
 
     @classmethod
     def set_state_data(cls, entity, data):
@@ -116,23 +138,7 @@ class EntityState(object):
 
         This also works for unmanaged entities.
         """
-        attr_names = get_domain_class_attribute_names(type(entity))
-        nested_items = []
-        for attr, new_attr_value in iteritems_(data):
-            if not attr.entity_attr in attr_names:
-                raise ValueError('Can not set attribute "%s" for entity '
-                                 '"%s".' % (attr.entity_attr, entity))
-            if '.' in attr.entity_attr:
-                nested_items.append((attr, new_attr_value))
-                continue
-            else:
-                setattr(entity, attr.entity_attr, new_attr_value)
-        for attr, new_attr_value in nested_items:
-            try:
-                set_nested_attribute(entity, attr.entity_attr, new_attr_value)
-            except AttributeError as exc:
-                if not new_attr_value is None:
-                    raise exc
+        _get_accessor_plan(type(entity)).set_data(entity, data)
 
     @classmethod
     def transfer_state_data(cls, source_entity, target_entity):
@@ -168,13 +174,70 @@ class EntityState(object):
 
     @property
     def clean_data(self):
-        return self.__clean_data
+        """
+        The state data at the time the entity was last marked CLEAN.
+        """
+        if self.__tracks_changes:
+            ent = self.__entity_ref()
+            plan = _get_accessor_plan(type(ent))
+            attr_map = plan.flat_attribute_map
+            data = plan.get_data(ent)
+            for name, value in iteritems_(self.__clean_values):
+                data[attr_map[name]] = value
+        else:
+            ent = self.__entity_ref()
+            data = dict(izip(_get_accessor_plan(type(ent)).state_attributes,
+                             self.__clean_data))
+        return data
+
+    @property
+    def changed_data(self):
+        """
+        The state data for the attributes that were changed since the entity
+        was last marked CLEAN. For entities which do not report attribute
+        changes, this returns all state data.
+        """
+        if self.__tracks_changes:
+            ent = self.__entity_ref()
+            attr_map = _get_accessor_plan(type(ent)).flat_attribute_map
+            data = {}
+            for name, clean_value in iteritems_(self.__clean_values):
+                value = getattr(ent, name, None)
+                if value != clean_value:
+                    data[attr_map[name]] = value
+        else:
+            data = self.data
+        return data
+
+    def attribute_changing(self, entity, name):
+        """
+        Records the clean value of the given attribute of the given entity
+        before it is changed for the first time.
+        """
+        clean_values = self.__clean_values
+        if not clean_values is None and not name in clean_values \
+           and name in _get_accessor_plan(type(entity)).flat_attribute_map:
+            clean_values[name] = getattr(entity, name, None)
+
+    def __is_modified(self):
+        if self.__tracks_changes:
+            ent = self.__entity_ref()
+            is_modified = False
+            for name, clean_value in iteritems_(self.__clean_values):
+                if getattr(ent, name, None) != clean_value:
+                    is_modified = True
+                    break
+        else:
+            ent = self.__entity_ref()
+            is_modified = \
+                _get_accessor_plan(type(ent)).get_values(ent) \
+                != self.__clean_data
+        return is_modified
 
     def __get_status(self):
         status = self.__status
-        if status == ENTITY_STATUS.CLEAN:
-            if self.data != self.__clean_data:
-                status = ENTITY_STATUS.DIRTY
+        if status == ENTITY_STATUS.CLEAN and self.__is_modified():
+            status = ENTITY_STATUS.DIRTY
         return status
 
     def __set_status(self, status):
@@ -183,7 +246,12 @@ class EntityState(object):
                              % (self.__status, status))
         self.__status = status
         if status == ENTITY_STATUS.CLEAN:
-            self.__clean_data = self.data
+            if self.__tracks_changes:
+                self.__clean_values.clear()
+            else:
+                ent = self.__entity_ref()
+                self.__clean_data = \
+                        _get_accessor_plan(type(ent)).get_values(ent)
 
     #: The current status. One of the `ENTITY_STATUS` constants.
     status = property(__get_status, __set_status)
@@ -196,3 +264,113 @@ class EntityState(object):
     def entity(self):
         return self.__entity_ref()
 
+
+class _AccessorPlan(object):
+    """
+    Precompiled accessors for the state data of an entity class.
+
+    The plan is built once from the attribute collection of the entity
+    class: Nested attribute paths are split up front and flat attributes
+    are kept apart from nested attributes so that reading and writing state
+    data does not need to inspect the attributes again.
+    """
+    __slots__ = ('attributes', 'state_attributes', 'flat_attribute_map',
+                 '__getters', '__nested_paths')
+
+    def __init__(self, attributes):
+        #: The attribute collection this plan was built from.
+        self.attributes = attributes
+        state_attrs = []
+        getters = []
+        #: Maps the names of the flat entity attributes to resource
+        #: attributes.
+        self.flat_attribute_map = {}
+        # Maps the names of the nested entity attributes to (parent path,
+        # attribute name) tuples.
+        self.__nested_paths = {}
+        for attr in itervalues_(attributes):
+            name = attr.entity_attr
+            if name is None:
+                continue
+            state_attrs.append(attr)
+            if '.' in name:
+                tokens = name.split('.')
+                getters.append(_make_nested_getter(tokens))
+                self.__nested_paths[name] = (tokens[:-1], tokens[-1])
+            else:
+                getters.append(attrgetter(name))
+                self.flat_attribute_map[name] = attr
+        #: The state attributes (i.e., the resource attributes with an
+        #: entity attribute) in attribute order.
+        self.state_attributes = tuple(state_attrs)
+        self.__getters = tuple(getters)
+
+    def get_values(self, entity):
+        """
+        Returns the state data of the given entity as a tuple aligned with
+        :attr:`state_attributes`.
+        """
+        return tuple([getter(entity) for getter in self.__getters])
+
+    def get_data(self, entity):
+        """
+        Returns the state data of the given entity as a dictionary mapping
+        resource attributes to values.
+        """
+        return dict(izip(self.state_attributes, self.get_values(entity)))
+
+    def set_data(self, entity, data):
+        """
+        Sets the given state data on the given entity. Flat attributes are
+        set before nested attributes; nested attributes with a `None` value
+        are skipped if they can not be set.
+        """
+        nested_items = []
+        for attr, value in iteritems_(data):
+            name = attr.entity_attr
+            if name in self.flat_attribute_map:
+                setattr(entity, name, value)
+            else:
+                path = self.__nested_paths.get(name)
+                if path is None:
+                    raise ValueError('Can not set attribute "%s" for entity '
+                                     '"%s".' % (name, entity))
+                nested_items.append((path, value))
+        for (parent_tokens, name), value in nested_items:
+            try:
+                parent = entity
+                for token in parent_tokens:
+                    parent = getattr(parent, token)
+                    if parent is None:
+                        raise AttributeError('Can not set attribute "%s" '
+                                             'on None value.' % name)
+                setattr(parent, name, value)
+            except AttributeError:
+                if not value is None:
+                    raise
+
+
+def _make_nested_getter(tokens):
+    # Returns a getter for a nested attribute path which returns None if
+    # any of the parents on the path is None.
+    def get_nested(obj):
+        for token in tokens:
+            obj = getattr(obj, token)
+            if obj is None:
+                break
+        return obj
+    return get_nested
+
+
+# Maps entity classes to their accessor plans.
+_ACCESSOR_PLANS = {}
+
+
+def _get_accessor_plan(entity_class):
+    attrs = entity_class.__everest_attributes__
+    plan = _ACCESSOR_PLANS.get(entity_class)
+    if plan is None or not plan.attributes is attrs:
+        # The attribute collection changes when the entity class is
+        # registered again with a new configuration.
+        plan = _ACCESSOR_PLANS[entity_class] = _AccessorPlan(attrs)
+    return plan
@@ -6,10 +6,15 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jan 16, 2013.
 """
+from collections import OrderedDict
 from collections import defaultdict
 from everest.repositories.state import ENTITY_STATUS
 from everest.repositories.state import EntityState
+from everest.resources.storing import build_resource_dependency_graph
+from everest.resources.utils import get_member_class
 from everest.utils import WeakOrderedSet
+from pygraph.algorithms.sorting import topological_sorting # pylint: disable=E0611,F0401
+from zope.interface.interfaces import ComponentLookupError # pylint: disable=E0611,F0401
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['UnitOfWork',
@@ -23,10 +28,13 @@ class UnitOfWork(object):
 
     Responsibilities:
      * Clone CLEAN entities upon registration;
-     * Record entity state changes.
+     * Record entity state changes;
+     * Plan the order in which pending changes are flushed.
     """
     def __init__(self):
-        self.__entity_set_map = defaultdict(WeakOrderedSet)
+        self.__entity_set_map = _EntitySetMap()
+        # Maps sets of entity classes to their dependency order.
+        self.__dependency_order_map = {}
 
     def register_new(self, entity_class, entity):
         """
@@ -39,6 +47,20 @@ class UnitOfWork(object):
         EntityState.get_state(entity).status = ENTITY_STATUS.NEW
         self.__entity_set_map[entity_class].add(entity)
 
+    def register_new_many(self, entity_class, entities):
+        """
+        Registers the given sequence of entities for the given class as NEW
+        in one batch.
+
+        :raises ValueError: If any of the given entities already holds state
+          that was created by another Unit Of Work.
+        """
+        entity_set = self.__entity_set_map[entity_class]
+        for entity in entities:
+            EntityState.manage(entity, self)
+            EntityState.get_state(entity).status = ENTITY_STATUS.NEW
+            entity_set.add(entity)
+
     def register_clean(self, entity_class, entity):
         """
         Registers the given entity for the given class as CLEAN.
@@ -203,13 +225,53 @@ class UnitOfWork(object):
     def iterator(self):
         """
         Returns an iterator over all entity states held by this Unit Of Work.
+
+        :note: States are iterated in registration order; use
+          :meth:`batch_iterator` to obtain the pending states in an order
+          suitable for flushing.
         """
-        # FIXME: There is no dependency tracking; objects are iterated in
-        #        random order.
         for ent_cls in list(self.__entity_set_map.keys()):
             for ent in self.__entity_set_map[ent_cls]:
                 yield EntityState.get_state(ent)
 
+    def batch_iterator(self):
+        """
+        Returns an iterator over the pending (i.e., not yet persisted) entity
+        states held by this Unit Of Work, grouped into batches that can be
+        persisted in one pass each.
+
+        Each batch is an (entity class, status, list of states) tuple; CLEAN
+        states are skipped. The batches are ordered using the resource
+        dependency graph (cf.
+        :func:`everest.resources.storing.build_resource_dependency_graph`):
+        NEW and DIRTY batches come first, with parent entity classes (i.e.,
+        classes referencing other classes through member or collection
+        attributes) before their child classes; DELETED batches follow,
+        with child classes before their parent classes. Within a batch,
+        states are in registration order.
+        """
+        batch_map = defaultdict(list)
+        for ent_cls in list(self.__entity_set_map.keys()):
+            for ent in self.__entity_set_map[ent_cls]:
+                state = EntityState.get_state(ent)
+                if state.is_persisted:
+                    continue
+                status = state.status
+                if status != ENTITY_STATUS.CLEAN:
+                    batch_map[(ent_cls, status)].append(state)
+        if len(batch_map) > 0:
+            ent_clss = self.__get_dependency_order(
+                        frozenset([ent_cls for (ent_cls, _) in batch_map]))
+            for ent_cls in ent_clss:
+                for status in (ENTITY_STATUS.NEW, ENTITY_STATUS.DIRTY):
+                    states = batch_map.get((ent_cls, status))
+                    if not states is None:
+                        yield ent_cls, status, states
+            for ent_cls in reversed(ent_clss):
+                states = batch_map.get((ent_cls, ENTITY_STATUS.DELETED))
+                if not states is None:
+                    yield ent_cls, ENTITY_STATUS.DELETED, states
+
     def reset(self):
         """
         Releases all entities held by this Unit Of Work (i.e., removes state
@@ -220,6 +282,40 @@ class UnitOfWork(object):
                 EntityState.release(ent, self)
         self.__entity_set_map.clear()
 
+    def __get_dependency_order(self, entity_classes):
+        # Returns the given entity classes sorted such that each class comes
+        # before the classes it references. Since the dependency graph does
+        # not follow back-references, the class registered first determines
+        # the direction of bidirectional relationships. Classes without a
+        # registered resource come last, in registration order.
+        ent_clss = self.__dependency_order_map.get(entity_classes)
+        if ent_clss is None:
+            mb_clss = []
+            mb_cls_map = {}
+            others = []
+            for ent_cls in self.__entity_set_map.keys():
+                if not ent_cls in entity_classes:
+                    continue
+                try:
+                    mb_cls = get_member_class(ent_cls)
+                except ComponentLookupError:
+                    others.append(ent_cls)
+                else:
+                    mb_clss.append(mb_cls)
+                    mb_cls_map[mb_cls] = ent_cls
+            if len(mb_clss) > 1:
+                dep_grph = build_resource_dependency_graph(mb_clss)
+                # The graph also contains referenced classes without
+                # pending states; we skip these.
+                ent_clss = [mb_cls_map[mb_cls]
+                            for mb_cls in topological_sorting(dep_grph)
+                            if mb_cls in mb_cls_map]
+            else:
+                ent_clss = [mb_cls_map[mb_cls] for mb_cls in mb_clss]
+            ent_clss.extend(others)
+            self.__dependency_order_map[entity_classes] = ent_clss
+        return ent_clss
+
     def __object_iterator(self, status, ent_cls):
         if ent_cls is None:
             ent_clss = self.__entity_set_map.keys()
@@ -229,3 +325,11 @@ class UnitOfWork(object):
             for ent in self.__entity_set_map[ent_cls]:
                 if EntityState.get_state(ent).status == status:
                     yield ent
+
+
+class _EntitySetMap(OrderedDict):
+    # Maps entity classes to entity sets in registration order, creating
+    # missing entity sets on the fly.
+    def __missing__(self, key):
+        value = self[key] = WeakOrderedSet()
+        return value
@@ -6,14 +6,21 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jan 17, 2013.
 """
+from collections import OrderedDict
 from everest.repositories.interfaces import IRepository
+from itertools import count
+from operator import itemgetter
 from pyramid.threadlocal import get_current_registry
 from threading import Lock
+from threading import RLock
 from zope.interface import providedBy as provided_by # pylint: disable=E0611,F0401
 from zope.interface.interfaces import IInterface # pylint: disable=E0611,F0401
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['GlobalObjectManager',
+           'QueryResultCache',
+           'ReadOnlySessionContext',
+           'StripedLock',
            'commit_veto',
            'get_engine',
            'is_engine_initialized',
@@ -75,6 +82,165 @@ is_engine_initialized = _DbEngineManager.is_initialized
 reset_engines = _DbEngineManager.reset
 
 
+class QueryResultCache(object):
+    """
+    Bounded cache for query results.
+
+    Maps query keys (built from the canonicalized filter specification,
+    order specification and slice of a query) to the list of IDs of the
+    entities the query returned, separately for each entity class. When
+    the cache is full, the least recently used entry is evicted.
+
+    Repositories invalidate the entries for an entity class whenever they
+    persist changes to entities of that class. Each invalidation increments
+    a generation counter for the class; results computed for an older
+    generation are not stored (cf. :meth:`set`).
+    """
+    def __init__(self, max_size):
+        """
+        :param int max_size: Maximum number of cached query results.
+        """
+        if max_size < 1:
+            raise ValueError('The maximum cache size must be positive.')
+        #: Maximum number of cached query results.
+        self.max_size = max_size
+        #: Number of cache lookups which returned a result.
+        self.hits = 0
+        #: Number of cache lookups which did not return a result.
+        self.misses = 0
+        # Maps (entity class, query key) tuples to ID lists.
+        self.__entries = OrderedDict()
+        # Maps entity classes to their current generation.
+        self.__generations = {}
+        self.__lock = Lock()
+
+    def get(self, entity_class, key):
+        """
+        Returns the cached list of entity IDs for the given entity class and
+        query key or `None` if there is no such entry.
+        """
+        entry_key = (entity_class, key)
+        with self.__lock:
+            ids = self.__entries.pop(entry_key, None)
+            if ids is None:
+                self.misses += 1
+            else:
+                # Re-insert to mark as most recently used.
+                self.__entries[entry_key] = ids
+                self.hits += 1
+        return ids
+
+    def set(self, entity_class, key, ids, generation):
+        """
+        Caches the given list of entity IDs for the given entity class and
+        query key.
+
+        :param generation: Generation of the entity class at the time the
+          query was run (see :meth:`get_generation`). If the entries for
+          the class were invalidated since, the result is discarded.
+        """
+        entry_key = (entity_class, key)
+        with self.__lock:
+            if generation != self.__generations.get(entity_class, 0):
+                return
+            self.__entries.pop(entry_key, None)
+            self.__entries[entry_key] = ids
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def get_generation(self, entity_class):
+        """
+        Returns the current generation for the given entity class.
+        """
+        with self.__lock:
+            return self.__generations.get(entity_class, 0)
+
+    def invalidate(self, entity_class):
+        """
+        Discards all cached results for the given entity class.
+        """
+        with self.__lock:
+            self.__generations[entity_class] = \
+                        self.__generations.get(entity_class, 0) + 1
+            for entry_key in [entry_key for entry_key in self.__entries
+                              if entry_key[0] is entity_class]:
+                del self.__entries[entry_key]
+
+    def clear(self):
+        """
+        Discards all cached results and resets the hit and miss counters.
+        """
+        with self.__lock:
+            for entity_class in list(self.__generations.keys()):
+                self.__generations[entity_class] += 1
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class StripedLock(object):
+    """
+    Set of reentrant locks, one per key.
+
+    Repositories use this to lock the data for each entity class
+    separately so that operations on unrelated entity classes do not block
+    each other. To avoid deadlocks, the locks for several keys are always
+    acquired in the order in which they were created.
+    """
+    def __init__(self):
+        # Maps keys to (creation position, lock) tuples.
+        self.__locks = {}
+        self.__position_gen = count()
+        self.__lock = Lock()
+
+    def locking(self, keys):
+        """
+        Returns a context manager holding the locks for all of the given
+        keys.
+        """
+        locks = sorted([self.__get(key) for key in set(keys)],
+                       key=itemgetter(0))
+        return _LockingContext([lock for (_, lock) in locks])
+
+    def __get(self, key):
+        item = self.__locks.get(key)
+        if item is None:
+            with self.__lock:
+                item = self.__locks.get(key)
+                if item is None:
+                    item = self.__locks[key] = (next(self.__position_gen),
+                                                RLock())
+        return item
+
+
+class _LockingContext(object):
+    """
+    Context manager acquiring and releasing a sequence of locks.
+    """
+    def __init__(self, locks):
+        self.__locks = locks
+
+    def __enter__(self):
+        acquired = []
+        try:
+            for lock in self.__locks:
+                lock.acquire()
+                acquired.append(lock)
+        except:
+            self.__release(acquired)
+            raise
+
+    def __exit__(self, ext_type, value, tb):
+        self.__release(self.__locks)
+
+    def __release(self, locks):
+        for lock in reversed(locks):
+            lock.release()
+
+
 def as_repository(resource):
     """
     Adapts the given registered resource to its configured repository.
@@ -88,6 +254,26 @@ def as_repository(resource):
     return reg.getAdapter(resource, IRepository)
 
 
+class ReadOnlySessionContext(object):
+    """
+    A context manager that switches the session factory of the repository
+    for the given resource to read-only mode for the current thread (cf.
+    :meth:`everest.repositories.base.SessionFactory.set_read_only`) and
+    back to normal mode on exit.
+    """
+    def __init__(self, resource):
+        self.__resource = resource
+        self.__session_factory = None
+
+    def __enter__(self):
+        repo = as_repository(self.__resource)
+        self.__session_factory = repo.session_factory
+        self.__session_factory.set_read_only(True)
+
+    def __exit__(self, ext_type, value, tb):
+        self.__session_factory.set_read_only(False)
+
+
 def commit_veto(request, response): # unused request arg pylint: disable=W0613
     """
     Strict commit veto to use with the transaction manager.
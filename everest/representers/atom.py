@@ -146,9 +146,11 @@ class AtomMapping(Mapping):
                                             sortTerms=sort_terms),
                                 nsmap=self.mapping_registry.namespace_map)
         coll_data_el.append(q_el)
-        # Total results.
-        tr_tag = '{%s}%s' % (XML_NS_OPEN_SEARCH, 'totalResults')
-        setattr(coll_data_el, tr_tag, str(len(collection)))
+        # Total results. Collections loaded with look-ahead were not
+        # counted, so we do not count them here either.
+        if collection.has_more is None:
+            tr_tag = '{%s}%s' % (XML_NS_OPEN_SEARCH, 'totalResults')
+            setattr(coll_data_el, tr_tag, str(len(collection)))
         if not collection.slice is None:
             # Start index.
             si_tag = '{%s}%s' % (XML_NS_OPEN_SEARCH, 'startIndex')
@@ -27,6 +27,8 @@ class MappedAttributeKey(object):
     Each key consists of a tuple of mapped attributes that uniquely
     determine a node's position in the resource data tree.
     """
+    __slots__ = ('attributes', 'names', 'offset')
+
     def __init__(self, attributes):
         self.attributes = list(attributes)
         self.names = self._make_names(attributes)
@@ -75,6 +77,8 @@ class MappedAttribute(object):
     Wraps a (read-only) resource attribute and mapping options which can be
     configured dynamically.
     """
+    __slots__ = ('options', '__attr')
+
     def __init__(self, attr, options=None):
         """
         :param attr: Resource attribute.
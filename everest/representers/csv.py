@@ -586,15 +586,17 @@ class CsvResourceRepresenter(MappingResourceRepresenter):
 
 
 class CsvMemberDataElement(SimpleMemberDataElement):
+    __slots__ = ()
+
     converter_registry = CsvConverterRegistry
 
 
 class CsvCollectionDataElement(SimpleCollectionDataElement):
-    pass
+    __slots__ = ()
 
 
 class CsvLinkedDataElement(SimpleLinkedDataElement):
-    pass
+    __slots__ = ()
 
 
 class CsvRepresenterConfiguration(RepresenterConfiguration):
@@ -45,7 +45,12 @@ class DataElement(object):
     Data elements manage value state during serialization and deserialization.
     Implementations may need to be adapted to the format of the external
     representation they manage.
+
+    Data elements are created in large numbers during serialization and
+    deserialization; subclasses should therefore declare `__slots__`.
     """
+    __slots__ = ()
+
     #: Static attribute mapping.
     mapping = None
 
@@ -73,6 +78,8 @@ class MemberDataElement(DataElement):
     """
     Abstract base class for member data element classes.
     """
+    __slots__ = ()
+
     #: Registry of representation string <-> value converters. To be set
     #: in derived classes.
     converter_registry = None
@@ -167,6 +174,8 @@ class CollectionDataElement(DataElement):
     """
     Abstract base class for collection data elements.
     """
+    __slots__ = ()
+
     def add_member(self, data_element):
         """
         Adds the given member data element to this collection data element.
@@ -188,6 +197,8 @@ class CollectionDataElement(DataElement):
 
 
 class _SimpleDataElementMixin(object):
+    __slots__ = ()
+
     @classmethod
     def create_from_resource(cls, resource): # ignore resource pylint:disable=W0613,W0221
         return cls()
@@ -197,9 +208,13 @@ class SimpleMemberDataElement(_SimpleDataElementMixin, MemberDataElement):
     """
     Basic implementation of a member data element.
     """
+    __slots__ = ('__data',)
+
     converter_registry = SimpleConverterRegistry
 
-    __data = None
+    def __init__(self):
+        MemberDataElement.__init__(self)
+        self.__data = None
 
     def iterator(self):
         return iter(iteritems_(self.data))
@@ -286,7 +301,11 @@ class SimpleCollectionDataElement(_SimpleDataElementMixin,
     """
     Basic implementation of a collection data element.
     """
-    __members = None
+    __slots__ = ('__members',)
+
+    def __init__(self):
+        CollectionDataElement.__init__(self)
+        self.__members = None
 
     def add_member(self, data_element):
         self.members.append(data_element)
@@ -310,6 +329,8 @@ class LinkedDataElement(DataElement):
     Data element managing a linked resource during serialization and
     deserialization.
     """
+    __slots__ = ()
+
     @classmethod
     def create(cls, url, kind,
                id=None, relation=None, title=None, **options): # pylint: disable=W0622
@@ -339,11 +360,15 @@ class SimpleLinkedDataElement(LinkedDataElement):
     """
     Basic implementation of a linked data element.
     """
-    __url = None
-    __kind = None
-    __id = None
-    __relation = None
-    __title = None
+    __slots__ = ('__url', '__kind', '__id', '__relation', '__title')
+
+    def __init__(self):
+        LinkedDataElement.__init__(self)
+        self.__url = None
+        self.__kind = None
+        self.__id = None
+        self.__relation = None
+        self.__title = None
 
     @classmethod
     def create(cls, url, kind,
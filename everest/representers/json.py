@@ -232,15 +232,17 @@ class JsonResourceRepresenter(MappingResourceRepresenter):
 
 
 class JsonMemberDataElement(SimpleMemberDataElement):
+    __slots__ = ()
+
     converter_registry = JsonConverterRegistry
 
 
 class JsonCollectionDataElement(SimpleCollectionDataElement):
-    pass
+    __slots__ = ()
 
 
 class JsonLinkedDataElement(SimpleLinkedDataElement):
-    pass
+    __slots__ = ()
 
 
 class JsonRepresenterConfiguration(RepresenterConfiguration):
@@ -495,7 +495,10 @@ class MappingRegistry(object):
                              'implement one of the required interfaces.')
         name = "%s%s" % (mapped_class.__name__,
                          base_data_element_class.__name__)
-        de_cls = type(name, (base_data_element_class,), {})
+        # The data element class only adds the mapping as a class attribute;
+        # declaring empty slots keeps the instances compact.
+        de_cls = type(name, (base_data_element_class,),
+                      dict(__slots__=()))
         mp = self.mapping_class(self, mapped_class, de_cls, cfg)
         # Set the data element class' mapping.
         # FIXME: This looks like a hack.
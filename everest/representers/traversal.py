@@ -402,6 +402,9 @@ class ResourceTreeTraverser(ResourceDataTreeTraverser):
 
 class DataElementDataTraversalProxy(ConvertingDataTraversalProxyMixin,
                                     DataTraversalProxy):
+    __slots__ = ('__relationships', '__attribute_key', '__mapping',
+                 '_converted_entity')
+
     def __init__(self, data, accessor, relationship_direction,
                  relation_operation, attribute_key=None, mapping=None):
         """
@@ -420,6 +423,7 @@ class DataElementDataTraversalProxy(ConvertingDataTraversalProxyMixin,
         if mapping is None:
             mapping = data.mapping
         self.__mapping = mapping
+        self._converted_entity = None
 
     def get_id(self):
         try:
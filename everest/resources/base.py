@@ -17,6 +17,9 @@ from everest.entities.utils import get_entity_class
 from everest.entities.utils import identifier_from_slug
 from everest.entities.utils import slug_from_identifier
 from everest.querying.base import SpecificationExpressionHolder
+from everest.querying.keyset import get_keyset_order_keys
+from everest.querying.keyset import make_keyset_filter_specification
+from everest.querying.keyset import make_keyset_order_specification
 from everest.querying.interfaces import ISpecificationVisitor
 from everest.querying.specifications import AscendingOrderSpecification
 from everest.querying.utils import get_filter_specification_factory
@@ -259,6 +262,12 @@ class Collection(Resource):
     #: this is set in derived classes, no limit is enforced (i.e., the
     #: default maximum limit is None).
     max_limit = None
+    #: Flag indicating if GET requests count the members of this collection
+    #: to build the batch navigation links. If this is set to `False`, one
+    #: more member than the requested page holds is fetched instead to find
+    #: out if there is a next page, and no "last" link is built. The exact
+    #: count can still be requested with the "count=true" query parameter.
+    count_members = True
 
     def __init__(self, aggregate, name=None, relationship=None):
         """
@@ -284,6 +293,9 @@ class Collection(Resource):
         #: The order specification for this resource. Attribute names in
         #: this specification are relative to the resource.
         self._order_spec = None
+        #: The keyset pagination cursor for this resource (the order key
+        #: values of the member after which this collection starts).
+        self._cursor = None
         # The underlying aggregate.
         self.__aggregate = aggregate
 
@@ -322,13 +334,25 @@ class Collection(Resource):
         self.add(member)
         return member
 
-    def load(self):
+    def load(self, look_ahead=False):
         """
         Loads this collection with the current filter, order, and slice
         settings. Future changes to these settings will not change the
         data returned by the various access methods.
+
+        :param bool look_ahead: If set, the members in the current slice
+          are fetched along with one more member to find out if more
+          members follow the slice (cf. :attr:`has_more`).
+        """
+        self.__aggregate.load(look_ahead=look_ahead)
+
+    @property
+    def has_more(self):
+        """
+        Flag indicating if more members follow the current slice. This is
+        only known after loading with look-ahead; otherwise, it is `None`.
         """
-        self.__aggregate.load()
+        return self.__aggregate.has_more
 
     def __len__(self):
         """
@@ -452,15 +476,7 @@ class Collection(Resource):
         return filter_spec
 
     def _set_filter(self, filter_spec):
-        if not filter_spec is None:
-            # Translate to entity filter expression before passing on to the
-            # aggregate.
-            visitor = ResourceToEntityFilterSpecificationVisitor(
-                                                    get_member_class(self))
-            filter_spec.accept(visitor)
-            self.__aggregate.filter = visitor.expression
-        else:
-            self.__aggregate.filter = None
+        self.__set_aggregate_filter(filter_spec, self._cursor)
         self._filter_spec = filter_spec
 
     filter = property(_get_filter, _set_filter)
@@ -479,9 +495,26 @@ class Collection(Resource):
         else:
             self.__aggregate.order = None
         self._order_spec = order_spec
+        if not self._cursor is None:
+            # The keyset criterion depends on the order.
+            self.__set_aggregate_filter(self._filter_spec, self._cursor)
 
     order = property(_get_order, _set_order)
 
+    def _get_cursor(self):
+        return self._cursor
+
+    def _set_cursor(self, cursor):
+        self.__set_aggregate_filter(self._filter_spec, cursor)
+        self._cursor = cursor
+
+    #: Keyset pagination cursor. If this is set to the sequence of the order
+    #: key values (cf.
+    #: :func:`everest.querying.keyset.get_keyset_order_keys`) of a member,
+    #: the collection only contains the members following this member in
+    #: the current (or default) order.
+    cursor = property(_get_cursor, _set_cursor)
+
     def _get_slice(self):
         return self.__aggregate.slice
 
@@ -501,6 +534,7 @@ class Collection(Resource):
         # pylint: disable=W0212
         clone._filter_spec = self._filter_spec
         clone._order_spec = self._order_spec
+        clone._cursor = self._cursor
         # pylint: enable=W0212
         clone.__parent__ = self.__parent__
         return clone
@@ -509,6 +543,50 @@ class Collection(Resource):
     def is_root_collection(self):
         return self._relationship is None and not self.__parent__ is None
 
+    def get_cursor_keys(self):
+        """
+        Returns the keys for keyset pagination over this collection in the
+        current (or default) order.
+
+        :returns: list of (attribute name, descending flag) tuples.
+        :raises ValueError: if the order contains a natural order criterion
+          or if the backend can not seek over the order keys (e.g., because
+          they may be NULL).
+        """
+        order_spec = self._order_spec
+        if order_spec is None:
+            order_spec = self.default_order
+        keys = get_keyset_order_keys(order_spec)
+        visitor = ResourceToEntityOrderSpecificationVisitor(
+                                                    get_member_class(self))
+        make_keyset_order_specification(order_spec).accept(visitor)
+        entity_attr_names = [attr_name for (attr_name, _)
+                             in get_keyset_order_keys(visitor.expression)]
+        if not self.__aggregate.can_seek(entity_attr_names):
+            raise ValueError('Keyset pagination is not supported for this '
+                             'order.')
+        return keys
+
+    def __set_aggregate_filter(self, filter_spec, cursor):
+        if not cursor is None:
+            keyset_spec = make_keyset_filter_specification(
+                                                self.get_cursor_keys(), cursor)
+            if filter_spec is None:
+                filter_spec = keyset_spec
+            else:
+                spec_fac = get_filter_specification_factory()
+                filter_spec = spec_fac.create_conjunction(filter_spec,
+                                                          keyset_spec)
+        if not filter_spec is None:
+            # Translate to entity filter expression before passing on to the
+            # aggregate.
+            visitor = ResourceToEntityFilterSpecificationVisitor(
+                                                    get_member_class(self))
+            filter_spec.accept(visitor)
+            self.__aggregate.filter = visitor.expression
+        else:
+            self.__aggregate.filter = None
+
     def get_root_collection(self, rc):
         """
         Returns a root collection for the given resource.
@@ -81,6 +81,16 @@ class StagingAggregate(Aggregate):
         trv.run(self.__visitor)
         return self.__visitor.root
 
+    def add_many(self, data_items):
+        self.add(list(data_items))
+
+    def remove_many(self, data_items):
+        self.remove(list(data_items))
+
+    def update_many(self, data_items):
+        self.update(list(data_items))
+        return self.__visitor.roots
+
     def query(self):
         return self.__cache_map.query(self.entity_class)
 
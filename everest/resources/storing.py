@@ -349,7 +349,8 @@ class ResourceGraph(digraph):
 
     def __make_key(self, obj):
         ent = obj.get_entity()
-        return (type(ent), ent.id)
+        # Lazy clones in memory sessions report their entity class here.
+        return (ent.__class__, ent.id)
 
 
 class ConnectedResourcesSerializer(object):
@@ -5,6 +5,7 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 Created on May 31, 2012.
 """
 import pytest
+import transaction
 
 from everest.constants import DEFAULT_CASCADE
 from everest.constants import RELATION_OPERATIONS
@@ -15,6 +16,7 @@ from everest.querying.specifications import eq
 from everest.querying.specifications import gt
 from everest.repositories.memory.aggregate import MemoryAggregate
 from everest.repositories.rdb.aggregate import RdbAggregate
+from everest.repositories.utils import QueryResultCache
 from everest.tests.complete_app.entities import MyEntity
 from everest.tests.complete_app.entities import MyEntityChild
 from everest.tests.complete_app.entities import MyEntityParent
@@ -110,6 +112,31 @@ class BaseTestRootAggregate(object):
         agg.slice = slice(1, 2)
         assert next(agg.iterator()) is ent0
 
+    def test_load_look_ahead(self, class_entity_repo, ent0, ent1, ent2):
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        agg.add(ent0)
+        agg.add(ent1)
+        agg.add(ent2)
+        agg.order = asc('id')
+        agg.slice = slice(0, 2)
+        agg.load(look_ahead=True)
+        assert agg.has_more is True
+        assert [ent.id for ent in agg.iterator()] == [0, 1]
+        agg.slice = slice(1, 3)
+        agg.load(look_ahead=True)
+        assert agg.has_more is False
+        assert [ent.id for ent in agg.iterator()] == [1, 2]
+        # Slices without start default to the first entity.
+        agg.slice = slice(None, 2)
+        agg.load(look_ahead=True)
+        assert agg.has_more is True
+        assert [ent.id for ent in agg.iterator()] == [0, 1]
+        # Open-ended slices are loaded without look-ahead.
+        agg.slice = slice(1, None)
+        agg.load(look_ahead=True)
+        assert agg.has_more is None
+        assert [ent.id for ent in agg.iterator()] == [1, 2]
+
     def test_add_remove(self, class_entity_repo, ent0):
         agg = class_entity_repo.get_aggregate(IMyEntity)
         agg.add(ent0)
@@ -117,16 +144,87 @@ class BaseTestRootAggregate(object):
         agg.remove(ent0)
         assert len(list(agg.iterator())) == 0
 
+    def test_query_cache(self, class_entity_repo, ent0, monkeypatch):
+        query_cache = QueryResultCache(10)
+        monkeypatch.setattr(class_entity_repo,
+                            '_%s__query_cache'
+                            % class_entity_repo.__class__.__name__,
+                            query_cache)
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        agg.filter = gt(id=-1)
+        agg.order = asc('id')
+        assert list(agg.iterator()) == []
+        assert query_cache.misses == 1 and query_cache.hits == 0
+        assert list(agg.iterator()) == []
+        assert query_cache.hits == 1
+        # Changes in the current transaction bypass the cache.
+        agg.add(ent0)
+        assert [ent.id for ent in agg.iterator()] == [0]
+        assert query_cache.misses == 1 and query_cache.hits == 1
+        # Ending the transaction invalidates the cached result.
+        transaction.abort()
+        assert len(query_cache) == 0
+        assert list(agg.iterator()) == []
+        assert query_cache.misses == 2
+
+    def test_query_cache_nested_attribute(self, class_entity_repo,
+                                          monkeypatch):
+        query_cache = QueryResultCache(10)
+        monkeypatch.setattr(class_entity_repo,
+                            '_%s__query_cache'
+                            % class_entity_repo.__class__.__name__,
+                            query_cache)
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        # Results for nested attributes also depend on the related entities
+        # and are not cached.
+        agg.filter = eq(**{'parent.text':'222'})
+        assert list(agg.iterator()) == []
+        agg.filter = None
+        agg.order = asc('parent.text')
+        assert list(agg.iterator()) == []
+        assert query_cache.misses == 0 and len(query_cache) == 0
+
 
 class TestMemoryRootAggregate(BaseTestRootAggregate):
     config_file_name = 'configure_no_rdb.zcml'
     agg_class = MemoryAggregate
 
+    def test_can_seek(self, class_entity_repo):
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        assert agg.can_seek(['text', 'id'])
+        assert agg.can_seek(['parent.text', 'id'])
+
 
 @pytest.mark.usefixtures('rdb')
 class TestRdbRootAggregate(BaseTestRootAggregate):
     agg_class = RdbAggregate
 
+    def test_can_seek(self, class_entity_repo):
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        assert agg.can_seek(['id'])
+        # Nullable columns and nested attributes (read through outer joins)
+        # may be NULL.
+        assert not agg.can_seek(['text', 'id'])
+        assert not agg.can_seek(['parent.id', 'id'])
+
+    def test_query_cache_with_pending_changes(self, class_entity_repo, ent0,
+                                              monkeypatch):
+        query_cache = QueryResultCache(10)
+        monkeypatch.setattr(class_entity_repo,
+                            '_%s__query_cache'
+                            % class_entity_repo.__class__.__name__,
+                            query_cache)
+        agg = class_entity_repo.get_aggregate(IMyEntity)
+        agg.filter = gt(id=-1)
+        agg.order = asc('id')
+        assert list(agg.iterator()) == []
+        # Loading builds the query before the change is made; running it
+        # must not return the cached result.
+        agg.load()
+        agg.add(ent0)
+        assert [ent.id for ent in agg.iterator()] == [0]
+        assert query_cache.hits == 0
+
 
 class _TestRelationshipAggregate(object):
     package_name = 'everest.tests.complete_app'
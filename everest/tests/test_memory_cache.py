@@ -8,11 +8,22 @@ import pytest
 
 from everest.entities.base import Entity
 from everest.querying.specifications import asc
+from everest.querying.specifications import cntd
+from everest.querying.specifications import desc
 from everest.querying.specifications import eq
+from everest.querying.specifications import ge
+from everest.querying.specifications import gt
+from everest.querying.specifications import le
+from everest.querying.specifications import lt
+from everest.querying.specifications import rng
 from everest.repositories.memory.cache import EntityCache
 from everest.repositories.memory.cache import EntityCacheMap
 from everest.repositories.memory.querying import EvalFilterExpression
 from everest.repositories.memory.querying import EvalOrderExpression
+from everest.repositories.memory.querying import \
+                    ObjectFilterSpecificationVisitor
+from everest.repositories.memory.querying import \
+                    ObjectOrderSpecificationVisitor
 from everest.repositories.state import EntityState
 from everest.resources.descriptors import terminal_attribute
 
@@ -69,6 +80,219 @@ class TestEntityCache(object):
         finally:
             class_configurator.end()
 
+    def test_index(self):
+        ent0 = MyEntity(id=0, text='a')
+        ent1 = MyEntity(id=1, text='b')
+        ent2 = MyEntity(id=2, text='a')
+        cache = EntityCache(entities=[], indexes=['text'])
+        for ent in (ent0, ent1, ent2):
+            cache.add(ent)
+        assert cache.has_index('text')
+        assert not cache.has_index('id')
+        assert cache.lookup('text', ['a']) == set([ent0, ent2])
+        assert cache.lookup('text', ['a', 'b']) == set([ent0, ent1, ent2])
+        assert cache.lookup('text', ['c']) == set()
+        assert cache.lookup('id', [0]) is None
+        # Updates and removals are reflected in the index.
+        upd_ent = MyEntity(id=0, text='c')
+        cache.update(EntityState.get_state_data(upd_ent), ent0)
+        assert cache.lookup('text', ['a']) == set([ent2])
+        assert cache.lookup('text', ['c']) == set([ent0])
+        cache.remove(ent2)
+        assert cache.lookup('text', ['a']) == set()
+        # Indexes added later pick up existing entities.
+        cache.add_index('id')
+        assert cache.lookup('id', [1]) == set([ent1])
+        with pytest.raises(ValueError):
+            cache.add_index('parent.text')
+
+    def test_index_unhashable_value(self):
+        cache = EntityCache(entities=[], indexes=['text'])
+        with pytest.raises(ValueError):
+            cache.add(MyEntity(id=0, text=['a']))
+
+    def test_filter_with_index(self, class_configurator):
+        class_configurator.begin()
+        try:
+            ents = [MyEntity(id=idx, text=txt)
+                    for (idx, txt) in enumerate(['a', 'b', 'a', 'c'])]
+            cache = EntityCache(entities=[], indexes=['text'])
+            for ent in ents:
+                cache.add(ent)
+            for spec, exp_ids in ((eq(text='a'), [0, 2]),
+                                  (cntd(text=['c', 'b']), [1, 3]),
+                                  (eq(text='a') & ~eq(id=0), [2]),
+                                  (eq(text='a') | eq(text='c'), [0, 2, 3]),
+                                  (eq(text='a') | eq(id=1), [0, 1, 2]),
+                                  ):
+                vst = ObjectFilterSpecificationVisitor(MyEntity)
+                spec.accept(vst)
+                expr = vst.expression
+                # Entities looked up through the index are returned in the
+                # order they were added.
+                assert [ent.id for ent
+                        in cache.retrieve(filter_expression=expr)] == exp_ids
+            vst = ObjectFilterSpecificationVisitor(MyEntity)
+            (eq(text='a') | eq(id=1)).accept(vst)
+            assert vst.expression.index_lookup(cache) is None
+        finally:
+            class_configurator.end()
+
+    def test_count(self, class_configurator):
+        class_configurator.begin()
+        try:
+            ents = [MyEntity(id=idx, text=txt)
+                    for (idx, txt) in enumerate(['a', 'b', 'a'])]
+            cache = EntityCache(entities=[])
+            for ent in ents:
+                cache.add(ent)
+            assert cache.count() == 3
+            vst = ObjectFilterSpecificationVisitor(MyEntity)
+            eq(text='a').accept(vst)
+            expr = vst.expression
+            assert not expr.cache_key is None
+            version = cache.version
+            assert cache.count(filter_expression=expr) == 2
+            # Changing an entity behind the back of the cache does not
+            # invalidate the memoized count.
+            ents[1].text = 'a'
+            assert cache.count(filter_expression=expr) == 2
+            assert cache.count(filter_expression=expr, memoize=False) == 3
+            # Changes through the cache do.
+            cache.add(MyEntity(id=3, text='a'))
+            assert cache.version > version
+            assert cache.count(filter_expression=expr) == 4
+            cache.remove(ents[2])
+            assert cache.count(filter_expression=expr) == 3
+            assert cache.count() == 3
+        finally:
+            class_configurator.end()
+
+    def test_sorted_index(self):
+        ents = [MyEntity(id=idx, text=txt)
+                for (idx, txt) in enumerate(['b', 'a', 'c', 'a'])]
+        cache = EntityCache(entities=[], sorted_indexes=['text'])
+        for ent in ents:
+            cache.add(ent)
+        assert cache.has_sorted_index('text')
+        assert not cache.has_index('text')
+        assert cache.lookup_range('text', lower='a', upper='b') \
+               == set(ents[:2] + ents[3:])
+        assert cache.lookup_range('text', lower='a',
+                                  lower_inclusive=False) \
+               == set(ents[:1] + ents[2:3])
+        assert cache.lookup_range('text', upper='b',
+                                  upper_inclusive=False) \
+               == set([ents[1], ents[3]])
+        assert cache.lookup_range('id', lower=0) is None
+        upd_ent = MyEntity(id=2, text='0')
+        cache.update(EntityState.get_state_data(upd_ent), ents[2])
+        assert cache.lookup_range('text', upper='0') == set([ents[2]])
+        cache.remove(ents[2])
+        assert cache.lookup_range('text', upper='0') == set()
+
+    def test_sorted_index_none_value(self, class_configurator):
+        class_configurator.begin()
+        try:
+            ents = [MyEntity(id=idx, text=txt)
+                    for (idx, txt) in enumerate(['b', None, 'a', None])]
+            cache = EntityCache(entities=[], sorted_indexes=['text'])
+            for ent in ents:
+                cache.add(ent)
+            assert cache.lookup_range('text', lower='a') \
+                   == set([ents[0], ents[2]])
+            for order_spec, exp_ids in ((asc('text'), [1, 3, 2, 0]),
+                                        (desc('text'), [0, 2, 1, 3])):
+                ovst = ObjectOrderSpecificationVisitor(MyEntity)
+                order_spec.accept(ovst)
+                assert [ent.id for ent in
+                        cache.retrieve(order_expression=ovst.expression)] \
+                       == exp_ids
+        finally:
+            class_configurator.end()
+
+    def test_order_filter_slice_with_sorted_index(self, class_configurator):
+        class_configurator.begin()
+        try:
+            texts = ['b', 'a', 'c', 'a', 'b']
+            ents = [MyEntity(id=idx, text=txt)
+                    for (idx, txt) in enumerate(texts)]
+            cache = EntityCache(entities=[], indexes=['text'],
+                                sorted_indexes=['text', 'id'])
+            for ent in ents:
+                cache.add(ent)
+            # The results have to be the same as the ones from sorting
+            # the entities, including the order of entities with equal
+            # values.
+            ref_cache = EntityCache(entities=[])
+            for ent in ents:
+                ref_cache.add(ent)
+            filter_specs = (None, gt(text='a'), ge(text='b'), lt(text='c'),
+                            le(text='a'), rng(text=('a', 'b')), eq(text='a'))
+            order_specs = (None, asc('text'), desc('text'), desc('id'),
+                           asc('text') & desc('id'))
+            slice_keys = (None, slice(0, 2), slice(1, 3))
+            for filter_spec in filter_specs:
+                if not filter_spec is None:
+                    fvst = ObjectFilterSpecificationVisitor(MyEntity)
+                    filter_spec.accept(fvst)
+                    filter_expr = fvst.expression
+                else:
+                    filter_expr = None
+                for order_spec in order_specs:
+                    if not order_spec is None:
+                        ovst = ObjectOrderSpecificationVisitor(MyEntity)
+                        order_spec.accept(ovst)
+                        order_expr = ovst.expression
+                    else:
+                        order_expr = None
+                    for slice_key in slice_keys:
+                        kw = dict(filter_expression=filter_expr,
+                                  order_expression=order_expr,
+                                  slice_key=slice_key)
+                        assert list(cache.retrieve(**kw)) \
+                               == list(ref_cache.retrieve(**kw))
+        finally:
+            class_configurator.end()
+
+    def test_copy_replace(self):
+        ent0 = MyEntity(id=0, text='a')
+        ent1 = MyEntity(id=1, text='b')
+        cache = EntityCache(entities=[], indexes=['text'])
+        cache.add(ent0)
+        cache.add(ent1)
+        cache_copy = cache.copy()
+        assert cache_copy.get_all() == [ent0, ent1]
+        # Changes to the copy do not affect the original and vice versa.
+        new_ent0 = MyEntity(id=0, text='c')
+        cache_copy.replace(ent0, new_ent0)
+        assert cache_copy.get_all() == [new_ent0, ent1]
+        assert cache_copy.get_by_id(0) is new_ent0
+        assert cache_copy.lookup('text', ['a']) == set()
+        assert cache_copy.lookup('text', ['c']) == set([new_ent0])
+        assert cache.get_by_id(0) is ent0
+        assert cache.lookup('text', ['a']) == set([ent0])
+        assert cache.version != cache_copy.version
+        cache.remove(ent1)
+        assert cache_copy.get_by_id(1) is ent1
+
+    def test_remove(self):
+        ents = [MyEntity(id=idx) for idx in range(4)]
+        none_id_ent = MyEntity()
+        cache = EntityCache(entities=[])
+        for ent in ents + [none_id_ent]:
+            cache.add(ent)
+        # Removing an entity which is only equal to the cached entity.
+        cache.remove(MyEntity(id=1))
+        cache.remove(none_id_ent)
+        assert not none_id_ent in cache
+        assert cache.count() == 3
+        assert cache.get_all() == [ents[0], ents[2], ents[3]]
+        cache.add(ents[1])
+        assert cache.get_all() == [ents[0], ents[2], ents[3], ents[1]]
+        with pytest.raises(KeyError):
+            cache.remove(none_id_ent)
+
     def test_allow_none_id_false(self):
         ent = MyEntity()
         cache = EntityCache(entities=[], allow_none_id=False)
@@ -77,6 +301,17 @@ class TestEntityCache(object):
 
 
 class TestEntityCacheMap(object):
+    def test_set_indexes(self):
+        ecm = EntityCacheMap()
+        ent = MyEntity(id=0, text='a')
+        ecm.set_indexes(MyEntity, ['text'])
+        ecm.add(MyEntity, ent)
+        assert ecm[MyEntity].lookup('text', ['a']) == set([ent])
+        ecm.set_indexes(MyEntity, ['id'])
+        assert ecm[MyEntity].lookup('id', [0]) == set([ent])
+        ecm.set_sorted_indexes(MyEntity, ['text'])
+        assert ecm[MyEntity].lookup_range('text', lower='a') == set([ent])
+
     def test_basics(self):
         ecm = EntityCacheMap()
         ent = MyEntity(id=0)
@@ -92,3 +327,7 @@ class TestEntityCacheMap(object):
 class MyEntity(Entity):
     __everest_attributes__ = dict(text=terminal_attribute(str, 'text'))
     text = None
+
+    def __init__(self, id=None, text=None): # redefining id pylint: disable=W0622
+        Entity.__init__(self, id=id)
+        self.text = text
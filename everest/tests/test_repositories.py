@@ -4,25 +4,37 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jun 1, 2012.
 """
+import glob
 import os
+import shutil
 import tempfile
+import time
+import weakref
 
 import pytest
 import transaction
 
+from everest.compat import BytesIO
 from everest.entities.system import UserMessage
 from everest.interfaces import IUserMessage
+from everest.mime import BinaryMime
 from everest.mime import CsvMime
 from everest.repositories.constants import REPOSITORY_TYPES
 from everest.repositories.memory.aggregate import MemoryAggregate as Aggregate
 from everest.repositories.memory.repository \
                             import MemoryRepository as Repository
+from everest.repositories.memory.snapshot import SnapshotLoader
+from everest.repositories.memory.snapshot import dump_snapshot
+from everest.repositories.memory.snapshot import load_snapshot
 from everest.resources.staging import create_staging_collection
 from everest.resources.storing import get_collection_name
 from everest.resources.storing import get_read_collection_path
+from everest.resources.utils import get_collection_class
 from everest.resources.utils import get_service
 from everest.tests.complete_app.entities import MyEntity
 from everest.tests.complete_app.entities import MyEntityChild
+from everest.tests.complete_app.entities import MyEntityGrandchild
+from everest.tests.complete_app.entities import MyEntityParent
 from everest.tests.complete_app.interfaces import IMyEntity
 from everest.tests.complete_app.interfaces import IMyEntityChild
 from everest.tests.complete_app.interfaces import IMyEntityGrandchild
@@ -38,6 +50,8 @@ from everest.utils import get_repository_manager
 __docformat__ = 'reStructuredText en'
 __all__ = ['TestBasicRepository',
            'TestFileSystemRepository',
+           'TestMemoryRepositoryCommitLog',
+           'TestMemoryRepositorySnapshot',
            'TestMemorySystemRepository',
            'TestRdbSystemRepository',
            'TestRepositoryManager',
@@ -143,6 +157,22 @@ class BaseTestRepository(object):
         assert not ent.id is None
         assert len(coll) == 2
 
+    def test_add_update_remove_many(self, resource_repo_with_data):
+        coll = resource_repo_with_data.get_collection(IMyEntity)
+        agg = coll.get_aggregate()
+        ents = [MyEntity(id=idx, text='FOO') for idx in range(2, 5)]
+        agg.add_many(ents)
+        transaction.commit()
+        assert len(coll) == 4
+        upd_ents = [MyEntity(id=idx, text='BAR') for idx in range(2, 5)]
+        upd_ents = agg.update_many(upd_ents)
+        assert [ent.text for ent in upd_ents] == ['BAR'] * 3
+        transaction.commit()
+        assert coll['2'].get_entity().text == 'BAR'
+        agg.remove_many([agg.get_by_id(idx) for idx in range(2, 5)])
+        transaction.commit()
+        assert len(coll) == 1
+
     def test_add_remove(self, resource_repo_with_data):
         coll = resource_repo_with_data.get_collection(IMyEntity)
         mb_rm = next(iter(coll))
@@ -293,6 +323,171 @@ class TestFileSystemRepository(BaseTestRepository):
     package_name = 'everest.tests.complete_app'
     config_file_name = 'configure_fs.zcml'
 
+    def test_incremental_commit(self, data_dir, resource_repo_with_data):
+        repo = resource_repo_with_data
+        coll_path = os.path.join(data_dir,
+                                 "%s.csv" % get_collection_name(IMyEntity))
+        delta_path = coll_path + '.delta'
+        with open(coll_path, 'rU') as data_file:
+            orig_data = data_file.read()
+        srvc = get_service()
+        def initialize():
+            repo.initialize()
+            # Resetting the repository discards the root collections; the
+            # new ones need to be exposed for the resource URLs in the delta
+            # records to be resolvable.
+            for rc in repo.registered_resources:
+                repo.get_collection(rc)
+                repo.set_collection_parent(rc, srvc)
+        try:
+            repo.reset()
+            repo.configure(incremental=True, commit_log_sync_interval=0)
+            initialize()
+            mb = next(iter(repo.get_collection(IMyEntity)))
+            mb.text = 'Changed.'
+            transaction.commit()
+            # Only the delta file is written.
+            with open(coll_path, 'rU') as data_file:
+                assert data_file.read() == orig_data
+            assert os.path.getsize(delta_path) > 0
+            # The delta records are merged on startup.
+            repo.reset()
+            initialize()
+            mb = next(iter(repo.get_collection(IMyEntity)))
+            assert mb.text == 'Changed.'
+            # Exceeding the compaction size rewrites the collection file.
+            repo.reset()
+            repo.configure(delta_compaction_size=0)
+            initialize()
+            mb = next(iter(repo.get_collection(IMyEntity)))
+            mb.text = 'Compacted.'
+            transaction.commit()
+            # Resetting waits for the background compaction to finish.
+            repo.reset()
+            assert os.path.getsize(delta_path) == 0
+            with open(coll_path, 'rU') as data_file:
+                assert '"Compacted."' in data_file.read()
+            initialize()
+            assert repo.count(MyEntity) == 1
+        finally:
+            repo.reset()
+            repo.configure(incremental=False,
+                           delta_compaction_size=1024 * 1024,
+                           commit_log_sync_interval=0.1)
+            # Remove the delta files (and the temporary collection file,
+            # which is left behind if the test fails during a compaction).
+            for fn in glob.glob('%s.*' % coll_path):
+                os.unlink(fn)
+            initialize()
+
+    def test_parallel_loading(self, resource_repo_with_data):
+        repo = resource_repo_with_data
+        try:
+            repo.reset()
+            repo.configure(load_processes=2)
+            repo.initialize()
+            ent = repo.get_by_id(MyEntity, 0)
+            assert ent.text == 'TEXT'
+            assert ent.parent is repo.get_by_id(MyEntityParent, 0)
+            assert repo.get_by_id(MyEntityChild, 0).parent is ent
+            for ent_cls in (MyEntityParent, MyEntity, MyEntityChild,
+                            MyEntityGrandchild):
+                assert repo.count(ent_cls) == 1
+        finally:
+            repo.reset()
+            repo.configure(load_processes=None)
+            repo.initialize()
+
+    def test_write_behind_commit(self, data_dir, resource_repo_with_data):
+        repo = resource_repo_with_data
+        coll_path = os.path.join(data_dir,
+                                 "%s.csv" % get_collection_name(IMyEntity))
+        try:
+            repo.reset()
+            repo.configure(write_interval=3600)
+            repo.initialize()
+            assert repo.write_lag == 0
+            mb = next(iter(repo.get_collection(IMyEntity)))
+            mb.text = 'Changed.'
+            transaction.commit()
+            # The commit returns before the collection file is written.
+            with open(coll_path, 'rU') as data_file:
+                assert not '"Changed."' in data_file.read()
+            assert repo.write_lag > 0
+            # Resetting performs the pending writes.
+            repo.reset()
+            with open(coll_path, 'rU') as data_file:
+                assert '"Changed."' in data_file.read()
+            assert repo.write_lag == 0
+        finally:
+            repo.reset()
+            repo.configure(write_interval=None)
+            repo.initialize()
+
+    def test_write_behind_background_writes(self, data_dir,
+                                            resource_repo_with_data):
+        repo = resource_repo_with_data
+        coll_path = os.path.join(data_dir,
+                                 "%s.csv" % get_collection_name(IMyEntity))
+        def wait_for_write(text):
+            # Waits for the background writer to write the given text.
+            for _ in range(100):
+                with open(coll_path, 'rU') as data_file:
+                    is_written = text in data_file.read()
+                if is_written and repo.write_lag == 0:
+                    break
+                time.sleep(0.05)
+            return is_written
+        try:
+            repo.reset()
+            repo.configure(write_interval=0.1)
+            repo.initialize()
+            coll = repo.get_collection(IMyEntity)
+            next(iter(coll)).text = 'First.'
+            transaction.commit()
+            assert wait_for_write('"First."')
+            # The next pass writes the current data.
+            coll = repo.get_collection(IMyEntity)
+            next(iter(coll)).text = 'Second.'
+            transaction.commit()
+            assert wait_for_write('"Second."')
+            assert repo.write_lag == 0
+        finally:
+            repo.reset()
+            repo.configure(write_interval=None)
+            repo.initialize()
+
+    def test_binary_storage(self, data_dir, resource_repo_with_data,
+                            entity_tree_fac):
+        repo = resource_repo_with_data
+        try:
+            repo.reset()
+            repo.configure(content_type=BinaryMime)
+            repo.initialize()
+            coll = repo.get_collection(IMyEntity)
+            coll.create_member(entity_tree_fac(id=0, text=u'f\xf6\xf60'))
+            transaction.commit()
+            assert not get_read_collection_path(
+                                    get_collection_class(IMyEntity),
+                                    BinaryMime, directory=data_dir) is None
+            repo.reset()
+            repo.initialize()
+            ent = repo.get_by_id(MyEntity, 0)
+            assert ent.text == u'f\xf6\xf60'
+            assert ent.number == MyEntity.DEFAULT_NUMBER
+            assert ent.date_time == MyEntity.DEFAULT_DATETIME
+            assert ent.parent is repo.get_by_id(MyEntityParent, 0)
+            assert ent.children == [repo.get_by_id(MyEntityChild, 0)]
+            assert ent.children[0].parent is ent
+            assert ent.children[0].children[0] \
+                    is repo.get_by_id(MyEntityGrandchild, 0)
+        finally:
+            repo.reset()
+            repo.configure(content_type=CsvMime)
+            for fn in glob.glob1(data_dir, '*%s' % BinaryMime.file_extension):
+                os.unlink(os.path.join(data_dir, fn))
+            repo.initialize()
+
 
 class TestMemoryRepoWithCacheLoader(object):
     package_name = 'everest.tests.complete_app'
@@ -307,5 +502,99 @@ class TestMemoryRepoWithCacheLoader(object):
         assert len(list(agg.iterator())) == 1
 
 
+class TestMemoryRepositorySnapshot(object):
+    package_name = 'everest.tests.complete_app'
+    config_file_name = 'configure_fs.zcml'
+
+    def test_write_and_load_snapshot(self, resource_repo_with_data):
+        repo = resource_repo_with_data
+        ent = next(repo.retrieve(MyEntity))
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            repo.write_snapshot(path)
+            loader = SnapshotLoader(path)
+            snap_ent = loader(MyEntity)[0]
+            assert not snap_ent is ent
+            assert snap_ent.id == ent.id
+            assert snap_ent.text == ent.text
+            assert snap_ent.date_time == ent.date_time
+            assert not hasattr(snap_ent, '__everest__')
+            # Relationships are restored between the snapshot entities.
+            assert snap_ent.parent is loader(MyEntityParent)[0]
+            assert loader(MyEntityChild)[0].parent is snap_ent
+        finally:
+            os.remove(path)
+
+    def test_snapshot_references_by_id(self):
+        parent = MyEntityParent(id=0)
+        # The referenced parent is equal to, but not identical with the
+        # parent in the snapshot and carries (unpicklable) session state.
+        ref_parent = MyEntityParent(id=0)
+        ref_parent.__dict__['__everest__'] = weakref.ref(ref_parent)
+        ent = MyEntity(id=0, parent=ref_parent)
+        ent.__dict__['__everest__'] = weakref.ref(ent)
+        stream = BytesIO()
+        dump_snapshot([(MyEntityParent, [parent]), (MyEntity, [ent])],
+                      stream)
+        stream.seek(0)
+        ent_map = load_snapshot(stream)
+        snap_ent = ent_map[MyEntity][0]
+        assert snap_ent.id == 0
+        assert not '__everest__' in snap_ent.__dict__
+        assert snap_ent.parent is ent_map[MyEntityParent][0]
+
+    def test_write_snapshot_without_path(self, resource_repo_with_data):
+        with pytest.raises(ValueError):
+            resource_repo_with_data.write_snapshot()
+
+
+class TestMemoryRepositoryCommitLog(object):
+    package_name = 'everest.tests.complete_app'
+    config_file_name = 'configure_no_rdb.zcml'
+
+    def test_replay_commit_log(self, resource_repo):
+        tmp_dir = tempfile.mkdtemp()
+        snapshot_path = os.path.join(tmp_dir, 'entities.snapshot')
+        try:
+            resource_repo.reset()
+            resource_repo.configure(
+                        commit_log_path=os.path.join(tmp_dir, 'commit.log'),
+                        commit_log_sync_interval=0)
+            resource_repo.initialize()
+            parent_agg = resource_repo.get_aggregate(IMyEntityParent)
+            parent_agg.add(MyEntityParent(id=0, text='p'))
+            transaction.commit()
+            agg = resource_repo.get_aggregate(IMyEntity)
+            agg.add(MyEntity(id=0, text='a', parent=parent_agg.get_by_id(0)))
+            agg.add(MyEntity(id=1, text='b'))
+            transaction.commit()
+            agg.get_by_id(0).text = 'c'
+            agg.remove(agg.get_by_id(1))
+            transaction.commit()
+            # Restart and replay the log.
+            resource_repo.reset()
+            resource_repo.initialize()
+            ent = resource_repo.get_by_id(MyEntity, 0)
+            assert ent.text == 'c'
+            assert ent.parent is resource_repo.get_by_id(MyEntityParent, 0)
+            assert resource_repo.get_by_id(MyEntity, 1) is None
+            # Compact the log into a snapshot and restart again.
+            resource_repo.reset()
+            resource_repo.configure(snapshot_path=snapshot_path)
+            resource_repo.initialize()
+            resource_repo.write_snapshot()
+            resource_repo.reset()
+            resource_repo.initialize()
+            assert resource_repo.get_by_id(MyEntity, 0).text == 'c'
+            assert resource_repo.count(MyEntity) == 1
+        finally:
+            resource_repo.reset()
+            resource_repo.configure(commit_log_path=None, snapshot_path=None,
+                                    cache_loader=None)
+            resource_repo.initialize()
+            shutil.rmtree(tmp_dir)
+
+
 def entity_loader(entity_class):
     return [entity_class()]
@@ -6,16 +6,23 @@ Created on Jan 31, 2013.
 """
 from everest.repositories.rdb.testing import RdbTestCaseMixin
 from everest.repositories.rdb.utils import OrmAttributeInspector
+from everest.repositories.utils import QueryResultCache
+from everest.repositories.utils import StripedLock
 from everest.repositories.utils import commit_veto
 from everest.testing import EntityTestCase
 from everest.testing import Pep8CompliantTestCase
 from everest.tests.complete_app.entities import MyEntity
+from everest.tests.complete_app.entities import MyEntityParent
 from pyramid.httpexceptions import HTTPOk
 from pyramid.httpexceptions import HTTPRedirection
+from threading import Event
+from threading import Thread
 
 __docformat__ = 'reStructuredText en'
-__all__ = ['RdbAttributeInspectorTestCase',
+__all__ = ['QueryResultCacheTestCase',
+           'RdbAttributeInspectorTestCase',
            'RepositoriesUtilsTestCase',
+           'StripedLockTestCase',
            ]
 
 
@@ -31,6 +38,65 @@ class RepositoriesUtilsTestCase(Pep8CompliantTestCase):
         self.assert_true(commit_veto(None, rsp4))
 
 
+class QueryResultCacheTestCase(Pep8CompliantTestCase):
+    def test_lru_eviction(self):
+        cache = QueryResultCache(2)
+        gen = cache.get_generation(MyEntity)
+        cache.set(MyEntity, 'a', [0], gen)
+        cache.set(MyEntity, 'b', [1], gen)
+        self.assert_equal(cache.get(MyEntity, 'a'), [0])
+        # 'b' is now the least recently used entry.
+        cache.set(MyEntity, 'c', [2], gen)
+        self.assert_true(cache.get(MyEntity, 'b') is None)
+        self.assert_equal(cache.get(MyEntity, 'c'), [2])
+        self.assert_equal(len(cache), 2)
+        self.assert_equal((cache.hits, cache.misses), (2, 1))
+        cache.clear()
+        self.assert_equal((cache.hits, cache.misses), (0, 0))
+        self.assert_raises(ValueError, QueryResultCache, 0)
+
+    def test_invalidate(self):
+        cache = QueryResultCache(10)
+        gen = cache.get_generation(MyEntity)
+        cache.set(MyEntity, 'a', [0], gen)
+        cache.set(object, 'a', [1], cache.get_generation(object))
+        cache.invalidate(MyEntity)
+        self.assert_true(cache.get(MyEntity, 'a') is None)
+        self.assert_equal(cache.get(object, 'a'), [1])
+        # Results computed before the invalidation are discarded.
+        cache.set(MyEntity, 'a', [0], gen)
+        self.assert_true(cache.get(MyEntity, 'a') is None)
+        cache.set(MyEntity, 'a', [0], cache.get_generation(MyEntity))
+        self.assert_equal(cache.get(MyEntity, 'a'), [0])
+
+
+class StripedLockTestCase(Pep8CompliantTestCase):
+    def test_reentrancy(self):
+        lock = StripedLock()
+        with lock.locking([MyEntity]):
+            with lock.locking([MyEntity, MyEntityParent]):
+                pass
+
+    def test_striped_lock(self):
+        lock = StripedLock()
+        acquired = Event()
+        def write(entity_class):
+            with lock.locking([entity_class]):
+                acquired.set()
+        with lock.locking([MyEntity]):
+            # Locking another stripe is not blocked.
+            thread = Thread(target=write, args=(MyEntityParent,))
+            thread.start()
+            thread.join()
+            self.assert_true(acquired.is_set())
+            acquired.clear()
+            thread = Thread(target=write, args=(MyEntity,))
+            thread.start()
+            self.assert_false(acquired.wait(0.05))
+        thread.join()
+        self.assert_true(acquired.is_set())
+
+
 class RdbAttributeInspectorTestCase(RdbTestCaseMixin, EntityTestCase):
     package_name = 'everest.tests.complete_app'
 
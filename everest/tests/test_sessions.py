@@ -9,6 +9,10 @@ import gc
 import pytest
 
 from everest.entities.utils import new_entity_id
+from everest.exceptions import UnsupportedOperationException
+from everest.repositories.memory.lazy import is_lazy_clone
+from everest.repositories.memory.readonly import is_read_only_proxy
+from everest.repositories.memory.session import MemorySession
 from everest.tests.complete_app.entities import MyEntity
 from everest.tests.complete_app.entities import MyEntityChild
 from everest.tests.complete_app.entities import MyEntityParent
@@ -58,6 +62,223 @@ class _TestMemorySession(object):
         assert session.get_by_slug(MyEntity, ent.slug) is None
         assert list(session.deleted) == [fetched_ent0]
 
+    def test_add_many(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        ent = MyEntity(id=0)
+        # Adding the same entity multiple times is allowed.
+        session.add_many(MyEntity, [ent, MyEntity(id=1), ent])
+        session.commit()
+        assert session.query(MyEntity).count() == 2
+        with pytest.raises(ValueError):
+            session.add_many(MyEntity, [MyEntity(id=2), MyEntity(id=2)])
+
+    def test_read_only(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        parent = MyEntityParent(id=0)
+        ent = MyEntity(id=0, parent=parent)
+        parent.child = ent
+        child = MyEntityChild(id=0, parent=ent)
+        ent.children.append(child)
+        session.add(MyEntity, ent)
+        session.commit()
+        session_factory = class_entity_repo.session_factory
+        session_factory.set_read_only(True)
+        try:
+            ro_session = session_factory()
+            assert not ro_session is session
+            # The read-only session hands out read-only proxies for the
+            # repository entities.
+            ro_ent = ro_session.get_by_id(MyEntity, 0)
+            repo_ent = class_entity_repo.get_by_id(MyEntity, 0)
+            assert is_read_only_proxy(ro_ent)
+            assert not ro_ent is repo_ent
+            assert ro_ent == repo_ent
+            assert isinstance(ro_ent, MyEntity)
+            assert ro_ent.text == repo_ent.text
+            assert ro_session.get_by_slug(MyEntity, ro_ent.slug)[0] \
+                        == ro_ent
+            assert ro_session.query(MyEntity).all()[0] == ro_ent
+            assert not ro_ent in ro_session
+            with pytest.raises(UnsupportedOperationException):
+                ro_ent.text = 'FOO'
+            assert repo_ent.text != 'FOO'
+            with pytest.raises(UnsupportedOperationException):
+                del ro_ent.text
+            # Referenced entities are read-only, too.
+            assert is_read_only_proxy(ro_ent.parent)
+            with pytest.raises(UnsupportedOperationException):
+                ro_ent.parent.text = 'FOO'
+            ro_child = ro_ent.children[0]
+            assert is_read_only_proxy(ro_child)
+            assert ro_child.parent == ro_ent
+            with pytest.raises(UnsupportedOperationException):
+                ro_ent.children.append(MyEntityChild(id=1))
+            assert len(repo_ent.children) == 1
+            with pytest.raises(UnsupportedOperationException):
+                ro_session.add(MyEntity, MyEntity(id=1))
+            with pytest.raises(UnsupportedOperationException):
+                ro_session.remove(MyEntity, ro_ent)
+            with pytest.raises(UnsupportedOperationException):
+                ro_session.update(MyEntity, ro_ent)
+        finally:
+            session_factory.set_read_only(False)
+        assert session_factory() is session
+
+    def test_lazy_clones(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        parent = MyEntityParent(id=0)
+        ent = MyEntity(id=0, parent=parent)
+        parent.child = ent
+        child = MyEntityChild(id=0, parent=ent)
+        ent.children.append(child)
+        session.add(MyEntity, ent)
+        session.commit()
+        ent_clone = session.query(MyEntity).all()[0]
+        assert not ent_clone is ent
+        # Loaded entities are lazy clones until an attribute is set or a
+        # related entity is accessed.
+        assert is_lazy_clone(ent_clone)
+        assert session.get_by_id(MyEntity, 0) is ent_clone
+        assert session.get_by_slug(MyEntity, ent.slug)[0] is ent_clone
+        assert ent_clone.text == ent.text
+        assert is_lazy_clone(ent_clone)
+        assert not session.unit_of_work.is_registered(ent_clone)
+        # Related entities are loaded lazily.
+        child_clone = ent_clone.children[0]
+        assert not is_lazy_clone(ent_clone)
+        assert session.unit_of_work.is_registered(ent_clone)
+        assert is_lazy_clone(child_clone)
+        assert child_clone.id == 0
+        assert is_lazy_clone(child_clone)
+        assert session.get_by_id(MyEntityChild, 0) is child_clone
+        # Terminal attributes are read from the repository entity.
+        assert child_clone.text == child.text
+        assert is_lazy_clone(child_clone)
+        assert child_clone == child
+        assert is_lazy_clone(child_clone)
+        # Accessing a related entity materializes the clone.
+        assert not child_clone.parent is None
+        assert not is_lazy_clone(child_clone)
+        assert type(child_clone) is MyEntityChild
+        assert not child_clone is child
+        # Circular references resolve to the already loaded entity.
+        assert child_clone.parent is ent_clone
+        assert child_clone in session
+        # Changes to materialized clones are tracked.
+        child_clone.text = 'NEW TEXT'
+        session.commit()
+        assert session.query(MyEntityChild).one().text == 'NEW TEXT'
+
+    def test_lazy_clone_copy_on_write(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        ent = MyEntity(id=0)
+        child = MyEntityChild(id=0, text='TEXT', parent=ent)
+        ent.children.append(child)
+        session.add(MyEntity, ent)
+        session.commit()
+        child_clone = session.query(MyEntity).one().children[0]
+        assert child_clone.text == 'TEXT'
+        assert is_lazy_clone(child_clone)
+        # Setting an attribute copies the state before changing it.
+        child_clone.text = 'NEW TEXT'
+        assert not is_lazy_clone(child_clone)
+        assert child_clone.text == 'NEW TEXT'
+        assert class_entity_repo.get_by_id(MyEntityChild, 0).text == 'TEXT'
+        session.commit()
+        assert session.query(MyEntityChild).one().text == 'NEW TEXT'
+
+    def test_snapshot_isolation(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        ent = MyEntity(id=0, text='TEXT')
+        session.add(MyEntity, ent)
+        session.commit()
+        other_session = MemorySession(class_entity_repo)
+        # The first access pins the current version of the repository data.
+        assert other_session.query(MyEntity).count() == 1
+        session.query(MyEntity).one().text = 'NEW TEXT'
+        session.add(MyEntity, MyEntity(id=1))
+        session.commit()
+        # Committed entities are replaced rather than changed in place.
+        assert ent.text == 'TEXT'
+        assert class_entity_repo.get_by_id(MyEntity, 0).text == 'NEW TEXT'
+        assert other_session.query(MyEntity).count() == 1
+        assert other_session.query(MyEntity).one().text == 'TEXT'
+        # Ending the transaction releases the pinned version.
+        other_session.rollback()
+        assert other_session.query(MyEntity).count() == 2
+        assert other_session.query(MyEntity).filter_by(id=0).one().text \
+               == 'NEW TEXT'
+
+    def test_published_references(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        parent = MyEntityParent(id=0, text='TEXT')
+        ent = MyEntity(id=0, parent=parent)
+        parent.child = ent
+        child = MyEntityChild(id=0, text='TEXT', parent=ent)
+        ent.children.append(child)
+        session.add(MyEntity, ent)
+        session.commit()
+        other_session = MemorySession(class_entity_repo)
+        assert other_session.query(MyEntityParent).one().text == 'TEXT'
+        session.query(MyEntityParent).one().text = 'NEW TEXT'
+        session.query(MyEntityChild).one().text = 'NEW TEXT'
+        session.commit()
+        # Published entities are never changed; related entities are
+        # resolved by ID in the version read by a session.
+        repo_ent = class_entity_repo.get_by_id(MyEntity, 0)
+        repo_parent = class_entity_repo.get_by_id(MyEntityParent, 0)
+        repo_child = class_entity_repo.get_by_id(MyEntityChild, 0)
+        assert not repo_parent is parent
+        assert repo_ent.parent is parent
+        assert parent.text == 'TEXT'
+        assert class_entity_repo.resolve(repo_ent.parent) is repo_parent
+        assert class_entity_repo.resolve(repo_ent.children[0]) is repo_child
+        new_session = MemorySession(class_entity_repo)
+        new_ent = new_session.query(MyEntity).one()
+        assert new_ent.parent.text == 'NEW TEXT'
+        assert new_ent.children[0].text == 'NEW TEXT'
+        assert new_session.query(MyEntity).filter_by(
+                            **{'parent.text':'NEW TEXT'}).count() == 1
+        # Sessions still see the related entities of their pinned version.
+        other_ent = other_session.query(MyEntity).one()
+        assert other_ent.parent.text == 'TEXT'
+        assert other_ent.children[0].text == 'TEXT'
+        assert other_session.query(MyEntity).filter_by(
+                            **{'parent.text':'TEXT'}).count() == 1
+        # Read-only sessions resolve related entities as well.
+        session_factory = class_entity_repo.session_factory
+        session_factory.set_read_only(True)
+        try:
+            ro_ent = session_factory().get_by_id(MyEntity, 0)
+            assert ro_ent.parent.text == 'NEW TEXT'
+            assert ro_ent.children[0].text == 'NEW TEXT'
+        finally:
+            session_factory.set_read_only(False)
+
+    def test_concurrent_commits(self, class_entity_repo):
+        session = class_entity_repo.session_factory()
+        session.add(MyEntity, MyEntity(id=0, text='TEXT'))
+        session.add(MyEntity, MyEntity(id=1, text='TEXT'))
+        session.commit()
+        other_session = MemorySession(class_entity_repo)
+        other_session.query(MyEntity).filter_by(id=1).one().text = \
+                                                            'OTHER TEXT'
+        session.query(MyEntity).filter_by(id=0).one().text = 'NEW TEXT'
+        session.commit()
+        # Changes to different entities are merged.
+        other_session.commit()
+        assert class_entity_repo.get_by_id(MyEntity, 0).text == 'NEW TEXT'
+        assert class_entity_repo.get_by_id(MyEntity, 1).text == 'OTHER TEXT'
+        # Changes to the same entity conflict.
+        other_session.query(MyEntity).filter_by(id=0).one().text = \
+                                                            'OTHER TEXT'
+        session.query(MyEntity).filter_by(id=0).one().text = 'NEWER TEXT'
+        session.commit()
+        with pytest.raises(ValueError):
+            other_session.commit()
+        other_session.rollback()
+        assert class_entity_repo.get_by_id(MyEntity, 0).text == 'NEWER TEXT'
+
     def test_remove_entity_not_in_session_raises_error(self,
                                                        class_entity_repo):
         session = class_entity_repo.session_factory()
@@ -119,8 +340,10 @@ class _TestMemorySession(object):
             session.add(MyEntity, ent)
         ent.id = 0
         child.id = 0
+        # The state of loaded entities is copied on first access.
+        ent_clone = session.load(MyEntity, ent)
         with pytest.raises(ValueError) as cm:
-            session.load(MyEntity, ent)
+            getattr(ent_clone, 'children')
         assert cm.value.args[0].startswith('Do not know')
 
     def test_nested_with_invalid_collection_data(self, class_entity_repo):
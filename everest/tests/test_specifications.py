@@ -6,10 +6,12 @@ Created on Feb 4, 2011.
 """
 from datetime import datetime
 from datetime import timedelta
+import functools
 
 from pyramid.compat import iteritems_
 import pytest
 
+from everest.querying.filtering import FilterSpecificationKeyVisitor
 from everest.querying.operators import UnaryOperator
 from everest.querying.specifications import ConjunctionFilterSpecification
 from everest.querying.specifications import DisjunctionFilterSpecification
@@ -28,10 +30,14 @@ from everest.querying.specifications import le
 from everest.querying.specifications import lt
 from everest.querying.specifications import rng
 from everest.querying.specifications import starts
+from everest.repositories.memory.querying import EvalOrderExpression
+from everest.repositories.memory.querying import FilterSpecificationCompiler
 
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['TestFilterSpecification',
+           'TestFilterSpecificationCompiler',
+           'TestFilterSpecificationKeyVisitor',
            ]
 
 
@@ -501,6 +507,73 @@ class TestFilterSpecification(object):
         assert not inv_conj_spec.eq(first_candidate, second_candidate)
         assert inv_conj_spec.cmp(first_candidate, second_candidate) == -1
 
+    @pytest.mark.parametrize('create_methods',
+                             [('create_ascending', 'create_ascending'),
+                              ('create_descending', 'create_descending'),
+                              ('create_ascending', 'create_descending'),
+                              ('create_descending', 'create_natural'),
+                              ])
+    def test_order_key(self, order_specification_factory,
+                       specification_candidate_factory, #pylint: disable=W0621
+                       create_methods):
+        number_meth, text_meth = \
+            [getattr(order_specification_factory, meth_name)
+             for meth_name in create_methods]
+        spec = order_specification_factory.create_conjunction(
+                                            number_meth('number_attr'),
+                                            text_meth('text_attr'))
+        assert len(spec.get_key(specification_candidate_factory(
+                                number_attr=0, text_attr='a'))) == 2
+        cands = [specification_candidate_factory(number_attr=num,
+                                                 text_attr=text)
+                 for (num, text) in [(1, 'a10'), (0, 'a9'), (1, 'a9'),
+                                     (0, 'b'), (1, 'a10'), (0, 'a10')]]
+        expected = sorted(cands, key=functools.cmp_to_key(spec.cmp))
+        assert EvalOrderExpression(spec)(cands) == expected
+
+    @pytest.mark.parametrize('create_method,slice_key',
+                             [('create_ascending', slice(0, 3)),
+                              ('create_ascending', slice(2, 5)),
+                              ('create_descending', slice(0, 3)),
+                              ('create_descending', slice(4, 30)),
+                              ('create_natural', slice(1, 2)),
+                              ('create_ascending', slice(0, None)),
+                              ])
+    def test_order_select(self, order_specification_factory,
+                          specification_candidate_factory, #pylint: disable=W0621
+                          create_method, slice_key):
+        spec = getattr(order_specification_factory,
+                       create_method)('number_attr')
+        cands = [specification_candidate_factory(number_attr=idx % 7,
+                                                 text_attr=str(idx))
+                 for idx in range(20)]
+        expr = EvalOrderExpression(spec)
+        assert expr.select(cands, slice_key) == expr(cands)[slice_key]
+
+
+class TestFilterSpecificationKeyVisitor(object):
+
+    def test_make_key(self, class_configurator):
+        class_configurator.begin()
+        try:
+            make_key = FilterSpecificationKeyVisitor.make_key
+            spec_a = eq(number_attr=NUMBER_VALUE)
+            spec_b = starts(text_attr=TEXT_VALUE[0])
+            spec_c = cntd(text_attr=TEXT_VALUE_LIST)
+            assert make_key(spec_a) == make_key(eq(number_attr=NUMBER_VALUE))
+            assert make_key(spec_a) != make_key(ge(number_attr=NUMBER_VALUE))
+            assert make_key((spec_a & spec_b) & spec_c) \
+                   == make_key(spec_c & (spec_b & spec_a))
+            assert make_key(spec_a | spec_b) == make_key(spec_b | spec_a)
+            assert make_key(spec_a | spec_b) != make_key(spec_a & spec_b)
+            assert make_key(~spec_a) != make_key(spec_a)
+            assert make_key(eq(number_attr=[1, 2])) \
+                   != make_key(eq(number_attr=(1, 2)))
+            assert make_key(eq(number_attr=set([1]))) is None
+            assert make_key(eq(**{'parent.text':TEXT_VALUE})) is None
+        finally:
+            class_configurator.end()
+
 
 class TestSpecificationGenerator(object):
 
@@ -576,3 +649,69 @@ class TestSpecificationGenerator(object):
         spec = ~eq(number_attr=NUMBER_VALUE - 1)
         assert isinstance(spec, NegationFilterSpecification)
         assert spec.is_satisfied_by(specification_candidate)
+
+
+class TestFilterSpecificationCompiler(object):
+
+    @pytest.mark.parametrize('attrs,generator',
+                             [(dict(number_attr=NUMBER_VALUE,
+                                    text_attr=TEXT_VALUE), eq),
+                              (dict(text_attr=TEXT_VALUE[0]), starts),
+                              (dict(text_attr=TEXT_VALUE[-1]), ends),
+                              (dict(number_attr=NUMBER_VALUE + 1), lt),
+                              (dict(number_attr=NUMBER_VALUE), lt),
+                              (dict(number_attr=NUMBER_VALUE), le),
+                              (dict(number_attr=NUMBER_VALUE - 1), gt),
+                              (dict(number_attr=NUMBER_VALUE), gt),
+                              (dict(number_attr=NUMBER_VALUE), ge),
+                              (dict(text_attr=TEXT_VALUE[1:2]), cnts),
+                              (dict(list_attr=LIST_VALUES[0]), cnts),
+                              (dict(text_attr=TEXT_VALUE_LIST), cntd),
+                              (dict(text_attr=TEXT_VALUE_LIST[:1]), cntd),
+                              (dict(list_attr=TEXT_VALUE_LIST), cntd),
+                              (dict(number_attr=(NUMBER_VALUE - 1,
+                                                 NUMBER_VALUE + 1)), rng),
+                              (dict(number_attr=(NUMBER_VALUE + 1,
+                                                 NUMBER_VALUE + 2)), rng),
+                              (dict(**{'nested_attr.number_attr':
+                                       NUMBER_VALUE}), eq),
+                              (dict(**{'none_attr.number_attr':
+                                       None}), eq),
+                               ])
+    def test_compile_criteria(self, class_configurator,
+                              specification_candidate_factory, attrs, #pylint: disable=W0621
+                              generator):
+        nested_cand = specification_candidate_factory(number_attr=NUMBER_VALUE)
+        cand = specification_candidate_factory(text_attr=TEXT_VALUE,
+                                               number_attr=NUMBER_VALUE,
+                                               list_attr=LIST_VALUES,
+                                               nested_attr=nested_cand,
+                                               none_attr=None)
+        class_configurator.begin()
+        try:
+            spec = generator(**attrs)
+            for cand_spec in (spec, ~spec):
+                pred = FilterSpecificationCompiler.compile(cand_spec)
+                assert bool(pred(cand)) \
+                       is bool(cand_spec.is_satisfied_by(cand))
+        finally:
+            class_configurator.end()
+
+    def test_compile_composites(self, class_configurator,
+                                specification_candidate): #pylint: disable=W0621
+        class_configurator.begin()
+        try:
+            true_spec = eq(number_attr=NUMBER_VALUE)
+            false_spec = eq(number_attr=NUMBER_VALUE + 1)
+            for spec, outcome in \
+                    [(true_spec & true_spec & true_spec, True),
+                     (true_spec & (true_spec & false_spec), False),
+                     (false_spec | false_spec | true_spec, True),
+                     (false_spec | (false_spec | false_spec), False),
+                     ((false_spec | true_spec) & ~false_spec, True),
+                     ((true_spec & false_spec) | ~true_spec, False),
+                     ]:
+                pred = FilterSpecificationCompiler.compile(spec)
+                assert pred(specification_candidate) is outcome
+        finally:
+            class_configurator.end()
@@ -8,9 +8,11 @@ from everest.testing import EntityTestCase
 from everest.tests.complete_app.entities import MyEntity
 from everest.tests.complete_app.entities import MyEntityParent
 from everest.tests.complete_app.entities import MyEntityChild
+from everest.repositories.state import ENTITY_STATUS
 from everest.repositories.state import EntityState
 from everest.resources.descriptors import terminal_attribute
 from mock import MagicMock
+from mock import patch
 
 __docformat__ = 'reStructuredText en'
 __all__ = ['EntityStateTestCase',
@@ -65,4 +67,56 @@ class EntityStateTestCase(EntityTestCase):
         state = EntityState.get_state(entity)
         self.assert_raises(AttributeError, setattr, state, 'data', state_data)
 
+    def test_dirty_tracking(self):
+        entity = MyEntity(text='FOO', number=1)
+        uow = MagicMock()
+        EntityState.manage(entity, uow)
+        state = EntityState.get_state(entity)
+        state.status = ENTITY_STATUS.CLEAN
+        self.assert_equal(state.changed_data, {})
+        entity.text = 'BAR'
+        self.assert_equal(state.status, ENTITY_STATUS.DIRTY)
+        changed_data = state.changed_data
+        self.assert_equal([attr.entity_attr for attr in changed_data],
+                          ['text'])
+        self.assert_equal(list(changed_data.values()), ['BAR'])
+        clean_text = [value for (attr, value) in state.clean_data.items()
+                      if attr.entity_attr == 'text']
+        self.assert_equal(clean_text, ['FOO'])
+        # Setting the clean value again makes the entity CLEAN.
+        entity.text = 'FOO'
+        self.assert_equal(state.status, ENTITY_STATUS.CLEAN)
+        entity.number = 2
+        state.status = ENTITY_STATUS.CLEAN
+        self.assert_equal(state.status, ENTITY_STATUS.CLEAN)
+        self.assert_equal(entity.number, 2)
+
+    def test_dirty_tracking_untracked(self):
+        entity = MyEntity(text='FOO', number=1)
+        uow = MagicMock()
+        with patch.object(MyEntity, '__everest_tracking__', False):
+            EntityState.manage(entity, uow)
+        state = EntityState.get_state(entity)
+        state.status = ENTITY_STATUS.CLEAN
+        entity.text = 'BAR'
+        self.assert_equal(state.status, ENTITY_STATUS.DIRTY)
+        clean_text = [value for (attr, value) in state.clean_data.items()
+                      if attr.entity_attr == 'text']
+        self.assert_equal(clean_text, ['FOO'])
+        entity.text = 'FOO'
+        self.assert_equal(state.status, ENTITY_STATUS.CLEAN)
+        self.assert_false(hasattr(state, '__dict__'))
 
+    def test_set_state_data_nested_none(self):
+        entity = MyEntity(text='FOO')
+        state_data = EntityState.get_state_data(entity)
+        parent_text_attr = [attr for attr in state_data
+                            if attr.entity_attr == 'parent.text_ent'][0]
+        self.assert_is_none(state_data[parent_text_attr])
+        # Setting a nested attribute to None is skipped if the parent is
+        # None.
+        EntityState.set_state_data(entity, {parent_text_attr:None})
+        self.assert_is_none(entity.parent)
+        entity.parent = MyEntityParent(text='BAR')
+        EntityState.set_state_data(entity, {parent_text_attr:'BAZ'})
+        self.assert_equal(entity.parent.text_ent, 'BAZ')
@@ -10,9 +10,14 @@ from everest.repositories.state import ENTITY_STATUS
 from everest.repositories.state import EntityState
 from everest.repositories.uow import UnitOfWork
 from everest.testing import Pep8CompliantTestCase
+from everest.testing import TestCaseWithConfiguration
+from everest.tests.complete_app.entities import MyEntity
+from everest.tests.complete_app.entities import MyEntityChild
+from everest.tests.complete_app.entities import MyEntityGrandchild
 
 __docformat__ = 'reStructuredText en'
-__all__ = ['UnitOfWorkTestCase',
+__all__ = ['UnitOfWorkBatchTestCase',
+           'UnitOfWorkTestCase',
            ]
 
 
@@ -95,6 +100,58 @@ class UnitOfWorkTestCase(Pep8CompliantTestCase):
         self._uow.register_deleted(_MyEntity, ent)
         self._uow.mark_new(ent)
 
+    def test_batch_iterator(self):
+        ent0 = _MyEntity(id=0)
+        ent1 = _MyEntity(id=1)
+        ent2 = _MyEntity(id=2)
+        ent3 = _MyEntity(id=3)
+        self._uow.register_new(_MyEntity, ent0)
+        self._uow.register_deleted(_MyEntity, ent1)
+        self._uow.register_new(_MyEntity, ent2)
+        self._uow.register_clean(_MyEntity, ent3)
+        batches = [(ent_cls, status, [state.entity for state in states])
+                   for (ent_cls, status, states)
+                   in self._uow.batch_iterator()]
+        self.assert_equal(batches,
+                          [(_MyEntity, ENTITY_STATUS.NEW, [ent0, ent2]),
+                           (_MyEntity, ENTITY_STATUS.DELETED, [ent1])])
+        self._uow.mark_persisted(ent0)
+        self._uow.mark_persisted(ent1)
+        self.assert_equal([state.entity
+                           for (_, _, states) in self._uow.batch_iterator()
+                           for state in states],
+                          [ent2])
+
+
+class UnitOfWorkBatchTestCase(TestCaseWithConfiguration):
+    package_name = 'everest.tests.complete_app'
+
+    def set_up(self):
+        TestCaseWithConfiguration.set_up(self)
+        self.config.load_zcml('configure_no_rdb.zcml')
+        self._uow = UnitOfWork()
+
+    def test_batch_iterator_dependency_order(self):
+        ent = MyEntity(id=0)
+        child = MyEntityChild(id=0)
+        grandchild = MyEntityGrandchild(id=0)
+        old_grandchild = MyEntityGrandchild(id=1)
+        old_ent = MyEntity(id=1)
+        self._uow.register_new(MyEntity, ent)
+        self._uow.register_new(MyEntityGrandchild, grandchild)
+        self._uow.register_deleted(MyEntityGrandchild, old_grandchild)
+        self._uow.register_new(MyEntityChild, child)
+        self._uow.register_deleted(MyEntity, old_ent)
+        batches = [(ent_cls, status)
+                   for (ent_cls, status, _) in self._uow.batch_iterator()]
+        self.assert_equal(batches,
+                          [(MyEntity, ENTITY_STATUS.NEW),
+                           (MyEntityChild, ENTITY_STATUS.NEW),
+                           (MyEntityGrandchild, ENTITY_STATUS.NEW),
+                           (MyEntityGrandchild, ENTITY_STATUS.DELETED),
+                           (MyEntity, ENTITY_STATUS.DELETED)])
+        self._uow.reset()
+
 
 class _MyEntity(Entity):
     __everest_attributes__ = {}
@@ -12,6 +12,7 @@ from everest.resources.utils import url_to_resource
 from everest.tests.complete_app.interfaces import IMyEntityParent
 from everest.tests.complete_app.resources import MyEntityMember
 from everest.resources.service import Service
+from everest.url import UrlPartsConverter
 
 
 __docformat__ = 'reStructuredText en'
@@ -139,6 +140,8 @@ class BaseTestUrl(object):
                                'must be zero or a positive number.'),
                               (base_url + '?start=0&size=-100',
                                ValueError, 'must be a positive number.'),
+                              (base_url + '?after=foo',
+                               ValueError, 'not a valid cursor.'),
                               ])
     def test_url_to_resource_invalid(self, url, error, msg):
         with pytest.raises(error) as cm:
@@ -185,6 +188,18 @@ class BaseTestUrl(object):
         mbs = list(coll_from_url)
         assert len(mbs) == 2
 
+    def test_url_to_resource_with_cursor(self):
+        after_string = UrlPartsConverter.make_cursor_string(['foo0', 0])
+        coll_from_url = url_to_resource(self.base_url +
+                                        '?sort=text:asc&after=%s'
+                                        % after_string)
+        assert coll_from_url.cursor == ['foo0', 0]
+        mbs = list(coll_from_url)
+        assert len(mbs) == 1
+        assert mbs[0].id == 1
+        url = resource_to_url(coll_from_url)
+        assert 'after=%s' % after_string in url
+
     def test_url_to_resource_with_order(self):
         coll_from_url = url_to_resource(self.base_url + '?sort=id:asc')
         assert len(coll_from_url) == 2
@@ -311,3 +326,19 @@ class TestUrlNoRdb(BaseTestUrl):
 @pytest.mark.usefixtures("rdb")
 class TestUrlRdb(BaseTestUrl):
     config_file_name = 'configure.zcml'
+
+    def test_url_to_resource_with_cursor(self):
+        # SQL comparisons with NULL are never true, so cursors over nullable
+        # columns are rejected.
+        after_string = UrlPartsConverter.make_cursor_string(['foo0', 0])
+        with pytest.raises(ValueError) as cm:
+            url_to_resource(self.base_url + '?sort=text:asc&after=%s'
+                            % after_string)
+        assert str(cm.value).find('not supported') != -1
+        after_string = UrlPartsConverter.make_cursor_string([0])
+        coll_from_url = url_to_resource(self.base_url +
+                                        '?sort=id:asc&after=%s'
+                                        % after_string)
+        mbs = list(coll_from_url)
+        assert len(mbs) == 1
+        assert mbs[0].id == 1
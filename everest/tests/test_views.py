@@ -17,6 +17,7 @@ from everest.constants import RequestMethods
 from everest.mime import CSV_MIME
 from everest.mime import CsvMime
 from everest.mime import XmlMime
+from everest.querying.specifications import AscendingOrderSpecification
 from everest.querying.specifications import eq
 from everest.renderers import RendererFactory
 from everest.resources.interfaces import IService
@@ -37,6 +38,7 @@ from everest.tests.simple_app.views import ExceptionPutMemberView
 from everest.tests.simple_app.views import UserMessagePostCollectionView
 from everest.tests.simple_app.views import UserMessagePutMemberView
 from everest.traversal import SuffixResourceTraverser
+from everest.url import UrlPartsConverter
 from everest.utils import get_repository_manager
 from everest.views.getcollection import GetCollectionView
 from everest.views.static import public_view
@@ -256,6 +258,42 @@ class _TestViewBase(object):
                                    status=200)
         assert not res is None
 
+    @pytest.mark.usefixtures('view_collection')
+    def test_get_collection_view_with_non_unique_order(self, class_ini,
+                                                       app_creator):
+        root = get_service()
+        # Need to start the service manually - no request root has been set
+        # yet.
+        root.start()
+        coll = root['my-entities']
+        path_url = class_ini.app_url + self.path
+        req = DummyRequest(application_url=class_ini.app_url,
+                           host_url=class_ini.app_url,
+                           path_url=path_url,
+                           url=path_url + '?sort=text:asc&size=1',
+                           params=dict(sort='text:asc', size=1),
+                           registry=app_creator.config.registry,
+                           accept=['*/*'])
+        req.get_response = lambda exc: None
+        # Rendering the member links requires the current request.
+        app_creator.config.begin(request=req)
+        try:
+            view = GetCollectionView(coll, req)
+            res = view()
+            next_urls = [link.href for link in view.context.links
+                         if link.rel == 'next']
+        finally:
+            app_creator.config.end()
+        assert res is not None
+        # Without a cursor, the requested order is kept (and not made
+        # unique with an ID criterion), so the next link uses an offset.
+        assert isinstance(view.context.order, AscendingOrderSpecification)
+        assert view.context.order.attr_name == 'text'
+        assert [mb.id for mb in view.context] == [0]
+        assert len(next_urls) == 1
+        assert not 'after=' in next_urls[0]
+        assert 'start=1' in next_urls[0]
+
     @pytest.mark.usefixtures('view_collection')
     def test_get_collection_with_refs_options(self,
                                     view_app_creator): # pylint:disable=W0621
@@ -645,6 +683,57 @@ class TestGetCollectionView(object):
         assert view.context.slice.start == 0
         assert view.context.slice.stop == FooCollection.max_limit
 
+    def test_get_collection_view_with_cursor(self, class_ini, app_creator):
+        coll = get_root_collection(IFoo)
+        for idx in range(3):
+            coll.create_member(FooEntity(id=idx))
+        after_string = UrlPartsConverter.make_cursor_string([0])
+        path_url = 'http://0.0.0.0:6543/foos/'
+        req = DummyRequest(application_url=class_ini.app_url,
+                           host_url=class_ini.app_url,
+                           path_url=path_url,
+                           url=path_url + '?size=1&after=%s' % after_string,
+                           params=dict(size=1, after=after_string),
+                           registry=app_creator.config.registry,
+                           accept=['*/*'])
+        req.get_response = lambda exc: None
+        view = GetCollectionView(coll, req)
+        res = view()
+        assert res is not None
+        assert [mb.id for mb in view.context] == [1]
+        rels = set([link.rel for link in view.context.links])
+        assert rels == set(['self', 'first', 'next'])
+
+    @pytest.mark.parametrize('count,exp_rels',
+                             [(None, ['self', 'next']),
+                              ('true', ['self', 'next', 'last'])])
+    def test_get_collection_view_without_count(self, class_ini, app_creator,
+                                               count, exp_rels):
+        coll = get_root_collection(IFoo)
+        for idx in range(3):
+            coll.create_member(FooEntity(id=idx))
+        coll.count_members = False
+        params = dict(size=1)
+        query_string = 'size=1'
+        if not count is None:
+            params['count'] = count
+            query_string += '&count=%s' % count
+        path_url = 'http://0.0.0.0:6543/foos/'
+        req = DummyRequest(application_url=class_ini.app_url,
+                           host_url=class_ini.app_url,
+                           path_url=path_url,
+                           url=path_url + '?' + query_string,
+                           params=params,
+                           registry=app_creator.config.registry,
+                           accept=['*/*'])
+        req.get_response = lambda exc: None
+        view = GetCollectionView(coll, req)
+        res = view()
+        assert res is not None
+        assert [mb.id for mb in view.context] == [0]
+        rels = set([link.rel for link in view.context.links])
+        assert rels == set(exp_rels)
+
 
 class TestStaticView(object):
     package_name = 'everest.tests.complete_app'
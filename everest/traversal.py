@@ -92,6 +92,9 @@ class DataTraversalProxy(object):
     encountered during tree traversal, this proxy makes it possible to use
     different data structures as source or target for the traversal.
     """
+    __slots__ = ('relationship_direction', 'relation_operation', '_data',
+                 '_accessor')
+
     #: Constant indicating that this proxy is for member resource data.
     proxy_for = RESOURCE_KINDS.MEMBER
 
@@ -344,23 +347,26 @@ class ConvertingDataTraversalProxyMixin(object):
     """
     Mixin class for data traversal proxies that convert incoming
     representation data to an entity.
+
+    Classes using this mixin need to provide a `_converted_entity`
+    attribute (or slot) which is initialized to `None`.
     """
-    __converted_entity = None
+    __slots__ = ()
 
     def get_entity(self):
         """
         Returns the entity converted from the proxied data.
         """
         if self._accessor is None:
-            if self.__converted_entity is None:
-                self.__converted_entity = self._convert_to_entity()
+            if self._converted_entity is None:
+                self._converted_entity = self._convert_to_entity()
         else:
             # If we have an accessor, we can get the proxied entity by ID.
             # FIXME: This is a hack that is only used for REMOVE operations
             #        with data elements.
-            self.__converted_entity = \
+            self._converted_entity = \
                 self.get_matching(self.get_id()).get_entity()
-        return self.__converted_entity
+        return self._converted_entity
 
     def _convert_to_entity(self):
         raise NotImplementedError('Abstract method.')
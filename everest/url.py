@@ -6,7 +6,13 @@ See LICENSE.txt for licensing, CONTRIBUTORS.txt for contributor information.
 
 Created on Jun 28, 2011.
 """
+from iso8601.iso8601 import ParseError
+from iso8601.iso8601 import parse_date
 from pyparsing import ParseException
+from pyramid.compat import bytes_
+from pyramid.compat import integer_types
+from pyramid.compat import native_
+from pyramid.compat import string_types
 from pyramid.compat import url_unquote
 from pyramid.compat import urlparse
 from pyramid.threadlocal import get_current_registry
@@ -27,6 +33,10 @@ from everest.resources.interfaces import IResource
 from everest.resources.utils import get_root_collection
 from zope.interface import implementer # pylint: disable=E0611,F0401
 from zope.interface import providedBy as provided_by # pylint: disable=E0611,F0401
+import base64
+import binascii
+import datetime
+import json
 
 
 __docformat__ = 'reStructuredText en'
@@ -78,6 +88,9 @@ class ResourceUrlConverter(object):
             if not (start_string is None or size_string is None):
                 rc.slice = \
                   UrlPartsConverter.make_slice_key(start_string, size_string)
+            after_string = params.get('after')
+            if not after_string is None:
+                rc.cursor = UrlPartsConverter.make_cursor(after_string)
         elif not IMemberResource in provided_by(rc):
             raise ValueError('Traversal found non-resource object "%s".' % rc)
         return rc
@@ -109,6 +122,9 @@ class ResourceUrlConverter(object):
             if not resource.slice is None:
                 query['start'], query['size'] = \
                     UrlPartsConverter.make_slice_strings(resource.slice)
+            if not resource.cursor is None:
+                query['after'] = \
+                    UrlPartsConverter.make_cursor_string(resource.cursor)
             if query != {}:
                 options = dict(query=query)
             else:
@@ -224,6 +240,39 @@ class UrlPartsConverter(object):
         size = slice_key.stop - start
         return (str(start), str(size))
 
+    @classmethod
+    def make_cursor(cls, after_string):
+        """
+        Converts the given opaque keyset pagination cursor string to the
+        sequence of order key values it encodes.
+
+        :return: list of order key values
+        """
+        try:
+            data = base64.urlsafe_b64decode(
+                        bytes_(after_string + '=' * (-len(after_string) % 4)))
+            cursor = [_decode_cursor_value(item)
+                      for item in json.loads(native_(data))]
+        except (binascii.Error, TypeError, ValueError, ParseError):
+            raise ValueError('Query parameter "after" is not a valid '
+                             'cursor.')
+        return cursor
+
+    @classmethod
+    def make_cursor_string(cls, cursor):
+        """
+        Converts the given sequence of order key values to an opaque keyset
+        pagination cursor string.
+
+        Supported values are numbers, strings, booleans, dates and date
+        times.
+
+        :raises ValueError: if the cursor contains unsupported values.
+        """
+        data = json.dumps([_encode_cursor_value(value) for value in cursor],
+                          separators=(',', ':'))
+        return native_(base64.urlsafe_b64encode(bytes_(data))).rstrip('=')
+
     @classmethod
     def make_refs_options(cls, refs_string):
         """
@@ -234,3 +283,42 @@ class UrlPartsConverter(object):
             return parse_refs(refs_string)
         except ParseException as err:
             raise ValueError('Refs string has errors. %s' % err)
+
+
+_NAIVE_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _encode_cursor_value(value):
+    # Tags each value with its type so that dates and date times can be
+    # restored. Naive date times are kept naive.
+    if isinstance(value, bool):
+        item = ['b', value]
+    elif isinstance(value, integer_types + (float,)):
+        item = ['n', value]
+    elif isinstance(value, string_types):
+        item = ['s', value]
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            item = ['t', value.strftime(_NAIVE_DATETIME_FORMAT)]
+        else:
+            item = ['T', value.isoformat()]
+    elif isinstance(value, datetime.date):
+        item = ['d', value.isoformat()]
+    else:
+        raise ValueError('Can not use value "%s" in a cursor.' % (value,))
+    return item
+
+
+def _decode_cursor_value(item):
+    tag, value = item
+    if tag in ('b', 'n', 's'):
+        result = value
+    elif tag == 't':
+        result = datetime.datetime.strptime(value, _NAIVE_DATETIME_FORMAT)
+    elif tag == 'T':
+        result = parse_date(value)
+    elif tag == 'd':
+        result = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    else:
+        raise ValueError('Unknown cursor value type "%s".' % tag)
+    return result
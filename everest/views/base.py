@@ -37,6 +37,7 @@ from everest.views.interfaces import IResourceView
 from zope.interface import implementer # pylint: disable=E0611,F0401
 from everest.representers.utils import RepresenterConfigurationContext
 from everest.representers.utils import LoadOptimizingContext
+from everest.repositories.utils import ReadOnlySessionContext
 from everest.mime import AtomMime
 from everest.mime import XmlMime
 
@@ -303,28 +304,29 @@ class GetResourceView(RepresentingResourceView): # still abstract pylint: disabl
     """
     Abstract base class for all resource views processing GET requests.
     """
-    def __init__(self, resource, request, **kw):
+    def __init__(self, resource, request, read_only_session=False, **kw):
+        """
+        :param bool read_only_session: Flag indicating if the request should
+          be processed with a read-only repository session (see
+          :meth:`_use_read_only_session`).
+        """
         if self.__class__ is GetResourceView:
             raise NotImplementedError('Abstract class')
         # Messaging is disabled by default for GET views.
         if kw.get('enable_messaging') is None:
             kw['enable_messaging'] = False
         RepresentingResourceView.__init__(self, resource, request, **kw)
+        #: Flag indicating if a read-only session should be used.
+        self._read_only_session = read_only_session
 
     def __call__(self):
         self._logger.debug('Request URL: %s.', self.request.url)
         try:
-            # If we use a representer to create the response, we can set up
-            # load optimizers using the representer configuration for the
-            # response MIME type.
-            if self._convert_response:
-                rpr_ctxt = self.__get_representer_context()
-                with rpr_ctxt:
-                    with LoadOptimizingContext(self.context,
-                                               rpr_ctxt.configuration):
-                        result = self.__call_view()
+            if self._use_read_only_session():
+                with ReadOnlySessionContext(self.context):
+                    result = self.__process()
             else:
-                result = self.__call_view()
+                result = self.__process()
         except HTTPError as http_exc:
             result = self.request.get_response(http_exc)
         except Exception as err: # catch Exception pylint: disable=W0703
@@ -335,6 +337,30 @@ class GetResourceView(RepresentingResourceView): # still abstract pylint: disabl
     def _prepare_resource(self):
         raise NotImplementedError('Abstract method.')
 
+    def _use_read_only_session(self):
+        """
+        Decides if the current request is processed with a read-only
+        repository session which loads entities without cloning them and
+        without tracking their state. Override this to decide on a per
+        request basis; the default implementation returns the value of the
+        `read_only_session` constructor argument.
+        """
+        return self._read_only_session
+
+    def __process(self):
+        # If we use a representer to create the response, we can set up
+        # load optimizers using the representer configuration for the
+        # response MIME type.
+        if self._convert_response:
+            rpr_ctxt = self.__get_representer_context()
+            with rpr_ctxt:
+                with LoadOptimizingContext(self.context,
+                                           rpr_ctxt.configuration):
+                    result = self.__call_view()
+        else:
+            result = self.__call_view()
+        return result
+
     def __call_view(self):
         if self._enable_messaging:
             prep_executor = \
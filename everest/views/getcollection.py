@@ -9,8 +9,10 @@ Created on Oct 7, 2011.
 from copy import deepcopy
 
 from everest.batch import Batch
+from everest.querying.keyset import make_keyset_order_specification
 from everest.resources.base import Link
 from everest.url import UrlPartsConverter
+from everest.utils import get_nested_attribute
 from everest.utils import get_traceback
 from everest.views.base import GetResourceView
 
@@ -19,10 +21,31 @@ __all__ = ['GetCollectionView',
            ]
 
 
+#: Marker for keeping the cursor of the context in navigation links.
+_KEEP_CURSOR = object()
+
+
 class GetCollectionView(GetResourceView):
     """
     View for GET requests on collection resources.
 
+    Besides offset paging with the "start" and "size" query parameters,
+    the view supports keyset pagination: The "after" query parameter holds
+    an opaque cursor encoding the order key values of the last member of
+    the previous page; the page then starts with the member following it
+    (the "start" parameter is relative to that member). The "next" link
+    carries the cursor for the following page if a cursor was used or the
+    order is unique (e.g., the default order by ID). Cursors are not
+    supported for orders over attributes the backend can not seek over
+    (cf. :meth:`everest.entities.base.Aggregate.can_seek`).
+
+    To build the navigation links, the members of the collection are
+    counted unless the collection disables this (cf.
+    :attr:`everest.resources.base.Collection.count_members`); the "count"
+    query parameter ("true" or "false") overrides the collection setting.
+    Without counting, one more member than the page holds is fetched to
+    find out if there is a next page and no "last" link is built.
+
     If the request is sucessful, the server responds with status HTTP OK.
     """
     def _prepare_resource(self):
@@ -30,6 +53,8 @@ class GetCollectionView(GetResourceView):
             self.__filter_collection()
             self.__order_collection()
             self.__slice_collection()
+            self.__seek_collection()
+            count_members = self.__get_count_option()
         except ValueError as err:
             result = self._handle_unknown_exception(err.args[0],
                                                     get_traceback())
@@ -40,46 +65,128 @@ class GetCollectionView(GetResourceView):
                 # to guarantee an order on the result set. This should not
                 # be reflected in the links' URLs.
                 self.context.order = deepcopy(self.context.default_order)
+            # Cursors only identify the position in the result set if the
+            # order is unique. If a cursor is used, we make the order unique
+            # (like the default order, this should not be reflected in the
+            # links' URLs); otherwise, we keep the requested order (which
+            # backends may read from a sorted index) and only build a cursor
+            # for the next link if this order is unique already.
+            link_order = self.context.order
+            has_cursor = not self.context.cursor is None
+            try:
+                keyset_order = make_keyset_order_specification(link_order)
+                self.context.get_cursor_keys()
+            except ValueError:
+                # Keyset pagination is not possible with this order.
+                is_keyset_order = False
+            else:
+                if has_cursor and not keyset_order is link_order:
+                    self.context.order = keyset_order
+                is_keyset_order = self.context.order is keyset_order
             # Pre-load the collection. This allows us to perform
             # optimizations in the backend.
-            self.context.load()
-            # Build batch links.
-            batch = self.__create_batch()
-            self_link = Link(self.context, 'self', self.context.title)
+            self.context.load(look_ahead=not count_members)
+            # Build batch links. With a cursor, the batch positions are
+            # relative to the cursor member, so we can only link to the
+            # first and the next batch. Without a count, we can not link
+            # to the last batch.
+            batch = self.__create_batch(count_members)
+            if count_members:
+                next_batch = batch.next
+                has_last = batch.index != batch.number - 1
+            else:
+                if self.context.has_more:
+                    next_batch = Batch(batch.start + batch.size, batch.size,
+                                       None)
+                else:
+                    next_batch = None
+                has_last = False
+            if self.context.order is link_order:
+                self_rc = self.context
+            else:
+                self_rc = self.context.clone()
+                self_rc.order = link_order
+            self_link = Link(self_rc, 'self', self.context.title)
             self.context.add_link(self_link)
-            if batch.index > 0:
+            if batch.index > 0 or has_cursor:
                 first_link = self.__create_nav_link(batch.first, 'first',
-                                                    not needs_default_order)
+                                                    not needs_default_order,
+                                                    link_order, cursor=None)
                 self.context.add_link(first_link)
-            if not batch.previous is None:
+            if not batch.previous is None and not has_cursor:
                 prev_link = self.__create_nav_link(batch.previous, 'previous',
-                                                   not needs_default_order)
+                                                   not needs_default_order,
+                                                   link_order)
                 self.context.add_link(prev_link)
-            if not batch.next is None:
-                next_link = self.__create_nav_link(batch.next, 'next',
-                                                   not needs_default_order)
+            if not next_batch is None:
+                if is_keyset_order:
+                    next_cursor = self.__get_next_cursor()
+                else:
+                    next_cursor = None
+                # Cursors are only valid with the order they were created
+                # for, so links carrying a cursor always keep the order.
+                if not next_cursor is None:
+                    next_link = self.__create_nav_link(
+                                        Batch(0, batch.size, batch.size),
+                                        'next', False, link_order,
+                                        cursor=next_cursor)
+                else:
+                    next_link = self.__create_nav_link(
+                                        next_batch, 'next',
+                                        not (needs_default_order
+                                             or has_cursor),
+                                        link_order)
                 self.context.add_link(next_link)
-            if not batch.index == batch.number - 1:
+            if has_last and not has_cursor:
                 last_link = self.__create_nav_link(batch.last, 'last',
-                                                   not needs_default_order)
+                                                   not needs_default_order,
+                                                   link_order)
                 self.context.add_link(last_link)
             result = self.context
         return result
 
-    def __create_batch(self):
+    def __create_batch(self, count_members):
         start = self.context.slice.start
         size = self.context.slice.stop - start
-        total_size = len(self.context)
+        if count_members:
+            total_size = len(self.context)
+        else:
+            total_size = None
         return Batch(start, size, total_size)
 
-    def __create_nav_link(self, batch, rel, reset_order):
+    def __create_nav_link(self, batch, rel, reset_order, link_order,
+                          cursor=_KEEP_CURSOR):
         coll_clone = self.context.clone()
         if reset_order:
             coll_clone.order = None
+        else:
+            coll_clone.order = link_order
+        if not cursor is _KEEP_CURSOR:
+            coll_clone.cursor = cursor
         coll_clone.slice = slice(batch.start,
                                  batch.start + batch.size)
         return Link(coll_clone, rel, self.context.title)
 
+    def __get_next_cursor(self):
+        # Returns the order key values of the last member in the current
+        # batch or None if they can not be used in a cursor.
+        last_mb = None
+        for last_mb in self.context:
+            pass
+        if last_mb is None:
+            return None
+        cursor = [get_nested_attribute(last_mb, attr_name)
+                  for (attr_name, _) in self.context.get_cursor_keys()]
+        try:
+            # Check that the values can be encoded.
+            UrlPartsConverter.make_cursor_string(cursor)
+        except ValueError:
+            cursor = None
+        else:
+            if None in cursor:
+                cursor = None
+        return cursor
+
     def __filter_collection(self):
         query_string = self.request.params.get('q')
         if not query_string is None:
@@ -108,3 +215,21 @@ class GetCollectionView(GetResourceView):
             slice_key = slice(slice_key.start,
                               slice_key.start + self.context.max_limit)
         self.context.slice = slice_key
+
+    def __get_count_option(self):
+        count_string = self.request.params.get('count')
+        if count_string is None:
+            count_members = self.context.count_members
+        elif count_string.lower() == 'true':
+            count_members = True
+        elif count_string.lower() == 'false':
+            count_members = False
+        else:
+            raise ValueError('Query parameter "count" must be "true" or '
+                             '"false".')
+        return count_members
+
+    def __seek_collection(self):
+        after_string = self.request.params.get('after')
+        if not after_string is None:
+            self.context.cursor = UrlPartsConverter.make_cursor(after_string)